@@ -11,8 +11,10 @@ __version__ = '0.5.0'
 from .common.connection import HTTPConnection
 from .http20.connection import HTTP20Connection
 from .http20.response import HTTP20Response, HTTP20Push
+from .http20.pool import HTTP20ConnectionPool
 from .http11.connection import HTTP11Connection
 from .http11.response import HTTP11Response
+from .http11.pool import HTTP11ConnectionPool
 
 # Throw import errors on Python <2.7 and 3.0-3.2.
 import sys as _sys
@@ -24,7 +26,9 @@ __all__ = [
     HTTP20Response,
     HTTP20Push,
     HTTP20Connection,
+    HTTP20ConnectionPool,
     HTTP11Connection,
+    HTTP11ConnectionPool,
     HTTP11Response,
 ]
 
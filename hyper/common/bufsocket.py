@@ -67,10 +67,27 @@ class BufferedSocket(object):
         """
         Whether or not there is more data to read from the socket.
         """
+        return self.wait_for_data(0)
+
+    def wait_for_data(self, timeout=None):
+        """
+        Waits until there is data to read from the socket.
+
+        :param timeout: (optional) The most time to wait for, in seconds. If
+            not provided, waits forever.
+        :returns: ``True`` if there is data to read, ``False`` if the timeout
+            expired first.
+        """
         if self._bytes_in_buffer:
             return True
 
-        read = select.select([self._sck], [], [], 0)[0]
+        # TLS sockets may already have decrypted data waiting, which select
+        # can't see.
+        pending = getattr(self._sck, 'pending', None)
+        if pending is not None and pending():
+            return True
+
+        read = select.select([self._sck], [], [], timeout)[0]
         if read:
             return True
 
@@ -159,6 +176,39 @@ class BufferedSocket(object):
 
         return data
 
+    def recv_into(self, buffer):
+        """
+        Read some data from the socket into a writable buffer. Any data
+        already in our buffer is handed over first. Beyond that, reads at least
+        as large as our buffer go straight from the socket into the one
+        provided, rather than being copied through ours.
+
+        :param buffer: A writable buffer, such as a ``bytearray``.
+        :returns: The number of bytes read, which is zero only if the socket
+            has been closed.
+        """
+        view = memoryview(buffer)
+
+        if self._bytes_in_buffer:
+            amt = min(len(view), self._bytes_in_buffer)
+            view[:amt] = self._buffer_view[self._index:self._index+amt]
+
+            self._index += amt
+            self._bytes_in_buffer -= amt
+
+            return amt
+
+        if len(view) >= self._buffer_size:
+            return self._sck.recv_into(view)
+
+        try:
+            data = self.recv(len(view))
+        except ConnectionResetError:
+            return 0
+
+        view[:len(data)] = data
+        return len(data)
+
     def fill(self):
         """
         Attempts to fill the buffer as much as possible. It will block for at
@@ -5,6 +5,8 @@ hyper/common/connection
 
 Hyper's HTTP/1.1 and HTTP/2 abstraction layer.
 """
+import threading
+
 from .exceptions import TLSUpgrade, HTTPUpgrade
 from ..http11.connection import HTTP11Connection
 from ..http20.connection import HTTP20Connection
@@ -44,6 +46,26 @@ class HTTPConnection(object):
         or a host name and may include a port.
     :param proxy_port: (optional) The proxy port to connect to. If not provided 
         and one also isn't provided in the ``proxy`` parameter, defaults to 8080.
+    :param initial_window_size: (optional) The HTTP/2 flow control window, in
+        bytes, to give the server for the connection and for each stream.
+        Defaults to 65,535 bytes.
+    :param max_frame_size: (optional) The largest HTTP/2 frame, in bytes, the
+        server may send. Defaults to 16,384 bytes.
+    :param header_table_size: (optional) The size, in bytes, of the HPACK
+        table the server may use to compress headers. Defaults to 4,096 bytes.
+    :param max_concurrent_streams: (optional) The maximum number of streams
+        the server may open to us at once. If not provided, there is no limit.
+    :param timeout: (optional) How long to wait for the server, in seconds:
+        either a single number, or a ``(connect, read)`` tuple. Defaults to 5
+        seconds for both.
+
+    Once the connection has been upgraded to HTTP/2 it may be shared by many
+    threads, as long as each passes the stream ID returned by
+    :meth:`request() <hyper.HTTPConnection.request>` to
+    :meth:`get_response() <hyper.HTTPConnection.get_response>`. Until then,
+    and for as long as it speaks HTTP/1.1, a thread that makes a request has
+    the connection to itself until it has read or closed its responses.
+    Requests from other threads wait.
     """
     def __init__(self,
                  host,
@@ -54,6 +76,10 @@ class HTTPConnection(object):
                  ssl_context=None,
                  proxy_host=None,
                  proxy_port=None,
+                 initial_window_size=None,
+                 max_frame_size=None,
+                 header_table_size=None,
+                 max_concurrent_streams=None,
                  **kwargs):
 
         self._host = host
@@ -65,7 +91,11 @@ class HTTPConnection(object):
         self._h2_kwargs = {
             'window_manager': window_manager, 'enable_push': enable_push,
             'secure': secure, 'ssl_context': ssl_context, 
-            'proxy_host': proxy_host, 'proxy_port': proxy_port
+            'proxy_host': proxy_host, 'proxy_port': proxy_port,
+            'initial_window_size': initial_window_size,
+            'max_frame_size': max_frame_size,
+            'header_table_size': header_table_size,
+            'max_concurrent_streams': max_concurrent_streams,
         }
 
         # Add any unexpected kwargs to both dictionaries.
@@ -76,7 +106,19 @@ class HTTPConnection(object):
             self._host, self._port, **self._h1_kwargs
         )
 
-    def request(self, method, url, body=None, headers={}):
+        # The first request may upgrade the connection to HTTP/2, replacing
+        # the backing object, and a HTTP/1.1 connection can only carry one
+        # thread's requests at a time. So unless the connection speaks HTTP/2,
+        # the thread making a request owns it until all of its responses have
+        # been released. Requests from other threads wait on the condition.
+        self._condition = threading.Condition()
+        self._owner = None
+        self._owned = 0
+
+        # Whether we know which protocol the server speaks.
+        self._negotiated = False
+
+    def request(self, method, url, body=None, headers={}, timeout=None):
         """
         This will send a request to the server using the HTTP request method
         ``method`` and the selector ``url``. If the ``body`` argument is
@@ -90,12 +132,44 @@ class HTTPConnection(object):
         :param body: (optional) The request body to send. Must be a bytestring
             or a file-like object.
         :param headers: (optional) The headers to send on the request.
+        :param timeout: (optional) How long to wait for the server while
+            making this request and reading its response, overriding the
+            ``timeout`` given to the constructor.
         :returns: A stream ID for the request, or ``None`` if the request is
             made over HTTP/1.1.
         """
+        if not self._acquire():
+            return self._conn.request(
+                method=method, url=url, body=body, headers=headers,
+                timeout=timeout
+            )
+
+        # A plain HTTP/1.1 request asks to upgrade the connection, but we only
+        # find out whether it did when the response arrives.
+        upgrading = getattr(self._conn, '_send_http_upgrade', False)
+
+        try:
+            stream_id = self._request(method, url, body, headers, timeout)
+        except Exception:
+            self._release()
+            raise
+
+        if isinstance(self._conn, HTTP20Connection):
+            self._release_all()
+        elif not upgrading:
+            self._negotiated = True
+
+        return stream_id
+
+    def _request(self, method, url, body, headers, timeout):
+        """
+        Makes a request, switching to HTTP/2 if it was negotiated in the TLS
+        handshake.
+        """
         try:
             return self._conn.request(
-                method=method, url=url, body=body, headers=headers
+                method=method, url=url, body=body, headers=headers,
+                timeout=timeout
             )
         except TLSUpgrade as e:
             # We upgraded in the NPN/ALPN handshake. We can just go straight to
@@ -113,15 +187,48 @@ class HTTPConnection(object):
             self._conn._send_preamble()
 
             return self._conn.request(
-                method=method, url=url, body=body, headers=headers
+                method=method, url=url, body=body, headers=headers,
+                timeout=timeout
             )
 
     def get_response(self, *args, **kwargs):
         """
         Returns a response object.
         """
+        with self._condition:
+            owned = self._owner is threading.current_thread()
+
+        if not owned:
+            return self._get_response(*args, **kwargs)
+
+        try:
+            response = self._get_response(*args, **kwargs)
+        except Exception:
+            self._release()
+            raise
+
+        self._negotiated = True
+
+        if isinstance(self._conn, HTTP20Connection):
+            self._release_all()
+        else:
+            # Other threads can have the connection once the body has been
+            # read or the response closed.
+            response._release_cb = self._release
+
+        return response
+
+    def _get_response(self, *args, **kwargs):
+        """
+        Gets a response, switching to HTTP/2 if the server agreed to upgrade
+        the connection.
+        """
         try:
-            return self._conn.get_response(*args, **kwargs)
+            if isinstance(self._conn, HTTP20Connection):
+                return self._conn.get_response(*args, **kwargs)
+
+            # HTTP/1.1 responses arrive in order, so there's no stream ID.
+            return self._conn.get_response()
         except HTTPUpgrade as e:
             # We upgraded via the HTTP Upgrade mechanism. We can just
             # go straight to the world of HTTP/2. Replace the backing object
@@ -142,6 +249,52 @@ class HTTPConnection(object):
 
             return self._conn.get_response(1)
 
+    def _acquire(self):
+        """
+        Waits until no other thread owns the connection. Then, unless the
+        connection speaks HTTP/2, takes ownership of it for one more request.
+
+        :returns: Whether the connection is owned for this request.
+        """
+        current = threading.current_thread()
+
+        with self._condition:
+            while self._owner not in (None, current):
+                self._condition.wait()
+
+            if isinstance(self._conn, HTTP20Connection):
+                return False
+
+            self._owner = current
+            self._owned += 1
+            return True
+
+    def _release(self):
+        """
+        Gives up ownership of the connection for one request, either because
+        the request failed or because its response has been released. Other
+        threads can have the connection once the owner has no requests left.
+        """
+        with self._condition:
+            if not self._owned:
+                return
+
+            self._owned -= 1
+            if not self._owned:
+                self._owner = None
+                self._condition.notify_all()
+
+    def _release_all(self):
+        """
+        Gives up ownership of the connection altogether, because it has been
+        upgraded to HTTP/2 and may be shared.
+        """
+        with self._condition:
+            self._negotiated = True
+            self._owner = None
+            self._owned = 0
+            self._condition.notify_all()
+
     # The following two methods are the implementation of the context manager
     # protocol.
     def __enter__(self):  # pragma: no cover
@@ -4,9 +4,28 @@ hyper/common/decoder
 ~~~~~~~~~~~~~~~~~~~~
 
 Contains hyper's code for handling compressed bodies.
+
+Decoders are looked up by content coding in a registry, so that support for
+further codings can be plugged in with :func:`register_decoder`. All decoders
+follow the interface of the objects returned by ``zlib.decompressobj()``:
+``decompress(data, max_length=0)`` returns at most ``max_length`` bytes of
+output (if non-zero), leaving any input it did not get to in
+``unconsumed_tail``, and ``flush()`` returns whatever output remains once all
+the input has been passed in.
 """
+import collections
 import zlib
 
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
 
 class DeflateDecoder(object):
     """
@@ -32,17 +51,218 @@ class DeflateDecoder(object):
     def __getattr__(self, name):
         return getattr(self._obj, name)
 
-    def decompress(self, data):
+    def decompress(self, data, max_length=0):
         if not self._first_try:
-            return self._obj.decompress(data)
+            return self._obj.decompress(data, max_length)
 
         self._data += data
         try:
-            return self._obj.decompress(data)
+            decompressed = self._obj.decompress(data, max_length)
         except zlib.error:
             self._first_try = False
             self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
             try:
-                return self.decompress(self._data)
+                return self.decompress(self._data, max_length)
             finally:
                 self._data = None
+
+        # Once some data has come out we know which form we're dealing with,
+        # and can stop keeping hold of the input.
+        if decompressed:
+            self._first_try = False
+            self._data = None
+
+        return decompressed
+
+
+class BufferedDecoder(object):
+    """
+    A base class for decoders wrapping libraries that can't limit how much
+    output they produce. Input is decoded ``input_size`` bytes at a time,
+    stopping as soon as there is enough output to return ``max_length``
+    bytes: the rest of the input is left in ``unconsumed_tail``, and any
+    output beyond ``max_length`` is held back for the next call. As a single
+    piece of input may still expand a great deal, the output held in memory
+    is bounded by ``max_length`` plus the output of one piece, not by
+    ``max_length`` alone.
+
+    Subclasses implement ``_decompress()`` and, optionally, ``_flush()``.
+    """
+    #: The number of bytes of input decoded at a time.
+    input_size = 256
+
+    def __init__(self):
+        self.unconsumed_tail = b''
+
+        # Output held back for later calls, and how far into the first chunk
+        # of it has already been returned.
+        self._pending = collections.deque()
+        self._pending_size = 0
+        self._offset = 0
+
+    def decompress(self, data, max_length=0):
+        if not max_length:
+            self.unconsumed_tail = b''
+            return self._take() + self._decompress(data)
+
+        position = 0
+        while self._pending_size < max_length and position < len(data):
+            piece = data[position:position + self.input_size]
+            position += len(piece)
+            self._hold(self._decompress(piece))
+
+        self.unconsumed_tail = data[position:]
+        return self._take(max_length)
+
+    def flush(self):
+        return self._take() + self._flush()
+
+    def _hold(self, data):
+        """
+        Holds back output for a later call.
+        """
+        if data:
+            self._pending.append(data)
+            self._pending_size += len(data)
+
+    def _take(self, amt=None):
+        """
+        Takes up to ``amt`` bytes of the output held back, or all of it.
+        """
+        chunks = []
+
+        while self._pending and (amt is None or amt > 0):
+            chunk = self._pending[0]
+            end = len(chunk)
+
+            if amt is not None:
+                end = min(end, self._offset + amt)
+                amt -= end - self._offset
+
+            chunks.append(chunk[self._offset:end])
+
+            if end == len(chunk):
+                self._pending.popleft()
+                self._offset = 0
+            else:
+                self._offset = end
+
+        data = b''.join(chunks)
+        self._pending_size -= len(data)
+        return data
+
+    def _decompress(self, data):  # pragma: no cover
+        raise NotImplementedError()
+
+    def _flush(self):
+        return b''
+
+
+class BrotliDecoder(BufferedDecoder):
+    """
+    Decodes brotli compressed bodies. Requires the ``brotli`` library.
+    Versions of the library that can limit their output with
+    ``output_buffer_limit`` return exactly as much as was asked for: with
+    others, output is bounded as for any :class:`BufferedDecoder`.
+    """
+    def __init__(self):
+        super(BrotliDecoder, self).__init__()
+        self._obj = brotli.Decompressor()
+        self._limited = hasattr(self._obj, 'can_accept_more_data')
+
+    def decompress(self, data, max_length=0):
+        if not self._limited:
+            return super(BrotliDecoder, self).decompress(data, max_length)
+
+        if not max_length:
+            self.unconsumed_tail = b''
+            return self._flush() + self._obj.process(data)
+
+        # Output may still be waiting from earlier input, in which case the
+        # decompressor won't take any more until it has all been returned.
+        if not self._obj.can_accept_more_data():
+            self.unconsumed_tail = data
+            return self._obj.process(b'', output_buffer_limit=max_length)
+
+        self.unconsumed_tail = b''
+        return self._obj.process(data, output_buffer_limit=max_length)
+
+    def _flush(self):
+        chunks = []
+
+        while self._limited and not self._obj.can_accept_more_data():
+            chunks.append(self._obj.process(b''))
+
+        return b''.join(chunks)
+
+    def _decompress(self, data):
+        # Different brotli bindings disagree on the method name.
+        if hasattr(self._obj, 'process'):
+            return self._obj.process(data)
+
+        return self._obj.decompress(data)
+
+
+class ZstdDecoder(BufferedDecoder):
+    """
+    Decodes Zstandard compressed bodies. Requires the ``zstandard`` library.
+    """
+    def __init__(self):
+        super(ZstdDecoder, self).__init__()
+        self._obj = zstandard.ZstdDecompressor().decompressobj()
+
+    def _decompress(self, data):
+        return self._obj.decompress(data)
+
+
+def _gzip_decoder():
+    # This 16 + MAX_WBITS nonsense is to force gzip. See this
+    # Stack Overflow answer for more:
+    # http://stackoverflow.com/a/2695466/1401686
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+# A mapping between content codings and callables returning a new decoder
+# for that coding.
+_decoders = {
+    b'gzip': _gzip_decoder,
+    b'deflate': DeflateDecoder,
+}
+
+if brotli is not None:  # pragma: no cover
+    _decoders[b'br'] = BrotliDecoder
+
+if zstandard is not None:  # pragma: no cover
+    _decoders[b'zstd'] = ZstdDecoder
+
+
+def register_decoder(coding, factory):
+    """
+    Adds support for decoding bodies with the given content coding.
+
+    :param coding: The name of the content coding, as it appears in the
+        ``content-encoding`` header, e.g. ``b'br'``.
+    :param factory: A callable taking no arguments that returns a new decoder.
+        Decoders must have the interface described in this module.
+    :returns: Nothing.
+    """
+    if not isinstance(coding, bytes):
+        coding = coding.encode('latin-1')
+
+    _decoders[coding.lower()] = factory
+
+
+def get_decoder(codings):
+    """
+    Returns a new decoder for the first of the given content codings that has
+    a decoder registered.
+
+    :param codings: The values of the ``content-encoding`` header.
+    :returns: A decoder, or ``None`` if none of the codings are supported.
+    """
+    for coding in codings:
+        factory = _decoders.get(coding.strip().lower())
+        if factory is not None:
+            return factory()
+
+    return None
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+hyper/common/encoder
+~~~~~~~~~~~~~~~~~~~~
+
+Contains hyper's code for compressing request bodies.
+"""
+import collections
+import os
+import zlib
+
+from ..compat import bytes, join_bytes, unicode, zlib_compressobj
+
+#: The size of the blocks read from file-like request bodies for compression.
+BLOCK_SIZE = 16 * 1024
+
+
+def get_encoder(coding):
+    """
+    Returns a new compression object for the given content coding.
+
+    :param coding: The content coding, either ``'gzip'`` or ``'deflate'``.
+    :returns: An object with the interface of those returned by
+        ``zlib.compressobj()``.
+    """
+    if isinstance(coding, bytes):
+        coding = coding.decode('latin-1')
+
+    coding = coding.lower()
+
+    if coding == 'gzip':
+        # This 16 + MAX_WBITS nonsense produces the gzip format.
+        return zlib_compressobj(wbits=16 + zlib.MAX_WBITS)
+    elif coding == 'deflate':
+        # The 'deflate' coding is the zlib format, despite its name.
+        return zlib_compressobj(wbits=zlib.MAX_WBITS)
+
+    raise ValueError("Unsupported content coding %r" % coding)
+
+
+def compress_body(body, coding, threshold=0):
+    """
+    Compresses a request body. Bytestrings are compressed all at once. Other
+    bodies are compressed as they are sent: the object returned can be both
+    read from and iterated over.
+
+    :param body: The request body. May be a bytestring, a file-like object or
+        an iterable of bytestrings.
+    :param coding: The content coding to compress with.
+    :param threshold: (optional) Bodies known to be smaller than this many
+        bytes aren't worth compressing, and are left alone.
+    :returns: The compressed body, or ``None`` if the body was left alone.
+    """
+    if isinstance(body, unicode):
+        body = body.encode('utf-8')
+
+    if isinstance(body, bytes):
+        if len(body) < threshold:
+            return None
+
+        encoder = get_encoder(coding)
+        return encoder.compress(body) + encoder.flush()
+
+    if hasattr(body, 'fileno'):
+        try:
+            if os.fstat(body.fileno()).st_size < threshold:
+                return None
+        except (OSError, IOError, ValueError):
+            pass
+
+    return CompressedBody(body, coding)
+
+
+class CompressedBody(object):
+    """
+    Wraps a file-like or iterable request body, compressing it as it is read.
+
+    :param body: The body to compress.
+    :param coding: The content coding to compress with.
+    """
+    def __init__(self, body, coding):
+        if hasattr(body, 'read'):
+            self._blocks = iter(lambda: body.read(BLOCK_SIZE), b'')
+        else:
+            self._blocks = iter(body)
+
+        self._encoder = get_encoder(coding)
+
+        # Compressed data waiting to be read. It's kept as a queue of chunks,
+        # rather than one growing bytestring, so that many small reads don't
+        # copy the rest of the data each time.
+        self._pending = collections.deque()
+        self._pending_size = 0
+
+    def read(self, amt=-1):
+        """
+        Reads up to ``amt`` bytes of compressed data, or all of it if ``amt``
+        is negative.
+        """
+        while self._encoder is not None:
+            if 0 <= amt <= self._pending_size:
+                break
+
+            data = self._next_block()
+            if data:
+                self._pending.append(data)
+                self._pending_size += len(data)
+
+        if amt < 0:
+            amt = self._pending_size
+
+        return self._take_pending(amt)
+
+    def __iter__(self):
+        while self._encoder is not None:
+            pending = self._take_pending(self._pending_size)
+            data = pending + self._next_block()
+
+            if data:
+                yield data
+
+        if self._pending:
+            yield self._take_pending(self._pending_size)
+
+    def _take_pending(self, amt):
+        """
+        Removes and returns up to ``amt`` bytes of the compressed data waiting
+        to be read.
+        """
+        pieces = []
+        remaining = amt
+        while remaining and self._pending:
+            chunk = self._pending.popleft()
+
+            if len(chunk) > remaining:
+                chunk = memoryview(chunk)
+                self._pending.appendleft(chunk[remaining:])
+                chunk = chunk[:remaining]
+
+            pieces.append(chunk)
+            remaining -= len(chunk)
+
+        data = join_bytes(pieces)
+        self._pending_size -= len(data)
+        return data
+
+    def _next_block(self):
+        """
+        Compresses the next block of the body, flushing the compressor once
+        the body is exhausted.
+        """
+        for block in self._blocks:
+            if isinstance(block, unicode):
+                block = block.encode('utf-8')
+
+            return self._encoder.compress(block)
+
+        data = self._encoder.flush()
+        self._encoder = None
+        return data
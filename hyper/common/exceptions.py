@@ -34,6 +34,14 @@ class LineTooLongError(Exception):
     pass
 
 
+class PoolExhaustedError(Exception):
+    """
+    A connection could not be taken from a connection pool without exceeding
+    its maximum size.
+    """
+    pass
+
+
 # Create our own ConnectionResetError.
 try:  # pragma: no cover
     ConnectionResetError = ConnectionResetError
@@ -6,9 +6,18 @@ hyper/common/headers
 Contains hyper's structures for storing and working with HTTP headers.
 """
 import collections
+import re
 
 from hyper.common.util import to_bytestring, to_bytestring_tuple
 
+#: Headers whose values may contain commas that aren't separators, and so
+#: aren't split into canonical form (I'm looking at you Set-Cookie).
+SPECIAL_SNOWFLAKES = frozenset([b'set-cookie', b'set-cookie2'])
+
+# Matches either a comma or a quoted string, which may contain commas that
+# aren't separators.
+_COMMA_OR_QUOTED_STRING = re.compile(br'"(?:[^"\\]|\\.)*"|,')
+
 
 class HTTPHeaderMap(collections.MutableMapping):
     """
@@ -42,10 +51,10 @@ class HTTPHeaderMap(collections.MutableMapping):
     unusual encodings) while ensuring that users are never confused about what
     type of data they will receive.
 
-    .. warning:: Note that this data structure makes none of the performance
-                 guarantees of a dictionary. Lookup and deletion is not an O(1)
-                 operation. Inserting a new value *is* O(1), all other
-                 operations are O(n), including *replacing* a header entirely.
+    Headers are indexed by their lower-case name, so inserting a header,
+    looking one up, checking for one and finding the length of the mapping are
+    all cheap. Deleting or replacing a header is O(n) in the number of
+    headers, as the raw ordering has to be preserved.
     """
     def __init__(self, *args, **kwargs):
         # The meat of the structure. In practice, headers are an ordered list
@@ -56,18 +65,38 @@ class HTTPHeaderMap(collections.MutableMapping):
         # 'canonical form', but are instead stored in the form they were
         # provided in. This is to ensure that it is always possible to
         # reproduce the original header structure if necessary. This leads to
-        # some unfortunate performance costs on structure access where it is
-        # often necessary to transform the data into canonical form on access.
-        # This cost is judged acceptable in low-level code like `hyper`, but
-        # higher-level abstractions should consider if they really require this
-        # logic.
+        # some unfortunate performance costs, as the data must be transformed
+        # into canonical form. To keep that cost down, each header is only
+        # transformed once, when it is added: the canonical forms are kept in
+        # a list running in parallel to this one.
         self._items = []
+        self._canonical = []
+
+        # An index of the headers by lower-case name. Each name maps to a list
+        # of the raw tuples with that name, in order, along with their values
+        # in canonical form.
+        self._index = {}
+
+        # The number of headers in canonical form.
+        self._size = 0
 
         for arg in args:
-            self._items.extend(map(lambda x: to_bytestring_tuple(*x), arg))
+            for item in arg:
+                self._add(to_bytestring_tuple(*item))
 
         for k, v in kwargs.items():
-            self._items.append(to_bytestring_tuple(k, v))
+            self._add(to_bytestring_tuple(k, v))
+
+    def _add(self, item):
+        """
+        Adds a raw header tuple to the end of the mapping.
+        """
+        pairs = list(canonical_form(*item))
+
+        self._items.append(item)
+        self._canonical.append(pairs)
+        self._index.setdefault(pairs[0][0], []).append((item, pairs))
+        self._size += len(pairs)
 
     def __getitem__(self, key):
         """
@@ -76,67 +105,68 @@ class HTTPHeaderMap(collections.MutableMapping):
         that comma-separated values are split into multiple values.
         """
         key = to_bytestring(key)
-        values = []
 
-        for k, v in self._items:
-            if _keys_equal(k, key):
-                values.extend(x[1] for x in canonical_form(k, v))
-
-        if not values:
+        try:
+            entries = self._index[key.lower()]
+        except KeyError:
             raise KeyError("Nonexistent header key: {}".format(key))
 
+        values = []
+        for _, pairs in entries:
+            values.extend(v for _, v in pairs)
+
         return values
 
     def __setitem__(self, key, value):
         """
         Unlike the dict __setitem__, this appends to the list of items.
         """
-        self._items.append(to_bytestring_tuple(key, value))
+        self._add(to_bytestring_tuple(key, value))
 
     def __delitem__(self, key):
         """
         Sadly, __delitem__ is kind of stupid here, but the best we can do is
-        delete all headers with a given key. To correctly achieve the 'KeyError
-        on missing key' logic from dictionaries, we need to do this slowly.
+        delete all headers with a given key.
         """
         key = to_bytestring(key)
-        indices = []
-        for (i, (k, v)) in enumerate(self._items):
-            if _keys_equal(k, key):
-                indices.append(i)
 
-        if not indices:
+        try:
+            entries = self._index.pop(key.lower())
+        except KeyError:
             raise KeyError("Nonexistent header key: {}".format(key))
 
-        for i in indices[::-1]:
-            self._items.pop(i)
+        # The same tuple may appear more than once, but only ever under the
+        # one name, so it's safe to remove by identity.
+        doomed = set(id(item) for item, _ in entries)
+        kept = [
+            (i, c) for i, c in zip(self._items, self._canonical)
+            if id(i) not in doomed
+        ]
+        self._items = [i for i, _ in kept]
+        self._canonical = [c for _, c in kept]
+        self._size -= sum(len(pairs) for _, pairs in entries)
 
     def __iter__(self):
         """
         This mapping iterates like the list of tuples it is. The headers are
         returned in canonical form.
         """
-        for pair in self._items:
-            for value in canonical_form(*pair):
-                yield value
+        for pairs in self._canonical:
+            for pair in pairs:
+                yield pair
 
     def __len__(self):
         """
         The length of this mapping is the number of individual headers in
-        canonical form. Sadly, this is a somewhat expensive operation.
+        canonical form.
         """
-        size = 0
-        for _ in self:
-            size += 1
-
-        return size
+        return self._size
 
     def __contains__(self, key):
         """
         If any header is present with this key, returns True.
         """
-        key = to_bytestring(key)
-        return any(_keys_equal(key, k) for k, _ in self._items)
+        return to_bytestring(key).lower() in self._index
 
     def keys(self):
         """
@@ -194,6 +224,15 @@ class HTTPHeaderMap(collections.MutableMapping):
 
         self[key] = value
 
+    def _set_raw(self, items):
+        """
+        Replaces the contents of the mapping with the given raw tuples, which
+        must already be bytestrings.
+        """
+        HTTPHeaderMap.__init__(self)
+        for item in items:
+            self._add(item)
+
     def merge(self, other):
         """
         Merge another header set or any other dict-like into this one.
@@ -204,11 +243,12 @@ class HTTPHeaderMap(collections.MutableMapping):
             return
 
         if isinstance(other, HTTPHeaderMap):
-            self._items.extend(other.iter_raw())
+            for item in other.iter_raw():
+                self._add(item)
             return
 
         for k, v in other.items():
-            self._items.append(to_bytestring_tuple(k, v))
+            self._add(to_bytestring_tuple(k, v))
 
     def __eq__(self, other):
         return self._items == other._items
@@ -223,25 +263,85 @@ class HTTPHeaderMap(collections.MutableMapping):
         return str(self)
 
 
+class LazyHTTPHeaderMap(HTTPHeaderMap):
+    """
+    An :class:`HTTPHeaderMap` that holds on to the raw headers it is given,
+    and only indexes them and splits them into canonical form the first time
+    it is used. Iterating over the raw headers doesn't count as using it.
+
+    :param items: An iterable of the raw headers, as tuples.
+    """
+    def __init__(self, items):
+        self._raw_headers = [to_bytestring_tuple(*item) for item in items]
+
+    def __getattr__(self, name):
+        # Only called for attributes that haven't been set, which includes
+        # the internals of the map until it has been built.
+        if name not in ('_items', '_canonical', '_index', '_size'):
+            raise AttributeError(name)
+
+        HTTPHeaderMap.__init__(self)
+        for item in self.__dict__.pop('_raw_headers'):
+            self._add(item)
+
+        return getattr(self, name)
+
+    def iter_raw(self):
+        if '_raw_headers' in self.__dict__:
+            return iter(self._raw_headers)
+
+        return super(LazyHTTPHeaderMap, self).iter_raw()
+
+    def _set_raw(self, items):
+        if '_raw_headers' in self.__dict__:
+            self._raw_headers = items
+        else:
+            super(LazyHTTPHeaderMap, self)._set_raw(items)
+
+
+def raw_values(headers, name):
+    """
+    Returns the values of a header as they were received, without splitting
+    them into canonical form. Unlike indexing the map, this doesn't force a
+    :class:`LazyHTTPHeaderMap` to be built.
+
+    :param headers: The header map.
+    :param name: The name of the header, as a lower-case bytestring.
+    :returns: A list of the raw values.
+    """
+    return [v for k, v in headers.iter_raw() if k.lower() == name]
+
+
 def canonical_form(k, v):
     """
     Returns an iterable of key-value-pairs corresponding to the header in
     canonical form. This means that the header is split on commas unless for
     any reason it's a super-special snowflake (I'm looking at you Set-Cookie).
+    Commas inside quoted strings don't split the header.
     """
-    SPECIAL_SNOWFLAKES = set([b'set-cookie', b'set-cookie2'])
-
     k = k.lower()
 
     if k in SPECIAL_SNOWFLAKES:
         yield k, v
     else:
-        for sub_val in v.split(b','):
+        for sub_val in _split_on_commas(v):
             yield k, sub_val.strip()
 
 
-def _keys_equal(x, y):
+def _split_on_commas(value):
     """
-    Returns 'True' if the two keys are equal by the laws of HTTP headers.
+    Splits a header value on the commas that aren't inside quoted strings.
     """
-    return x.lower() == y.lower()
+    if b'"' not in value:
+        return value.split(b',')
+
+    parts = []
+    start = 0
+
+    for match in _COMMA_OR_QUOTED_STRING.finditer(value):
+        if match.group() == b',':
+            parts.append(value[start:match.start()])
+            start = match.end()
+
+    parts.append(value[start:])
+    return parts
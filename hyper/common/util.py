@@ -53,6 +53,19 @@ def to_host_port_tuple(host_port_str, default_port=80):
     return (host, port)
 
 
+def to_timeout_tuple(timeout, default=None):
+    """
+    Converts the given timeout to a ``(connect, read)`` tuple. A single number
+    is used for both. If no timeout is given, both are ``default``.
+    """
+    if timeout is None:
+        return (default, default)
+    elif isinstance(timeout, tuple):
+        return timeout
+
+    return (timeout, timeout)
+
+
 def to_native_string(string, encoding='utf-8'):
     if isinstance(string, str):
         return string
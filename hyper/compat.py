@@ -53,6 +53,12 @@ if is_py2:
                          strategy=zlib.Z_DEFAULT_STRATEGY):
         return zlib.compressobj(level, method, wbits, memlevel, strategy)
 
+    # Python 2 can't join memoryviews.
+    def join_bytes(pieces):
+        return b''.join(
+            p.tobytes() if isinstance(p, memoryview) else p for p in pieces
+        )
+
     unicode = unicode
     bytes = str
 
@@ -73,6 +79,8 @@ elif is_py3:
 
     zlib_compressobj = zlib.compressobj
 
+    join_bytes = b''.join
+
     if is_py3_3:
         ssl = ssl_compat
     else:
@@ -5,9 +5,19 @@ hyper/contrib
 
 Contains a few utilities for use with other HTTP libraries.
 """
+import errno
+import os
+import socket
+import ssl
+import threading
+
 try:
     from requests.adapters import HTTPAdapter
+    from requests.exceptions import (
+        ConnectionError, ConnectTimeout, ReadTimeout
+    )
     from requests.models import Response
+    from requests.packages.urllib3.exceptions import MaxRetryError
     from requests.structures import CaseInsensitiveDict
     from requests.utils import get_encoding_from_headers
     from requests.cookies import extract_cookies_to_jar
@@ -15,7 +25,13 @@ except ImportError:  # pragma: no cover
     HTTPAdapter = object
 
 from hyper.common.connection import HTTPConnection
-from hyper.compat import urlparse
+from hyper.common.exceptions import ConnectionResetError
+from hyper.common.util import to_bytestring
+from hyper.compat import bytes, unicode, urlparse
+from hyper.http11.connection import IDEMPOTENT_METHODS
+from hyper.http20.exceptions import StreamResetError
+from hyper.http20.pool import HTTP20ConnectionPool
+from hyper.tls import init_context
 
 
 class HTTP20Adapter(HTTPAdapter):
@@ -23,49 +39,143 @@ class HTTP20Adapter(HTTPAdapter):
     A Requests Transport Adapter that uses hyper to send requests over
     HTTP/2. This implements some degree of connection pooling to maximise the
     HTTP/2 gain.
+
+    The adapter is thread-safe: a session shared by many threads sends their
+    requests concurrently over the same HTTP/2 connection. Origins that only
+    speak HTTP/1.1 get a connection per concurrent request instead, up to
+    ``pool_maxsize``, after which requests wait their turn.
+
+    The adapter takes the same arguments as Requests' own. ``pool_connections``
+    is the number of origins to keep connections to, and ``pool_maxsize`` the
+    number of connections to keep to each. HTTP/2 connections are shared
+    rather than checked out, so a new one is only opened once the others are
+    carrying as many streams as the server allows, and ``pool_block`` has no
+    effect. Requests are retried as ``max_retries`` allows when the server
+    refuses the stream without processing it, and idempotent requests are
+    also retried when the connection is reset.
     """
-    def __init__(self, *args, **kwargs):
-        #: A mapping between HTTP netlocs and ``HTTP20Connection`` objects.
-        self.connections = {}
+    def init_poolmanager(self, connections, maxsize, block=False,
+                         **pool_kwargs):
+        """
+        Creates the connection pools used by the adapter. Requests calls
+        this when the adapter is created or unpickled.
+        """
+        self._pool_kwargs = dict(
+            pool_kwargs, max_origins=connections, maxsize=maxsize,
+            connection_class=HTTPConnection
+        )
 
-    def get_connection(self, host, port, scheme):
+        #: The :class:`HTTP20ConnectionPool <hyper.HTTP20ConnectionPool>`
+        #: holding the connections used by this adapter.
+        self.connections = HTTP20ConnectionPool(**self._pool_kwargs)
+
+        # Connections that verify the server or identify the client
+        # differently from the default need their own pool, keyed off the
+        # ``verify`` and ``cert`` arguments to ``send()``.
+        self._tls_pools = {}
+        self._tls_pools_lock = threading.Lock()
+
+    def get_connection(self, host, port, scheme, verify=True, cert=None):
         """
         Gets an appropriate HTTP/2 connection object based on host/port/scheme
-        tuples.
+        tuples, and for secure connections the ``verify`` and ``cert``
+        arguments to ``send()``.
         """
         secure = (scheme == 'https')
 
         if port is None:  # pragma: no cover
             port = 80 if not secure else 443
 
-        try:
-            conn = self.connections[(host, port, scheme)]
-        except KeyError:
-            conn = HTTPConnection(host, port, secure=secure)
-            self.connections[(host, port, scheme)] = conn
+        pool = self._get_pool(scheme, verify, cert)
+        return pool.get_connection(host, port, secure)
+
+    def _get_pool(self, scheme, verify, cert):
+        """
+        Gets the pool holding connections with the given TLS settings.
+        """
+        if scheme != 'https' or (verify is True and cert is None):
+            return self.connections
 
-        return conn
+        key = (verify, cert)
 
-    def send(self, request, stream=False, **kwargs):
+        with self._tls_pools_lock:
+            if key not in self._tls_pools:
+                kwargs = dict(
+                    self._pool_kwargs, ssl_context=_ssl_context(verify, cert)
+                )
+                self._tls_pools[key] = HTTP20ConnectionPool(**kwargs)
+
+            return self._tls_pools[key]
+
+    def close(self):
+        """
+        Closes all the connections held by the adapter.
+        """
+        self.connections.close()
+
+        with self._tls_pools_lock:
+            for pool in self._tls_pools.values():
+                pool.close()
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
         """
         Sends a HTTP message to the server.
         """
         parsed = urlparse(request.url)
 
-        conn = self.get_connection(parsed.hostname, parsed.port, parsed.scheme)
-
         # Build the selector.
         selector = parsed.path
         selector += '?' + parsed.query if parsed.query else ''
         selector += '#' + parsed.fragment if parsed.fragment else ''
 
-        conn.request(
-            request.method,
-            selector,
-            request.body,
-            request.headers
-        )
-        resp = conn.get_response()
+        retries = self.max_retries
+
+        while True:
+            conn = self.get_connection(
+                parsed.hostname, parsed.port, parsed.scheme, verify=verify,
+                cert=cert
+            )
+
+            # Other threads may be making requests on the same connection, so
+            # ask for the response to this one by its stream ID.
+            try:
+                stream_id = conn.request(
+                    request.method,
+                    selector,
+                    request.body,
+                    request.headers,
+                    timeout=timeout
+                )
+                resp = conn.get_response(stream_id)
+                break
+            except socket.timeout as e:
+                # The connection only has a socket once it's connected.
+                if getattr(conn, '_sock', None) is None:
+                    raise ConnectTimeout(e, request=request)
+
+                raise ReadTimeout(e, request=request)
+            except Exception as e:
+                if not _is_retryable(request, e):
+                    if isinstance(e, (socket.error, ConnectionResetError)):
+                        raise ConnectionError(e, request=request)
+
+                    raise
+
+                # A reset connection is no use to anyone: the retry, and
+                # anyone else asking, gets a new one.
+                if not isinstance(e, StreamResetError):
+                    pool = self._get_pool(parsed.scheme, verify, cert)
+                    pool.discard_connection(conn)
+
+                try:
+                    retries = retries.increment(
+                        request.method, request.url, error=e
+                    )
+                except MaxRetryError as e:
+                    raise ConnectionError(e, request=request)
+
+                retries.sleep()
 
         r = self.build_response(request, resp)
 
@@ -102,6 +212,13 @@ class HTTP20Adapter(HTTPAdapter):
         # release_conn method, which I don't. We should monkeypatch a no-op on.
         resp.release_conn = lambda: None
 
+        # Requests streams the body through a stream method, if the raw
+        # response has one. Ours gathers the body up into pieces of the size
+        # asked for, however the server happened to split it up.
+        resp.stream = lambda amt=65536, decode_content=None: (
+            resp.iter_content(amt, decode_content is not False)
+        )
+
         # Next, add the things HTTPie needs. It needs the following things:
         #
         # - The `raw` object has a property called `_original_response` that is
@@ -146,3 +263,50 @@ class HTTP20Adapter(HTTPAdapter):
         orig.msg = FakeOriginalResponse(resp.headers.iter_raw())
 
         return response
+
+
+def _is_retryable(request, error):
+    """
+    Whether a request that failed with the given error can safely be sent
+    again. Streams the server refused weren't processed at all, but when the
+    connection is reset the server may have processed the request already,
+    so only idempotent requests are retried. Bodies that may have been read
+    already can't be sent again.
+    """
+    if not isinstance(request.body, (bytes, unicode, type(None))):
+        return False
+
+    if isinstance(error, StreamResetError):
+        return error.error_code == 7  # 7 = REFUSED_STREAM
+
+    reset = (
+        isinstance(error, ConnectionResetError) or
+        getattr(error, 'errno', None) in (errno.ECONNRESET, errno.EPIPE)
+    )
+    return reset and to_bytestring(request.method) in IDEMPOTENT_METHODS
+
+
+def _ssl_context(verify, cert):
+    """
+    Builds an ``SSLContext`` that checks the server's certificate as Requests'
+    ``verify`` argument asks, and presents the client certificate given by
+    its ``cert`` argument.
+    """
+    if verify is True or verify is False:
+        context = init_context()
+    elif os.path.isdir(verify):
+        context = init_context()
+        context.load_verify_locations(capath=verify)
+    else:
+        context = init_context(verify)
+
+    if not verify:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+
+    if isinstance(cert, tuple):
+        context.load_cert_chain(*cert)
+    elif cert:
+        context.load_cert_chain(cert)
+
+    return context
@@ -10,14 +10,19 @@ import os
 import socket
 import base64
 
-from collections import Iterable, Mapping
+from collections import deque, Iterable, Mapping
 
 from .response import HTTP11Response
 from ..tls import wrap_socket, H2C_PROTOCOL
 from ..common.bufsocket import BufferedSocket
-from ..common.exceptions import TLSUpgrade, HTTPUpgrade
+from ..common.encoder import compress_body, get_encoder
+from ..common.exceptions import (
+    ConnectionResetError, TLSUpgrade, HTTPUpgrade
+)
 from ..common.headers import HTTPHeaderMap
-from ..common.util import to_bytestring, to_host_port_tuple
+from ..common.util import (
+    to_bytestring, to_host_port_tuple, to_timeout_tuple
+)
 from ..compat import bytes
 
 from ..packages.hyperframe.frame import SettingsFrame
@@ -34,6 +39,13 @@ log = logging.getLogger(__name__)
 BODY_CHUNKED = 1
 BODY_FLAT = 2
 
+# Requests using these methods may be pipelined. Requests with any other method
+# are only sent once all earlier responses have arrived, and no requests are
+# pipelined behind them.
+IDEMPOTENT_METHODS = frozenset([
+    b'GET', b'HEAD', b'PUT', b'DELETE', b'OPTIONS', b'TRACE'
+])
+
 
 class HTTP11Connection(object):
     """
@@ -54,9 +66,29 @@ class HTTP11Connection(object):
     :param proxy_port: (optional) The proxy port to connect to. If not provided 
         and one also isn't provided in the ``proxy`` parameter, 
         defaults to 8080.
+    :param pipeline: (optional) Whether to pipeline requests, sending further
+        requests before the responses to earlier ones have arrived. Responses
+        are returned by :meth:`get_response()
+        <hyper.HTTP11Connection.get_response>` in the order the requests were
+        made. Requests with non-idempotent methods are never pipelined.
+        Pipelining connections don't attempt to upgrade to HTTP/2. Defaults to
+        ``False``.
+    :param compress_requests: (optional) The content coding, ``'gzip'`` or
+        ``'deflate'``, to compress request bodies with. Bodies are compressed
+        as they are sent, and a ``Content-Encoding`` header is added. Bodies
+        that already have a ``Content-Encoding`` or ``Content-Length`` header
+        are sent as they are. If not provided, bodies aren't compressed.
+    :param compress_threshold: (optional) Bodies known to be smaller than this
+        many bytes are sent uncompressed. Defaults to 1,024 bytes.
+    :param timeout: (optional) How long to wait for the server, in seconds:
+        either a single number, or a ``(connect, read)`` tuple. The read
+        timeout applies to each wait for data from the server, and ``None``
+        waits forever. Defaults to 5 seconds for both.
     """
     def __init__(self, host, port=None, secure=None, ssl_context=None, 
-                 proxy_host=None, proxy_port=None, **kwargs):
+                 proxy_host=None, proxy_port=None, pipeline=False,
+                 compress_requests=None, compress_threshold=1024,
+                 timeout=None, **kwargs):
         if port is None:
             self.host, self.port = to_host_port_tuple(host, default_port=80)
         else:
@@ -73,9 +105,31 @@ class HTTP11Connection(object):
             self.secure = False
 
         # only send http upgrade headers for non-secure connection
-        self._send_http_upgrade = not self.secure
+        self._send_http_upgrade = not self.secure and not pipeline
+
+        self._pipeline = pipeline
+
+        # Check the coding up front, rather than on the first request.
+        if compress_requests is not None:
+            get_encoder(compress_requests)
+
+        self._compress_requests = compress_requests
+        self._compress_threshold = compress_threshold
+
+        # The methods of the requests whose responses haven't been read yet,
+        # in the order they were sent.
+        self._outstanding = deque()
+
+        # Responses that had to be read off the connection before the user
+        # asked for them, to make way for a non-pipelined request.
+        self._early_responses = deque()
+
+        # The last response read off the connection. Its body must be read
+        # before the next response can be.
+        self._last_response = None
 
         self.ssl_context = ssl_context
+        self._timeout = timeout
         self._sock = None
 
         # Setup proxy details if applicable.
@@ -95,7 +149,10 @@ class HTTP11Connection(object):
         self.network_buffer_size = 65536
 
         #: The object used to perform HTTP/1.1 parsing. Needs to conform to
-        #: the standard hyper parsing interface.
+        #: the standard hyper parsing interface. The pure-Python parser limits
+        #: the number and size of the headers in a response: to change the
+        #: limits, replace it with a new
+        #: :class:`Parser <hyper.http11.parser.Parser>`.
         self.parser = Parser()
 
     def connect(self):
@@ -106,31 +163,39 @@ class HTTP11Connection(object):
         :returns: Nothing.
         """
         if self._sock is None:
-            if not self.proxy_host:
-                host = self.host
-                port = self.port
-            else:
-                host = self.proxy_host
-                port = self.proxy_port
-                
-            sock = socket.create_connection((host, port), 5)
-            proto = None
+            self._connect(self._timeout)
 
-            if self.secure:
-                assert not self.proxy_host, "Using a proxy with HTTPS not yet supported."
-                sock, proto = wrap_socket(sock, host, self.ssl_context)
+        return
 
-            log.debug("Selected protocol: %s", proto)
-            sock = BufferedSocket(sock, self.network_buffer_size)
+    def _connect(self, timeout):
+        """
+        Opens the connection, applying the given timeout to the socket.
+        """
+        if not self.proxy_host:
+            host = self.host
+            port = self.port
+        else:
+            host = self.proxy_host
+            port = self.proxy_port
 
-            if proto not in ('http/1.1', None):
-                raise TLSUpgrade(proto, sock)
+        connect_timeout, read_timeout = to_timeout_tuple(timeout, default=5)
+        sock = socket.create_connection((host, port), connect_timeout)
+        proto = None
 
-            self._sock = sock
+        if self.secure:
+            assert not self.proxy_host, "Using a proxy with HTTPS not yet supported."
+            sock, proto = wrap_socket(sock, host, self.ssl_context)
 
-        return
+        log.debug("Selected protocol: %s", proto)
+        sock.settimeout(read_timeout)
+        sock = BufferedSocket(sock, self.network_buffer_size)
+
+        if proto not in ('http/1.1', None):
+            raise TLSUpgrade(proto, sock)
+
+        self._sock = sock
 
-    def request(self, method, url, body=None, headers={}):
+    def request(self, method, url, body=None, headers={}, timeout=None):
         """
         This will send a request to the server using the HTTP request method
         ``method`` and the selector ``url``. If the ``body`` argument is
@@ -144,6 +209,9 @@ class HTTP11Connection(object):
         :param body: (optional) The request body to send. Must be a bytestring
             or a file-like object.
         :param headers: (optional) The headers to send on the request.
+        :param timeout: (optional) How long to wait for the server while
+            making this request and reading its response, overriding the
+            ``timeout`` given to the constructor.
         :returns: Nothing.
         """
         method = to_bytestring(method)
@@ -157,13 +225,40 @@ class HTTP11Connection(object):
             else:
                 raise ValueError('Header argument must be a dictionary or an iterable')
 
+        if timeout is None:
+            timeout = self._timeout
+
         if self._sock is None:
-            self.connect()
+            self._connect(timeout)
+        else:
+            self._sock.settimeout(to_timeout_tuple(timeout, default=5)[1])
+
+        # Don't pipeline requests that aren't idempotent, or that follow one
+        # that isn't: collect all outstanding responses first.
+        if self._pipeline and self._outstanding and (
+                method not in IDEMPOTENT_METHODS or
+                any(m not in IDEMPOTENT_METHODS for m in self._outstanding)):
+            while self._outstanding:
+                self._early_responses.append(self._receive_response())
+
+            self._last_response._drain()
 
         if self._send_http_upgrade:
             self._add_upgrade_headers(headers)
             self._send_http_upgrade = False
 
+        # We may need to compress the body.
+        if (body and self._compress_requests and
+                b'content-encoding' not in headers and
+                b'content-length' not in headers):
+            compressed = compress_body(
+                body, self._compress_requests, self._compress_threshold
+            )
+
+            if compressed is not None:
+                headers[b'content-encoding'] = self._compress_requests
+                body = compressed
+
         # We may need extra headers.
         if body:
             body_type = self._add_body_headers(headers, body)
@@ -178,6 +273,8 @@ class HTTP11Connection(object):
         if body:
             self._send_body(body, body_type)
 
+        self._outstanding.append(method)
+
         return
 
     def get_response(self):
@@ -187,13 +284,43 @@ class HTTP11Connection(object):
         This is an early beta, so the response object is pretty stupid. That's
         ok, we'll fix it later.
         """
+        if self._early_responses:
+            return self._early_responses.popleft()
+
+        return self._receive_response()
+
+    def _receive_response(self):
+        """
+        Reads the next response off the connection. When pipelining, the body
+        of the previous response is read into memory first if the user hasn't
+        read it already.
+        """
+        if self._pipeline and self._last_response is not None:
+            self._last_response._drain()
+
+        # The server may have closed the connection after an earlier
+        # response, taking any requests pipelined behind it with it.
+        if self._sock is None:
+            raise ConnectionResetError(
+                "The connection was closed before the response arrived."
+            )
+
+        try:
+            method = self._outstanding.popleft()
+        except IndexError:
+            method = None
+
         headers = HTTPHeaderMap()
 
         response = None
-        while response is None:
-            # 'encourage' the socket to receive data.
-            self._sock.fill()
-            response = self.parser.parse_response(self._sock.buffer)
+        try:
+            while response is None:
+                # 'encourage' the socket to receive data.
+                self._sock.fill()
+                response = self.parser.parse_response(self._sock.buffer)
+        except Exception:
+            self._reset_parser()
+            raise
 
         for n, v in response.headers:
             headers[n.tobytes()] = v.tobytes()
@@ -205,14 +332,17 @@ class HTTP11Connection(object):
            H2C_PROTOCOL.encode('utf-8') in headers['upgrade']):
             raise HTTPUpgrade(H2C_PROTOCOL, self._sock)
 
-        return HTTP11Response(
+        self._last_response = HTTP11Response(
             response.status,
             response.msg.tobytes(),
             headers,
             self._sock,
-            self
+            self,
+            request_method=method,
         )
 
+        return self._last_response
+
     def _send_headers(self, method, url, headers):
         """
         Handles the logic of sending the header block.
@@ -336,8 +466,28 @@ class HTTP11Connection(object):
         .. warning:: This method should absolutely only be called when you are
                      certain the connection object is no longer needed.
         """
-        self._sock.close()
-        self._sock = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+        if self._outstanding:
+            log.warning(
+                "Closing connection with %d responses outstanding",
+                len(self._outstanding)
+            )
+
+        self._outstanding.clear()
+        self._last_response = None
+        self._reset_parser()
+
+    def _reset_parser(self):
+        """
+        Makes the parser forget any partly parsed response. Not every parser
+        is incremental, so not every parser needs this.
+        """
+        reset = getattr(self.parser, 'reset', None)
+        if reset is not None:
+            reset()
 
     # The following two methods are the implementation of the context manager
     # protocol.
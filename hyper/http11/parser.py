@@ -7,13 +7,37 @@ This module contains hyper's pure-Python HTTP/1.1 parser. This module defines
 an abstraction layer for HTTP/1.1 parsing that allows for dropping in other
 modules if needed, in order to obtain speedups on your chosen platform.
 """
+import re
 from collections import namedtuple
 
+from ..compat import is_py2
+
 
 Response = namedtuple(
     'Response', ['status', 'msg', 'minor_version', 'headers', 'consumed']
 )
 
+#: The largest number of headers a response may carry.
+MAX_HEADERS = 256
+
+#: The largest size, in bytes, of the status line and header block of a
+#: response.
+MAX_HEADER_SIZE = 64 * 1024
+
+_NEWLINE = re.compile(b'\n')
+_STATUS_LINE = re.compile(
+    br'HTTP/1\.(\d+)[ \t]+(\d+)(?:[ \t]+(.*?))?[ \t\r]*\n'
+)
+_HEADER_LINE = re.compile(br'([^:\r\n]+):[ \t]*(.*?)[ \t\r]*\n')
+
+if is_py2:  # pragma: no cover
+    # Python 2's re module can't search memoryviews.
+    def _searchable(buffer):
+        return buffer.tobytes()
+else:
+    def _searchable(buffer):
+        return buffer
+
 
 class ParseError(Exception):
     """
@@ -28,9 +52,40 @@ class Parser(object):
     This object is not thread-safe, and it does maintain state that is shared
     across parsing requests. For this reason, make sure that access to this
     object is synchronized if you use it across multiple threads.
+
+    The parser is incremental: if a response is incomplete, it remembers how
+    far through it got, and the next call to
+    :meth:`parse_response() <hyper.http11.parser.Parser.parse_response>` picks
+    up from there. That call must be passed the same buffer, with more data
+    on the end of it. Call :meth:`reset() <hyper.http11.parser.Parser.reset>`
+    to abandon a partly parsed response.
+
+    :param max_headers: (optional) The largest number of headers a response
+        may carry. Defaults to :data:`MAX_HEADERS`.
+    :param max_header_size: (optional) The largest size, in bytes, of the
+        status line and header block of a response. Defaults to
+        :data:`MAX_HEADER_SIZE`.
     """
-    def __init__(self):
-        pass
+    def __init__(self, max_headers=MAX_HEADERS,
+                 max_header_size=MAX_HEADER_SIZE):
+        self.max_headers = max_headers
+        self.max_header_size = max_header_size
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets any partly parsed response.
+
+        :returns: Nothing.
+        """
+        # The offset of the first line not yet parsed.
+        self._position = 0
+
+        # The parts of the status line, once it has been parsed.
+        self._status_line = None
+
+        # The headers parsed so far.
+        self._headers = []
 
     def parse_response(self, buffer):
         """
@@ -40,43 +95,99 @@ class Parser(object):
         :returns: A :class:`Response <hyper.http11.parser.Response>` object, or
             ``None`` if there is not enough data in the buffer.
         """
-        # Begin by copying the data out of the buffer. This is necessary
-        # because as much as possible we want to use the built-in bytestring
-        # methods, rather than looping over the data in Python.
-        temp_buffer = buffer.tobytes()
+        # If the buffer is shorter than the data we've already parsed, it
+        # can't be the one we were parsing before.
+        if len(buffer) < self._position:
+            self.reset()
+
+        # The built-in bytestring methods can't be used on a memoryview
+        # without copying the data out of it, but regular expressions can
+        # search it in place.
+        data = _searchable(buffer)
+
+        try:
+            return self._parse(buffer, data)
+        except ParseError:
+            self.reset()
+            raise
+
+    def _parse(self, buffer, data):
+        """
+        Parses as many lines of the response as are available, returning the
+        response if it is complete.
+        """
+        index = self._position
 
-        index = temp_buffer.find(b'\n')
-        if index == -1:
-            return None
+        while True:
+            match = _NEWLINE.search(data, index)
+            if match is None:
+                break
 
-        version, status, reason = temp_buffer[0:index].split(None, 2)
-        if not version.startswith(b'HTTP/1.'):
+            end_index = match.end()
+            if end_index > self.max_header_size:
+                raise ParseError("Response header block too large")
+
+            if self._status_line is None:
+                self._status_line = self._parse_status_line(
+                    buffer, data, index, end_index
+                )
+            elif (end_index - index) <= 2:
+                # A blank line ends the header block.
+                minor_version, status, reason = self._status_line
+                resp = Response(
+                    status, reason, minor_version, self._headers, end_index
+                )
+                self.reset()
+                return resp
+            else:
+                self._headers.append(
+                    self._parse_header(buffer, data, index, end_index)
+                )
+
+            index = end_index
+
+        self._position = index
+
+        if len(buffer) >= self.max_header_size:
+            raise ParseError("Response header block too large")
+
+        return None
+
+    def _parse_status_line(self, buffer, data, start, end):
+        """
+        Parses the status line, returning the minor version, status code and
+        reason phrase.
+        """
+        match = _STATUS_LINE.match(data, start, end)
+        if match is None:
             raise ParseError("Not HTTP/1.X!")
 
-        minor_version = int(version[7:])
-        status = int(status)
-        reason = memoryview(reason.strip())
+        minor_version = int(match.group(1))
+        status = int(match.group(2))
 
-        # Chomp the newline.
-        index += 1
+        reason_start, reason_end = match.span(3)
+        if reason_start == -1:
+            reason = memoryview(b'')
+        else:
+            reason = buffer[reason_start:reason_end]
 
-        # Now, parse the headers out.
-        end_index = index
-        headers = []
+        return minor_version, status, reason
 
-        while True:
-            end_index = temp_buffer.find(b'\n', index)
-            if end_index == -1:
-                return None
-            elif (end_index - index) <= 1:
-                # Chomp the newline
-                end_index += 1
-                break
+    def _parse_header(self, buffer, data, start, end):
+        """
+        Parses a single header line, returning its name and value.
+        """
+        if len(self._headers) >= self.max_headers:
+            raise ParseError("Too many headers in response")
+
+        match = _HEADER_LINE.match(data, start, end)
+        if match is None:
+            raise ParseError("Invalid header line")
 
-            name, value = temp_buffer[index:end_index].split(b':', 1)
-            value = value.strip()
-            headers.append((memoryview(name), memoryview(value)))
-            index = end_index + 1
+        name_start, name_end = match.span(1)
+        value_start, value_end = match.span(2)
 
-        resp = Response(status, reason, minor_version, headers, end_index)
-        return resp
+        return (
+            buffer[name_start:name_end],
+            buffer[value_start:value_end],
+        )
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+hyper/http11/pool
+~~~~~~~~~~~~~~~~~
+
+Objects that pool HTTP/1.1 connections.
+
+HTTP/1.1 connections can only carry one request at a time, but they can be
+kept alive and reused for later requests. This saves the cost of a new TCP
+(and possibly TLS) handshake for every request.
+"""
+import logging
+import threading
+import time
+
+from ..common.exceptions import PoolExhaustedError
+from ..common.util import to_host_port_tuple
+from .connection import HTTP11Connection
+
+log = logging.getLogger(__name__)
+
+
+class HTTP11ConnectionPool(object):
+    """
+    A pool of reusable HTTP/1.1 connections, holding up to ``maxsize``
+    connections for each origin.
+
+    Connections are checked out with
+    :meth:`get_connection() <hyper.HTTP11ConnectionPool.get_connection>` and
+    must be handed back with
+    :meth:`put_connection() <hyper.HTTP11ConnectionPool.put_connection>` once
+    the response has been read in full. If the request fails, or the response
+    won't be read in full, the connection must be handed back with
+    :meth:`discard_connection() <hyper.HTTP11ConnectionPool.discard_connection>`
+    instead, or it goes on counting against the pool size. Before an idle
+    connection is reused it is checked for staleness: if the server has closed
+    it, or sent data we weren't expecting, it is thrown away and another is
+    used. The pool is thread-safe.
+
+    :param maxsize: (optional) The maximum number of connections to each
+        origin, both idle and checked out. Defaults to 10.
+    :param idle_timeout: (optional) The number of seconds a connection may sit
+        idle in the pool before it is closed. If not provided, idle
+        connections are kept until they go stale.
+    :param kwargs: (optional) Any further keyword arguments are passed to the
+        constructor of each new
+        :class:`HTTP11Connection <hyper.HTTP11Connection>`.
+    """
+    def __init__(self, maxsize=10, idle_timeout=None, **kwargs):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+
+        self._connection_kwargs = kwargs
+
+        # A mapping between (host, port, secure) tuples and a list of idle
+        # connections, each stored with the time it was returned. The most
+        # recently returned connection is at the end.
+        self._idle = {}
+
+        # A mapping between (host, port, secure) tuples and the number of
+        # connections open to that origin, idle or not.
+        self._num_connections = {}
+
+        self._condition = threading.Condition()
+
+    def get_connection(self, host, port=None, secure=None, block=True,
+                       timeout=None):
+        """
+        Checks out a connection to the given origin, opening a new one if no
+        idle connection is available.
+
+        :param host: The host to connect to. This may be an IP address or a
+            hostname, and optionally may include a port.
+        :param port: (optional) The port to connect to. If not provided and
+            one also isn't provided in the ``host`` parameter, defaults to 80.
+        :param secure: (optional) Whether the connection should use TLS.
+            Defaults to ``False`` for most origins, but to ``True`` for any
+            connection to port 443.
+        :param block: (optional) If ``True``, the default, wait for a
+            connection to be returned when the pool for this origin is full.
+            If ``False``, raise
+            :class:`PoolExhaustedError <hyper.common.exceptions.PoolExhaustedError>`
+            instead.
+        :param timeout: (optional) The maximum number of seconds to block for.
+            If not provided, blocks forever.
+        :returns: A :class:`HTTP11Connection <hyper.HTTP11Connection>`.
+        """
+        if port is None:
+            host, port = to_host_port_tuple(host, default_port=80)
+
+        if secure is None:
+            secure = (port == 443)
+
+        origin = (host, port, secure)
+
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        with self._condition:
+            while True:
+                self._evict(origin)
+                idle = self._idle.setdefault(origin, [])
+
+                while idle:
+                    conn, _ = idle.pop()
+
+                    if not _is_stale(conn):
+                        return conn
+
+                    log.debug("Discarding stale connection %r", conn)
+                    self._discard(origin, conn)
+
+                if self._num_connections.get(origin, 0) < self.maxsize:
+                    self._num_connections[origin] = (
+                        self._num_connections.get(origin, 0) + 1
+                    )
+                    log.debug("Opening new connection to %s:%d", host, port)
+                    return HTTP11Connection(
+                        host, port, secure=secure, **self._connection_kwargs
+                    )
+
+                if not block:
+                    raise PoolExhaustedError(
+                        "No connections to %s:%d available" % (host, port)
+                    )
+
+                if timeout is None:
+                    self._condition.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise PoolExhaustedError(
+                            "Timed out waiting for a connection to %s:%d" %
+                            (host, port)
+                        )
+                    self._condition.wait(remaining)
+
+    def put_connection(self, conn):
+        """
+        Returns a connection to the pool so that it can be reused. The
+        response to the last request on the connection must have been read in
+        full first.
+
+        :param conn: The connection, previously obtained from
+            :meth:`get_connection() <hyper.HTTP11ConnectionPool.get_connection>`.
+        :returns: Nothing.
+        """
+        origin = (conn.host, conn.port, conn.secure)
+
+        with self._condition:
+            self._idle.setdefault(origin, []).append((conn, time.time()))
+            self._condition.notify()
+
+    def discard_connection(self, conn):
+        """
+        Closes a checked out connection that can't be reused, for example
+        because a request on it failed, and frees its place in the pool.
+
+        :param conn: The connection, previously obtained from
+            :meth:`get_connection() <hyper.HTTP11ConnectionPool.get_connection>`.
+        :returns: Nothing.
+        """
+        origin = (conn.host, conn.port, conn.secure)
+
+        with self._condition:
+            self._discard(origin, conn)
+            self._condition.notify()
+
+    def close(self):
+        """
+        Closes all idle connections in the pool. Connections that are checked
+        out are unaffected.
+
+        :returns: Nothing.
+        """
+        with self._condition:
+            for origin, idle in self._idle.items():
+                for conn, _ in idle:
+                    self._discard(origin, conn)
+
+            self._idle = {}
+            self._condition.notify_all()
+
+    def _evict(self, origin):
+        """
+        Closes any connections to an origin that have been idle for too long.
+        """
+        if self.idle_timeout is None:
+            return
+
+        cutoff = time.time() - self.idle_timeout
+        idle = self._idle.get(origin, [])
+
+        for conn, returned in idle:
+            if returned < cutoff:
+                log.debug("Evicting idle connection %r", conn)
+                self._discard(origin, conn)
+
+        self._idle[origin] = [t for t in idle if t[1] >= cutoff]
+
+    def _discard(self, origin, conn):
+        """
+        Closes a connection and stops counting it against the pool size.
+        """
+        conn.close()
+        self._num_connections[origin] -= 1
+
+    # The following two methods are the implementation of the context manager
+    # protocol.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+        return False  # Never swallow exceptions.
+
+
+def _is_stale(conn):
+    """
+    Whether an idle connection can no longer be used. An idle connection
+    should have nothing to read: if it does, the server has either closed it
+    or sent us something we didn't ask for.
+    """
+    return conn._sock is not None and conn._sock.can_read
@@ -6,13 +6,17 @@ hyper/http11/response
 Contains the HTTP/1.1 equivalent of the HTTPResponse object defined in
 httplib/http.client.
 """
+import collections
 import logging
 import weakref
-import zlib
 
-from ..common.decoder import DeflateDecoder
+from io import BytesIO
+
+from ..common.decoder import get_decoder
 from ..common.exceptions import ChunkedDecodeError, InvalidResponseError
 from ..common.exceptions import ConnectionResetError
+from ..common.headers import HTTPHeaderMap
+from ..compat import join_bytes
 
 log = logging.getLogger(__name__)
 
@@ -23,7 +27,8 @@ class HTTP11Response(object):
     provides access to the response headers and the entity body. The response
     is an iterable object and can be used in a with statement.
     """
-    def __init__(self, code, reason, headers, sock, connection=None):
+    def __init__(self, code, reason, headers, sock, connection=None,
+                 request_method=None):
         #: The reason phrase returned by the server.
         self.reason = reason
 
@@ -34,7 +39,8 @@ class HTTP11Response(object):
         #: once, and never assigned again.
         self.headers = headers
 
-        #: The response trailers. These are always intially ``None``.
+        #: The response trailers. These are always intially ``None``, and are
+        #: set once the trailers of a chunked body have been read.
         self.trailers = None
 
         # The socket this response is being sent over.
@@ -56,24 +62,27 @@ class HTTP11Response(object):
         # Whether we expect a chunked response.
         self._chunked = b'chunked' in self.headers.get(b'transfer-encoding', [])
 
+        # Some responses never have a body, whatever their headers say.
+        if request_method == b'HEAD' or code in (204, 304) or code < 200:
+            self._length = 0
+            self._chunked = False
+
         # One of the following must be true: we must expect that the connection
         # will be closed following the body, or that a content-length was sent,
         # or that we're getting a chunked response.
         # FIXME: Remove naked assert, replace with something better.
         assert self._expect_close or self._length is not None or self._chunked
 
-        # This object is used for decompressing gzipped request bodies. Right
-        # now we only support gzip because that's all the RFC mandates of us.
-        # Later we'll add support for more encodings.
-        # This 16 + MAX_WBITS nonsense is to force gzip. See this
-        # Stack Overflow answer for more:
-        # http://stackoverflow.com/a/2695466/1401686
-        if b'gzip' in self.headers.get(b'content-encoding', []):
-            self._decompressobj = zlib.decompressobj(16 + zlib.MAX_WBITS)
-        elif b'deflate' in self.headers.get(b'content-encoding', []):
-            self._decompressobj = DeflateDecoder()
-        else:
-            self._decompressobj = None
+        # This object is used for decompressing compressed response bodies.
+        # It is looked up from the codings registered in
+        # hyper.common.decoder.
+        self._decompressobj = get_decoder(
+            self.headers.get(b'content-encoding', [])
+        )
+
+        # Compressed data the decompressor hasn't got to yet, because it had
+        # already produced as much as we asked for.
+        self._unconsumed_tail = b''
 
         # This is a reference that allows for the Response class to tell the
         # parent connection object to throw away its socket object. This is to
@@ -86,9 +95,26 @@ class HTTP11Response(object):
         else:
             self._parent = None
 
-        self._buffered_data = b''
+        # Chunks of a chunked body that have been read off the connection but
+        # not yet returned from read(), and the offset into the first of them
+        # of the data not yet returned.
+        self._buffered_chunks = collections.deque()
+        self._buffered_offset = 0
+        self._buffered_size = 0
         self._chunker = None
 
+        # Whether the whole body has been read off the connection.
+        self._body_complete = False
+
+        # Decompressed data that was produced beyond what was asked for.
+        self._decoded_buffer = b''
+
+        # Whether the response has been explicitly closed.
+        self._closed = False
+
+        # Called, once, when the response gives up the connection.
+        self._release_cb = None
+
     def read(self, amt=None, decode_content=True):
         """
         Reads the response body, or up to the next ``amt`` bytes.
@@ -101,6 +127,9 @@ class HTTP11Response(object):
             ``True``, the actual amount of data returned may be different to
             the amount requested.
         """
+        if decode_content and (self._decompressobj or self._decoded_buffer):
+            return self._read_decoded(amt)
+
         # Return early if we've lost our connection.
         if self._sock is None:
             return b''
@@ -115,7 +144,7 @@ class HTTP11Response(object):
             if self._length is not None:
                 amt = self._length
             elif self._expect_close:
-                return self._read_expect_closed(decode_content)
+                return self._read_expect_closed()
             else:  # pragma: no cover
                 raise InvalidResponseError(
                     "Response must either have length or Connection: close"
@@ -130,67 +159,236 @@ class HTTP11Response(object):
         # If we are now going to read nothing, exit early. We still need to
         # close the socket.
         if not amt:
-            self.close(socket_close=self._expect_close)
+            self._body_complete = True
+            self._release(socket_close=self._expect_close)
             return b''
 
         # Now, issue reads until we read that length. This is to account for
         # the fact that it's possible that we'll be asked to read more than
-        # 65kB in one shot.
-        to_read = amt
-        chunks = []
-
-        # Ideally I'd like this to read 'while to_read', but I want to be
-        # defensive against the admittedly unlikely case that the socket
-        # returns *more* data than I want.
-        while to_read > 0:
-            chunk = self._sock.recv(amt).tobytes()
-
-            # If we got an empty read, but were expecting more, the remote end
-            # has hung up. Raise an exception if we were expecting more data,
-            # but if we were expecting the remote end to close then it's ok.
-            if not chunk:
-                if self._length is not None or not self._expect_close:
-                    self.close(socket_close=True)
-                    raise ConnectionResetError("Remote end hung up!")
-
-                break
-
-            to_read -= len(chunk)
-            chunks.append(chunk)
-
-        data = b''.join(chunks)
+        # 65kB in one shot. If we were expecting the remote end to close the
+        # connection, it's fine for it to do so before we have it all.
         if self._length is not None:
+            data = self._read_exactly(amt)
             self._length -= len(data)
+        else:
+            data = self._read_until_closed(amt)
 
-        # If we're at the end of the request, we have some cleaning up to do.
-        # Close the stream, and if necessary flush the buffer. Checking that
-        # we're at the end is actually obscenely complex: either we've read the
-        # full content-length or, if we were expecting a closed connection,
-        # we've had a read shorter than the requested amount. We also have to
-        # do this before we try to decompress the body.
+        # If we're at the end of the request, we have some cleaning up to do:
+        # close the stream. Checking that we're at the end is actually
+        # obscenely complex: either we've read the full content-length or, if
+        # we were expecting a closed connection, we've had a read shorter than
+        # the requested amount.
         end_of_request = (self._length == 0 or
                           (self._expect_close and len(data) < amt))
 
-        # We may need to decode the body.
-        if decode_content and self._decompressobj and data:
-            data = self._decompressobj.decompress(data)
-
-        if decode_content and self._decompressobj and end_of_request:
-            data += self._decompressobj.flush()
-
         # We're at the end. Close the connection. Explicit check for zero here
         # because self._length might be None.
         if end_of_request:
-            self.close(socket_close=self._expect_close)
+            self._body_complete = True
+            self._release(socket_close=self._expect_close)
 
         return data
 
+    def readinto(self, b):
+        """
+        Reads up to ``len(b)`` bytes of the response body into the writable
+        buffer ``b``. If the body is neither chunked nor compressed, the data
+        is copied straight out of the socket's buffer.
+
+        :param b: A writable buffer, such as a ``bytearray``.
+        :returns: The number of bytes read, which is zero only at the end of
+            the body.
+        """
+        if self._chunked or self._decompressobj or self._decoded_buffer:
+            # The data on the wire doesn't line up with the body, so go
+            # through read().
+            view = memoryview(b)
+            data = self.read(len(view))
+            view[:len(data)] = data
+            return len(data)
+
+        # Return early if we've lost our connection.
+        if self._sock is None:
+            return 0
+
+        view = memoryview(b)
+        amt = len(view)
+        if self._length is not None:
+            amt = min(amt, self._length)
+
+        if not amt:
+            if self._length == 0:
+                self._body_complete = True
+                self._release(socket_close=self._expect_close)
+
+            return 0
+
+        try:
+            count = self._recv_into(view[:amt])
+        except ConnectionResetError:
+            if self._length is not None or not self._expect_close:
+                raise
+
+            count = 0
+
+        # An empty read means the remote end has hung up. That's only ok if
+        # we were expecting it to.
+        if not count:
+            self._release(socket_close=True)
+
+            if self._length is not None or not self._expect_close:
+                raise ConnectionResetError("Remote end hung up!")
+
+            self._body_complete = True
+            return 0
+
+        if self._length is not None:
+            self._length -= count
+
+            if not self._length:
+                self._body_complete = True
+                self._release(socket_close=self._expect_close)
+
+        return count
+
+    def _recv_into(self, view):
+        """
+        Reads from the socket into a writable memoryview, directly if the
+        socket supports it.
+        """
+        recv_into = getattr(self._sock, 'recv_into', None)
+        if recv_into is not None:
+            return recv_into(view)
+
+        data = self._sock.recv(len(view))
+        view[:len(data)] = data
+        return len(data)
+
+    def readline(self, limit=-1):
+        """
+        Reads a single line of the response body, up to and including the
+        newline. Lines are read a byte at a time, so for anything more than
+        occasional use wrap the response in an ``io.BufferedReader``.
+
+        :param limit: (optional) The most bytes to read. If not provided or
+            negative, reads until the end of the line.
+        :returns: The line, or the empty string at the end of the body.
+        """
+        line = bytearray()
+        byte = bytearray(1)
+
+        while limit < 0 or len(line) < limit:
+            if not self.readinto(byte):
+                break
+
+            line += byte
+            if byte == b'\n':
+                break
+
+        return bytes(line)
+
+    def readable(self):
+        """
+        Response bodies can always be read from. This, together with
+        ``readinto()`` and ``closed``, allows responses to be wrapped in an
+        ``io.BufferedReader``.
+
+        :returns: ``True``.
+        """
+        return True
+
+    def writable(self):
+        """
+        Response bodies cannot be written to.
+
+        :returns: ``False``.
+        """
+        return False
+
+    def seekable(self):
+        """
+        Response bodies cannot be seeked.
+
+        :returns: ``False``.
+        """
+        return False
+
+    def flush(self):
+        """
+        Does nothing, as there is nothing to flush. Present so that responses
+        can be wrapped in an ``io.BufferedReader``.
+
+        :returns: Nothing.
+        """
+        pass
+
+    @property
+    def closed(self):
+        """
+        Whether the response has been closed.
+        """
+        return self._closed
+
+    def iter_content(self, chunk_size=65536, decode_content=True,
+                     reuse_buffer=False):
+        """
+        Iterates over the response body in pieces of ``chunk_size`` bytes.
+        Unlike ``read_chunked()``, the pieces don't depend on how the server
+        split the body into chunks: data is gathered up until there is a whole
+        piece. Only the last piece may be shorter.
+
+        :param chunk_size: (optional) The size of each piece, in bytes.
+            Defaults to 64kB.
+        :param decode_content: (optional) If ``True``, will transparently
+            decode the response data.
+        :param reuse_buffer: (optional) If ``True``, every piece is a
+            ``memoryview`` of the same buffer, which is overwritten by the
+            next piece. This saves allocating memory for each piece, but each
+            piece must be used or copied before the next is asked for.
+        """
+        if not reuse_buffer:
+            while True:
+                data = self.read(chunk_size, decode_content=decode_content)
+                if not data:
+                    break
+
+                yield data
+
+            return
+
+        view = memoryview(bytearray(chunk_size))
+
+        while True:
+            filled = 0
+
+            while filled < chunk_size:
+                if decode_content:
+                    count = self.readinto(view[filled:])
+                else:
+                    data = self.read(chunk_size - filled, decode_content=False)
+                    count = len(data)
+                    view[filled:filled + count] = data
+
+                if not count:
+                    break
+
+                filled += count
+
+            if not filled:
+                break
+
+            yield view[:filled]
+
+    def __iter__(self):
+        return self.iter_content()
+
     def read_chunked(self, decode_content=True):
         """
         Reads chunked transfer encoded bodies. This method returns a generator:
         each iteration of which yields one chunk *unless* the chunks are
         compressed, in which case it yields whatever the decompressor provides
-        for each chunk.
+        for each chunk. Any trailers sent after the body are available from
+        :attr:`trailers` once the generator is exhausted.
 
         .. warning:: This may yield the empty string, without that being the
                      end of the body!
@@ -200,6 +398,15 @@ class HTTP11Response(object):
                 "Attempted chunked read of non-chunked body."
             )
 
+        for chunk in self._read_chunks(decode_content):
+            yield bytes(chunk)
+
+    def _read_chunks(self, decode_content):
+        """
+        The implementation of ``read_chunked()``. Large chunks are read into a
+        ``bytearray`` rather than converted to a bytestring, so the chunks
+        yielded may be of either type.
+        """
         # Return early if possible.
         if self._sock is None:
             return
@@ -207,27 +414,21 @@ class HTTP11Response(object):
         while True:
             # Read to the newline to get the chunk length. This is a
             # hexadecimal integer.
-            chunk_length = int(self._sock.readline().tobytes().strip(), 16)
-            data = b''
+            chunk_length = _parse_chunk_length(self._sock.readline().tobytes())
 
-            # If the chunk length is zero, consume the newline and then we're
+            # If the chunk length is zero, read the trailers and then we're
             # done. If we were decompressing data, return the remaining data.
             if not chunk_length:
-                self._sock.readline()
+                self._read_trailers()
 
                 if decode_content and self._decompressobj:
                     yield self._decompressobj.flush()
 
-                self.close(socket_close=self._expect_close)
+                self._body_complete = True
+                self._release(socket_close=self._expect_close)
                 break
 
-            # Then read that many bytes.
-            while chunk_length > 0:
-                chunk = self._sock.recv(chunk_length).tobytes()
-                data += chunk
-                chunk_length -= len(chunk)
-
-            assert chunk_length == 0
+            data = self._read_chunk_data(chunk_length)
 
             # Now, consume the newline.
             self._sock.readline()
@@ -240,6 +441,52 @@ class HTTP11Response(object):
 
         return
 
+    def _read_chunk_data(self, chunk_length):
+        """
+        Reads the data of a single chunk. If it doesn't all arrive in one go,
+        it is read into a buffer the size of the chunk.
+        """
+        chunk = self._sock.recv(chunk_length)
+        if len(chunk) == chunk_length:
+            return chunk.tobytes()
+
+        data = bytearray(chunk_length)
+        view = memoryview(data)
+        received = 0
+
+        while True:
+            if not chunk:
+                raise ConnectionResetError("Remote end hung up!")
+
+            view[received:received + len(chunk)] = chunk
+            received += len(chunk)
+
+            if received == chunk_length:
+                return data
+
+            chunk = self._sock.recv(chunk_length - received)
+
+    def _read_trailers(self):
+        """
+        Reads the trailers that follow the last chunk, up to the blank line
+        that ends the body.
+        """
+        trailers = []
+
+        while True:
+            line = self._sock.readline().tobytes()
+            if not line.strip():
+                break
+
+            name, sep, value = line.partition(b':')
+            if not sep:
+                raise ChunkedDecodeError("Invalid trailer line %r" % line)
+
+            trailers.append((name.strip(), value.strip()))
+
+        if trailers:
+            self.trailers = HTTPHeaderMap(trailers)
+
     def close(self, socket_close=False):
         """
         Close the response. This causes the Response to lose access to the
@@ -249,73 +496,258 @@ class HTTP11Response(object):
         :param socket_close: Whether to close the backing socket.
         :returns: Nothing.
         """
-        if socket_close and self._parent is not None:
-            # The double call is necessary because we need to dereference the
-            # weakref. If the weakref is no longer valid, that's fine, there's
-            # no connection object to tell.
-            parent = self._parent()
-            if parent is not None:
-                parent.close()
+        self._closed = True
+        self._release(socket_close=socket_close)
+
+    def _release(self, socket_close=False):
+        """
+        Gives up access to the backing socket, either because the body has
+        been read in full or because the response is being closed.
+        """
+        # The double call is necessary because we need to dereference the
+        # weakref. If the weakref is no longer valid, that's fine, there's
+        # no connection object to tell.
+        parent = self._parent() if self._parent is not None else None
+
+        if socket_close and parent is not None:
+            parent.close()
+        elif parent is not None and getattr(parent, '_pipeline', False):
+            # Further responses may be queued up behind this one, so get the
+            # rest of the body out of the way.
+            self._drain()
 
         self._sock = None
 
-    def _read_expect_closed(self, decode_content):
+        if self._release_cb is not None:
+            release_cb, self._release_cb = self._release_cb, None
+            release_cb()
+
+    def _drain(self):
+        """
+        Reads whatever is left of the body off the connection into memory, so
+        that the connection can move on to the next response. The body can
+        still be read from this response as normal.
+        """
+        if self._body_complete or self._sock is None:
+            return
+
+        if self._chunked:
+            # Keep the chunked framing intact, so that the body can be decoded
+            # as normal later.
+            chunks = []
+            while True:
+                line = self._sock.readline().tobytes()
+                chunks.append(line)
+                chunk_length = _parse_chunk_length(line)
+
+                if not chunk_length:
+                    break
+
+                chunks.append(self._read_exactly(chunk_length))
+                chunks.append(self._sock.readline().tobytes())
+
+            # Consume any trailers and the final newline.
+            while True:
+                line = self._sock.readline().tobytes()
+                chunks.append(line)
+                if not line.strip():
+                    break
+
+            data = b''.join(chunks)
+        elif self._length is not None:
+            data = self._read_exactly(self._length)
+        else:
+            data = self._read_until_closed()
+
+        log.debug("Drained %d bytes of response body", len(data))
+        self._sock = _DrainedSocket(data)
+        self._body_complete = True
+
+    def _read_exactly(self, amt):
+        """
+        Reads exactly ``amt`` bytes off the socket. The data is written
+        straight into a buffer with room for all of it, so it's copied only
+        once on its way to the caller. Where possible, it's received directly
+        into that buffer, without going through the socket's own buffer.
+        """
+        body = BytesIO()
+
+        # Make room for the whole of the data up front, rather than growing
+        # the buffer as it arrives.
+        if amt > 0:
+            body.seek(amt - 1)
+            body.write(b'\0')
+            body.seek(0)
+
+        # BytesIO.getbuffer() only exists on Python 3.
+        if hasattr(body, 'getbuffer'):
+            view = body.getbuffer()
+            try:
+                self._recv_exactly_into(view)
+            finally:
+                view.release()
+
+            return body.getvalue()
+
+        while amt > 0:
+            try:
+                chunk = self._sock.recv(amt)
+            except ConnectionResetError:
+                chunk = b''
+
+            if not chunk:
+                self._release(socket_close=True)
+                raise ConnectionResetError("Remote end hung up!")
+
+            amt -= len(chunk)
+            body.write(chunk)
+
+        return body.getvalue()
+
+    def _recv_exactly_into(self, view):
+        """
+        Fills a writable memoryview with data from the socket.
+        """
+        received = 0
+
+        while received < len(view):
+            try:
+                count = self._recv_into(view[received:])
+            except ConnectionResetError:
+                count = 0
+
+            if not count:
+                self._release(socket_close=True)
+                raise ConnectionResetError("Remote end hung up!")
+
+            received += count
+
+    def _read_until_closed(self, amt=None):
+        """
+        Reads from the socket until the remote end closes it, or until ``amt``
+        bytes have been read if ``amt`` is given.
+        """
+        body = BytesIO()
+
+        while amt is None or amt > 0:
+            to_read = 65535 if amt is None else amt
+
+            try:
+                chunk = self._sock.recv(to_read)
+            except ConnectionResetError:
+                break
+
+            if not chunk:
+                break
+
+            body.write(chunk)
+            if amt is not None:
+                amt -= len(chunk)
+
+        return body.getvalue()
+
+    def _read_expect_closed(self):
         """
         Implements the logic for an unbounded read on a socket that we expect
         to be closed by the remote end.
         """
         # In this case, just read until we cannot read anymore. Then, close the
-        # socket, becuase we know we have to.
-        chunks = []
-        while True:
-            try:
-                chunk = self._sock.recv(65535).tobytes()
+        # socket, becuase we know we have to. Compressed bodies never get
+        # here: they are read in bounded pieces, so that each piece can be
+        # decompressed as it arrives.
+        data = self._read_until_closed()
+        self._body_complete = True
+        self._release(socket_close=True)
+
+        return data
+
+    def _read_decoded(self, amt):
+        """
+        Reads up to ``amt`` bytes of the decompressed body, or all of it if
+        ``amt`` is ``None``. The decompressor is never asked for more than is
+        wanted, so highly compressed bodies don't balloon in memory.
+        """
+        if amt is None:
+            chunks = []
+            while True:
+                chunk = self._read_decoded(65535)
                 if not chunk:
-                    break
-            except ConnectionResetError:
-                break
-            else:
+                    return b''.join(chunks)
+
                 chunks.append(chunk)
 
-        self.close(socket_close=True)
+        data = self._decoded_buffer[:amt]
+        self._decoded_buffer = self._decoded_buffer[amt:]
+        chunks = [data]
+        remaining = amt - len(data)
 
-        # We may need to decompress the data.
-        data = b''.join(chunks)
-        if decode_content and self._decompressobj:
-            data = self._decompressobj.decompress(data)
-            data += self._decompressobj.flush()
+        while remaining > 0 and self._decompressobj is not None:
+            data = self._decompressobj.decompress(
+                self._unconsumed_tail, remaining
+            )
+            self._unconsumed_tail = self._decompressobj.unconsumed_tail
 
-        return data
+            if not data:
+                raw = self.read(amt, decode_content=False)
+                if raw:
+                    self._unconsumed_tail = raw
+                    continue
+
+                # The body has been read in full.
+                data = self._decompressobj.flush()
+                self._decompressobj = None
+                self._decoded_buffer = data[remaining:]
+                data = data[:remaining]
+
+            chunks.append(data)
+            remaining -= len(data)
+
+        return b''.join(chunks)
 
     def _normal_read_chunked(self, amt, decode_content):
         """
         Implements the logic for calling ``read()`` on a chunked response.
+        Chunks are queued up as they are read, and bounded reads are served
+        from the queue without joining it back together each time.
         """
-        # If we're doing a full read, read it as chunked and then just join
-        # the chunks together!
-        if amt is None:
-            return self._buffered_data + b''.join(self.read_chunked())
-
         if self._chunker is None:
-            self._chunker = self.read_chunked()
-
-        # Otherwise, we have a certain amount of data we want to read.
-        current_amount = len(self._buffered_data)
+            self._chunker = self._read_chunks(decode_content)
 
-        extra_data = [self._buffered_data]
-        while current_amount < amt:
+        while amt is None or self._buffered_size < amt:
             try:
                 chunk = next(self._chunker)
             except StopIteration:
-                self.close(socket_close=self._expect_close)
+                self._release(socket_close=self._expect_close)
                 break
 
-            current_amount += len(chunk)
-            extra_data.append(chunk)
+            if chunk:
+                self._buffered_chunks.append(chunk)
+                self._buffered_size += len(chunk)
+
+        if amt is None:
+            amt = self._buffered_size
+
+        pieces = []
+        while amt > 0 and self._buffered_chunks:
+            chunk = self._buffered_chunks[0]
+            start = self._buffered_offset
+            end = min(start + amt, len(chunk))
+
+            if end == len(chunk):
+                self._buffered_chunks.popleft()
+                self._buffered_offset = 0
+            else:
+                self._buffered_offset = end
+
+            if start == 0 and end == len(chunk):
+                pieces.append(chunk)
+            else:
+                pieces.append(memoryview(chunk)[start:end])
+
+            amt -= end - start
+            self._buffered_size -= end - start
 
-        data = b''.join(extra_data)
-        self._buffered_data = data[amt:]
-        return data[:amt]
+        return join_bytes(pieces)
 
     # The following methods implement the context manager protocol.
     def __enter__(self):
@@ -324,3 +756,34 @@ class HTTP11Response(object):
     def __exit__(self, *args):
         self.close()
         return False  # Never swallow exceptions.
+
+
+def _parse_chunk_length(line):
+    """
+    Parses the line that starts a chunk, returning the length of the chunk.
+    Any chunk extensions are ignored.
+    """
+    try:
+        chunk_length = int(line.split(b';', 1)[0].strip(), 16)
+    except ValueError:
+        chunk_length = -1
+
+    if chunk_length < 0:
+        raise ChunkedDecodeError("Invalid chunk length line %r" % line)
+
+    return chunk_length
+
+
+class _DrainedSocket(object):
+    """
+    Stands in for the socket of a response whose body has been read into
+    memory. The body is served up exactly as it came off the wire.
+    """
+    def __init__(self, data):
+        self._buffer = BytesIO(data)
+
+    def recv(self, amt):
+        return memoryview(self._buffer.read(amt))
+
+    def readline(self):
+        return memoryview(self._buffer.readline())
@@ -8,28 +8,41 @@ Objects that build hyper's connection-level HTTP/2 abstraction.
 from ..tls import wrap_socket, H2_NPN_PROTOCOLS, H2C_PROTOCOL
 from ..common.exceptions import ConnectionResetError
 from ..common.bufsocket import BufferedSocket
+from ..common.encoder import compress_body, get_encoder
 from ..common.headers import HTTPHeaderMap
-from ..common.util import to_host_port_tuple, to_native_string
+from ..common.util import (
+    to_host_port_tuple, to_native_string, to_timeout_tuple
+)
 from ..packages.hyperframe.frame import (
     FRAMES, DataFrame, HeadersFrame, PushPromiseFrame, RstStreamFrame,
     SettingsFrame, Frame, WindowUpdateFrame, GoAwayFrame, PingFrame,
-    BlockedFrame, FRAME_MAX_LEN, FRAME_MAX_ALLOWED_LEN
+    BlockedFrame, PriorityFrame, FRAME_MAX_LEN, FRAME_MAX_ALLOWED_LEN
 )
 from ..packages.hpack.hpack_compat import Encoder, Decoder
-from .stream import Stream
+from .stream import Stream, STATE_IDLE, STATE_CLOSED
+from .priority import PriorityScheduler
 from .response import HTTP20Response, HTTP20Push
-from .window import FlowControlManager
-from .exceptions import ConnectionError, ProtocolError
+from .window import FlowControlManager, MAX_WINDOW_SIZE
+from .exceptions import ConnectionError, ProtocolError, StreamResetError
 from . import errors
 
+import copy
 import errno
 import logging
+import functools
 import socket
+import struct
+import threading
+import time
 
 log = logging.getLogger(__name__)
 
 DEFAULT_WINDOW_SIZE = 65535
 
+# Stream IDs are 31-bit integers. Once we run past the largest one we can't
+# open any more streams on the connection, and must open a new one.
+MAX_STREAM_ID = 2**31 - 1
+
 
 class HTTP20Connection(object):
     """
@@ -41,6 +54,11 @@ class HTTP20Connection(object):
     Most of the standard library's arguments to the constructor are irrelevant
     for HTTP/2 or not supported by hyper.
 
+    The connection is thread-safe: many threads may make requests and read
+    responses at once, as long as each passes the stream ID returned by
+    :meth:`request() <hyper.HTTP20Connection.request>` to
+    :meth:`get_response() <hyper.HTTP20Connection.get_response>`.
+
     :param host: The host to connect to. This may be an IP address or a
         hostname, and optionally may include a port: for example,
         ``'http2bin.org'``, ``'http2bin.org:443'`` or ``'127.0.0.1'``.
@@ -64,9 +82,63 @@ class HTTP20Connection(object):
         or a host name and may include a port.
     :param proxy_port: (optional) The proxy port to connect to. If not provided
         and one also isn't provided in the ``proxy`` parameter, defaults to 8080.
+    :param keepalive: (optional) The number of seconds the connection may go
+        without hearing from the server before it is checked with a PING ahead
+        of the next request. If the server doesn't answer, the connection is
+        dropped and a new one is opened. If not provided, connections are
+        never checked.
+    :param initial_window_size: (optional) The size of the flow control
+        window, in bytes, to give the server for the connection and for each
+        stream. Larger windows let the server send more data per round trip.
+        Defaults to 65,535 bytes, the default in the spec.
+    :param max_frame_size: (optional) The largest frame, in bytes, the server
+        may send us. Must be between 16,384 and 16,777,215 bytes. Defaults to
+        16,384 bytes, the default in the spec.
+    :param header_table_size: (optional) The size, in bytes, of the table the
+        server may use to compress the headers it sends us. Defaults to 4,096
+        bytes, the default in the spec.
+    :param max_concurrent_streams: (optional) The maximum number of streams
+        the server may open to us at once, which limits how many resources
+        can be pushed concurrently. If not provided, there is no limit.
+    :param max_stream_buffer_size: (optional) The most response data, in
+        bytes, to hold in memory for a single stream before the server is
+        asked to stop sending. Once the buffer is full, the flow control
+        window for that stream isn't increased until it has been read from.
+        If not provided, buffers are unlimited.
+    :param max_buffer_size: (optional) As ``max_stream_buffer_size``, but
+        counting the data held for all streams on the connection, and
+        applying to the connection's flow control window. So that reads can
+        always make progress, the window is still increased if we would
+        otherwise be left waiting for data. If not provided, buffers are
+        unlimited.
+    :param interleave_bodies: (optional) Whether request bodies should be
+        interleaved according to stream priority. If ``True``,
+        :meth:`request() <hyper.HTTP20Connection.request>` returns as soon as
+        the headers are sent, and bodies are sent a chunk at a time whenever
+        the connection is next used, with each stream getting a share in
+        proportion to its weight. Defaults to ``False``, in which case each
+        body is sent in full before ``request()`` returns.
+    :param compress_requests: (optional) The content coding, ``'gzip'`` or
+        ``'deflate'``, to compress request bodies with. Bodies are compressed
+        as they are sent, and a ``Content-Encoding`` header is added. Bodies
+        that already have a ``Content-Encoding`` or ``Content-Length`` header
+        are sent as they are. If not provided, bodies aren't compressed.
+    :param compress_threshold: (optional) Bodies known to be smaller than this
+        many bytes are sent uncompressed. Defaults to 1,024 bytes.
+    :param timeout: (optional) How long to wait for the server, in seconds:
+        either a single number, or a ``(connect, read)`` tuple. The read
+        timeout applies to each wait for a response or for more of its body,
+        and ``None`` waits forever. Defaults to 5 seconds for both, as for
+        :class:`HTTP11Connection <hyper.HTTP11Connection>`.
     """
     def __init__(self, host, port=None, secure=None, window_manager=None, enable_push=False,
-                 ssl_context=None, proxy_host=None, proxy_port=None, **kwargs):
+                 ssl_context=None, proxy_host=None, proxy_port=None,
+                 keepalive=None, interleave_bodies=False,
+                 initial_window_size=None, max_frame_size=None,
+                 header_table_size=None, max_concurrent_streams=None,
+                 max_stream_buffer_size=None, max_buffer_size=None,
+                 compress_requests=None, compress_threshold=1024,
+                 timeout=None, **kwargs):
         """
         Creates an HTTP/2 connection to a specific server.
         """
@@ -84,6 +156,7 @@ class HTTP20Connection(object):
 
         self._enable_push = enable_push
         self.ssl_context = ssl_context
+        self._timeout = timeout
 
         # Setup proxy details if applicable.
         if proxy_host:
@@ -101,6 +174,88 @@ class HTTP20Connection(object):
         #: Defaults to 64kB.
         self.network_buffer_size = 65536
 
+        #: The number of seconds the connection may sit quiet before it is
+        #: checked with a PING ahead of the next request, or ``None``.
+        self.keepalive = keepalive
+
+        self._interleave_bodies = interleave_bodies
+
+        # Check the coding up front, rather than on the first request.
+        if compress_requests is not None:
+            get_encoder(compress_requests)
+
+        self._compress_requests = compress_requests
+        self._compress_threshold = compress_threshold
+
+        self._max_stream_buffer_size = max_stream_buffer_size
+        self._max_buffer_size = max_buffer_size
+
+        # The settings we send to the remote peer in our preamble. Anything
+        # left out keeps the value defined in the spec.
+        self._local_settings = {
+            SettingsFrame.ENABLE_PUSH: int(enable_push),
+        }
+
+        if initial_window_size is not None:
+            if not 0 <= initial_window_size <= MAX_WINDOW_SIZE:
+                raise ValueError(
+                    "Window size %d is outside of allowed range" %
+                    initial_window_size
+                )
+
+            self._local_settings[SettingsFrame.INITIAL_WINDOW_SIZE] = (
+                initial_window_size
+            )
+
+        if max_frame_size is not None:
+            if not FRAME_MAX_LEN <= max_frame_size <= FRAME_MAX_ALLOWED_LEN:
+                raise ValueError(
+                    "Frame size %d is outside of allowed range" %
+                    max_frame_size
+                )
+
+            self._local_settings[SettingsFrame.SETTINGS_MAX_FRAME_SIZE] = (
+                max_frame_size
+            )
+
+        if header_table_size is not None:
+            self._local_settings[SettingsFrame.HEADER_TABLE_SIZE] = (
+                header_table_size
+            )
+
+        if max_concurrent_streams is not None:
+            self._local_settings[SettingsFrame.MAX_CONCURRENT_STREAMS] = (
+                max_concurrent_streams
+            )
+
+        self._initial_window_size = self._local_settings.get(
+            SettingsFrame.INITIAL_WINDOW_SIZE, DEFAULT_WINDOW_SIZE
+        )
+        self._max_frame_size = self._local_settings.get(
+            SettingsFrame.SETTINGS_MAX_FRAME_SIZE, FRAME_MAX_LEN
+        )
+
+        # The connection may be shared by many threads, so its state is
+        # guarded by a lock. Only one thread reads frames at a time: while it
+        # waits for the server it lets go of the lock, so that other threads
+        # can carry on sending requests, and any other thread that wants
+        # frames waits on the condition until it's done. Each time frames are
+        # read the counter goes up. The reading thread itself may need to read
+        # more while handling a frame, for example to drain streams when the
+        # connection is replaced, so we keep track of which thread it is.
+        self._lock = threading.RLock()
+        self._frames_read_condition = threading.Condition(self._lock)
+        self._reading = False
+        self._reader = None
+        self._frames_read = 0
+
+        # When the connection is replaced, the old one is kept open until the
+        # responses the server was still sending on it have been read. Such a
+        # connection is draining, and the connection that replaced it keeps
+        # track of it.
+        self._retired = []
+        self._draining = False
+
         # Create the mutable state.
         self.__wm_class = window_manager or FlowControlManager
         self.__init_state()
@@ -132,12 +287,28 @@ class HTTP20Connection(object):
         self.next_stream_id = 1
         self.reset_streams = set()
 
+        # Streams that were replayed on a new connection after the server
+        # refused to process them, keyed off the stream ID they were
+        # originally given. This allows users to keep using that ID.
+        self._retried_streams = {}
+
+        # The last stream ID the remote peer has promised to process, as
+        # advertised in a GOAWAY frame. If this is not None, the server has
+        # asked us to go away and no new streams may be opened on this
+        # connection.
+        self._goaway_last_stream_id = None
+
         # Header encoding/decoding is at the connection scope, so we embed a
         # header encoder and a decoder. These get passed to child stream
         # objects.
         self.encoder = Encoder()
         self.decoder = Decoder()
 
+        if SettingsFrame.HEADER_TABLE_SIZE in self._local_settings:
+            self.decoder.header_table_size = (
+                self._local_settings[SettingsFrame.HEADER_TABLE_SIZE]
+            )
+
         # Values for the settings used on an HTTP/2 connection.
         self._settings = {
             SettingsFrame.INITIAL_WINDOW_SIZE: DEFAULT_WINDOW_SIZE,
@@ -150,12 +321,138 @@ class HTTP20Connection(object):
         # The inbound and outbound flow control windows.
         self._out_flow_control_window = 65535
 
-        # Instantiate a window manager.
-        self.window_manager = self.__wm_class(65535)
+        # Instantiate a window manager. The connection window starts at the
+        # default size, but is enlarged in the preamble to match the stream
+        # windows.
+        self.window_manager = self.__wm_class(self._initial_window_size)
+
+        # The number of bytes of response data buffered across all streams,
+        # and connection window increments held back because it's too many.
+        self._buffered_size = 0
+        self._withheld_window = 0
+
+        # The scheduler that decides which request body gets sent next.
+        self._scheduler = PriorityScheduler()
+
+        # PINGs we have sent and not yet had acknowledged, keyed off their
+        # opaque data, with the time they were sent. Once acknowledged, the
+        # measured round-trip time is moved to the dictionary of completed
+        # pings until it's collected.
+        self._next_ping_id = 0
+        self._pings_in_flight = {}
+        self._completed_pings = {}
+
+        # The smoothed round-trip time estimate, and when we last heard
+        # anything from the remote peer. We also time how long our initial
+        # SETTINGS take to be acknowledged, for a first estimate.
+        self._smoothed_rtt = None
+        self._settings_sent = None
+        self._last_received = None
 
         return
 
-    def request(self, method, url, body=None, headers={}):
+    @property
+    def rtt(self):
+        """
+        The smoothed estimate of the round-trip time to the server in seconds,
+        or ``None`` if it has not been measured yet. The estimate is updated
+        with each acknowledged :meth:`ping() <hyper.HTTP20Connection.ping>`,
+        weighting the newest sample by 1/8 in the manner of TCP's smoothed RTT
+        (RFC 6298).
+        """
+        return self._smoothed_rtt
+
+    def ping(self, timeout=None):
+        """
+        Sends a PING frame to the server and waits for it to be acknowledged.
+        Any other frames that arrive in the meantime are processed as normal.
+
+        :param timeout: (optional) How long to wait for the acknowledgement, in
+            seconds. Defaults to the connection's read timeout. If it runs
+            out, ``socket.timeout`` is raised.
+        :returns: The measured round-trip time in seconds.
+        """
+        if timeout is None:
+            timeout = to_timeout_tuple(self._timeout, default=5)[1]
+
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        with self._lock:
+            self.connect()
+
+            opaque_data = struct.pack('!Q', self._next_ping_id)
+            self._next_ping_id += 1
+
+            f = PingFrame(0)
+            f.opaque_data = opaque_data
+            self._pings_in_flight[opaque_data] = time.time()
+            self._send_cb(f)
+
+            while opaque_data in self._pings_in_flight:
+                if timeout is None:
+                    self._read_frames()
+                    continue
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    del self._pings_in_flight[opaque_data]
+                    raise socket.timeout("Timed out waiting for the server")
+
+                self._read_frames(remaining)
+
+            return self._completed_pings.pop(opaque_data)
+
+    def _record_ping_ack(self, opaque_data):
+        """
+        Handles the acknowledgement of a PING we sent, updating the smoothed
+        round-trip time estimate.
+        """
+        try:
+            sent = self._pings_in_flight.pop(opaque_data)
+        except KeyError:
+            log.warning("Received unexpected PING acknowledgement")
+            return
+
+        rtt = time.time() - sent
+        self._completed_pings[opaque_data] = rtt
+        self._record_rtt(rtt)
+
+    def _record_rtt(self, rtt):
+        """
+        Updates the smoothed round-trip time estimate with a new sample, and
+        passes it on to the flow control managers.
+        """
+        if self._smoothed_rtt is None:
+            self._smoothed_rtt = rtt
+        else:
+            self._smoothed_rtt += (rtt - self._smoothed_rtt) / 8.0
+
+        self.window_manager.rtt = self._smoothed_rtt
+        for stream in self.streams.values():
+            stream._in_window_manager.rtt = self._smoothed_rtt
+
+    def _check_alive(self):
+        """
+        Checks that a connection that has been quiet for longer than the
+        keepalive interval is still alive, by pinging it. If it isn't, or it
+        doesn't answer within the keepalive interval, the connection is closed
+        so that the next request opens a new one.
+        """
+        if (self._sock is None or
+                self.keepalive is None or
+                self._last_received is None or
+                time.time() - self._last_received < self.keepalive):
+            return
+
+        try:
+            self.ping(timeout=self.keepalive)
+        except (socket.error, ConnectionResetError) as e:
+            log.info("Connection failed keepalive check: %s", e)
+            self.close()
+
+    def request(self, method, url, body=None, headers={}, weight=None,
+                depends_on=None, exclusive=False, timeout=None):
         """
         This will send a request to the server using the HTTP request method
         ``method`` and the selector ``url``. If the ``body`` argument is
@@ -169,26 +466,72 @@ class HTTP20Connection(object):
         :param body: (optional) The request body to send. Must be a bytestring
             or a file-like object.
         :param headers: (optional) The headers to send on the request.
+        :param weight: (optional) The weight of the request's stream, between
+            1 and 256. Streams with higher weights get a larger share of the
+            connection. Defaults to 16.
+        :param depends_on: (optional) The stream ID of a request this request
+            depends on. It only gets a share of the connection once that
+            request's stream has nothing to send.
+        :param exclusive: (optional) Whether this request should become the
+            only dependency of ``depends_on``.
+        :param timeout: (optional) How long to wait for the server while
+            making this request and reading its response, overriding the
+            ``timeout`` given to the constructor.
         :returns: A stream ID for the request.
         """
-        stream_id = self.putrequest(method, url)
+        with self._lock:
+            if timeout is not None and self._sock is None:
+                self._connect(timeout)
+
+            stream_id = self.putrequest(
+                method, url, weight=weight, depends_on=depends_on,
+                exclusive=exclusive
+            )
 
-        default_headers = (':method', ':scheme', ':authority', ':path')
-        for name, value in headers.items():
-            is_default = to_native_string(name) in default_headers
-            self.putheader(name, value, stream_id, replace=is_default)
+            if timeout is not None:
+                stream = self._get_stream(stream_id)
+                stream._timeout = to_timeout_tuple(timeout)[1]
+
+            default_headers = (':method', ':scheme', ':authority', ':path')
+            for name, value in headers.items():
+                is_default = to_native_string(name) in default_headers
+                self.putheader(name, value, stream_id, replace=is_default)
+
+            # Convert the body to bytes if needed.
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+
+            # We may need to compress the body.
+            names = set(to_native_string(n).lower() for n in headers)
+            if (body and self._compress_requests and
+                    'content-encoding' not in names and
+                    'content-length' not in names):
+                compressed = compress_body(
+                    body, self._compress_requests, self._compress_threshold
+                )
 
-        # Convert the body to bytes if needed.
-        if isinstance(body, str):
-            body = body.encode('utf-8')
+                if compressed is not None:
+                    self.putheader(
+                        'content-encoding', self._compress_requests, stream_id
+                    )
+                    body = compressed
 
-        self.endheaders(message_body=body, final=True, stream_id=stream_id)
+            self.endheaders(message_body=body, final=True, stream_id=stream_id)
 
-        return stream_id
+            return stream_id
 
     def _get_stream(self, stream_id):
-        return (self.streams[stream_id] if stream_id is not None
-                else self.recent_stream)
+        if stream_id is None:
+            return self.recent_stream
+
+        if stream_id in self.streams:
+            return self.streams[stream_id]
+
+        for retired in self._retired:
+            if stream_id in retired.streams:
+                return retired.streams[stream_id]
+
+        return self._retried_streams[stream_id]
 
     def get_response(self, stream_id=None):
         """
@@ -203,7 +546,12 @@ class HTTP20Connection(object):
             get a response.
         :returns: A :class:`HTTP20Response <hyper.HTTP20Response>` object.
         """
-        stream = self._get_stream(stream_id)
+        with self._lock:
+            stream = self._get_stream(stream_id)
+
+            # The request has to be sent before the response can come back.
+            self._send_bodies(stream)
+
         return HTTP20Response(stream.getheaders(), stream)
 
     def get_pushes(self, stream_id=None, capture_all=False):
@@ -237,30 +585,40 @@ class HTTP20Connection(object):
 
         :returns: Nothing.
         """
-        if self._sock is None:
-            if not self.proxy_host:
-                host = self.host
-                port = self.port
-            else:
-                host = self.proxy_host
-                port = self.proxy_port
+        with self._lock:
+            if self._sock is None:
+                self._connect(self._timeout)
 
-            sock = socket.create_connection((host, port), 5)
+            return
 
-            if self.secure:
-                assert not self.proxy_host, "Using a proxy with HTTPS not yet supported."
-                sock, proto = wrap_socket(sock, host, self.ssl_context)
-            else:
-                proto = H2C_PROTOCOL
+    def _connect(self, timeout):
+        """
+        Opens the connection, applying the given timeout to the socket. Must
+        be called with the lock held.
+        """
+        if not self.proxy_host:
+            host = self.host
+            port = self.port
+        else:
+            host = self.proxy_host
+            port = self.proxy_port
+
+        connect_timeout, read_timeout = to_timeout_tuple(timeout, default=5)
+        sock = socket.create_connection((host, port), connect_timeout)
 
-            log.debug("Selected NPN protocol: %s", proto)
-            assert proto in H2_NPN_PROTOCOLS or proto == H2C_PROTOCOL
+        if self.secure:
+            assert not self.proxy_host, "Using a proxy with HTTPS not yet supported."
+            sock, proto = wrap_socket(sock, host, self.ssl_context)
+        else:
+            proto = H2C_PROTOCOL
 
-            self._sock = BufferedSocket(sock, self.network_buffer_size)
+        log.debug("Selected NPN protocol: %s", proto)
+        assert proto in H2_NPN_PROTOCOLS or proto == H2C_PROTOCOL
 
-            self._send_preamble()
+        sock.settimeout(read_timeout)
+        self._sock = BufferedSocket(sock, self.network_buffer_size)
 
-        return
+        self._send_preamble()
 
     def _send_preamble(self):
         """
@@ -270,8 +628,17 @@ class HTTP20Connection(object):
         # connection, followed by an initial settings frame.
         self._sock.send(b'PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n')
         f = SettingsFrame(0)
-        f.settings[SettingsFrame.ENABLE_PUSH] = int(self._enable_push)
+        f.settings.update(self._local_settings)
         self._send_cb(f)
+        self._settings_sent = time.time()
+
+        # The connection window can only be changed with a WINDOW_UPDATE.
+        if self._initial_window_size > DEFAULT_WINDOW_SIZE:
+            w = WindowUpdateFrame(0)
+            w.window_increment = (
+                self._initial_window_size - DEFAULT_WINDOW_SIZE
+            )
+            self._send_cb(w)
 
         # The server will also send an initial settings frame, so get it.
         self._recv_cb()
@@ -283,22 +650,30 @@ class HTTP20Connection(object):
         :param error_code: (optional) The error code to reset all streams with.
         :returns: Nothing.
         """
-        # Close all streams
-        for stream in list(self.streams.values()):
-            log.debug("Close stream %d" % stream.stream_id)
-            stream.close(error_code)
+        with self._lock:
+            # Close all streams, including any still draining from
+            # connections this one replaced.
+            for retired in self._retired:
+                retired.close(error_code)
 
-        # Send GoAway frame to the server
-        try:
-            self._send_cb(GoAwayFrame(0), True)
-        except Exception as e:  # pragma: no cover
-            log.warn("GoAway frame could not be sent: %s" % e)
+            self._retired = []
 
-        if self._sock is not None:
-            self._sock.close()
-            self.__init_state()
+            for stream in list(self.streams.values()):
+                log.debug("Close stream %d" % stream.stream_id)
+                stream.close(error_code)
 
-    def putrequest(self, method, selector, **kwargs):
+            # Send GoAway frame to the server
+            try:
+                self._send_cb(GoAwayFrame(0), True)
+            except Exception as e:  # pragma: no cover
+                log.warn("GoAway frame could not be sent: %s" % e)
+
+            if self._sock is not None:
+                self._sock.close()
+                self.__init_state()
+
+    def putrequest(self, method, selector, weight=None, depends_on=None,
+                   exclusive=False, **kwargs):
         """
         This should be the first call for sending a given HTTP request to a
         server. It returns a stream ID for the given connection that should be
@@ -306,23 +681,44 @@ class HTTP20Connection(object):
 
         :param method: The request method, e.g. ``'GET'``.
         :param selector: The path selector.
+        :param weight: (optional) The weight of the request's stream, between
+            1 and 256. Defaults to 16.
+        :param depends_on: (optional) The stream ID of a request this request
+            depends on.
+        :param exclusive: (optional) Whether this request should become the
+            only dependency of ``depends_on``.
         :returns: A stream ID for the request.
         """
-        # Create a new stream.
-        s = self._new_stream()
-
-        # To this stream we need to immediately add a few headers that are
-        # HTTP/2 specific. These are: ":method", ":scheme", ":authority" and
-        # ":path". We can set all of these now.
-        s.add_header(":method", method)
-        s.add_header(":scheme", "https" if self.secure else "http")
-        s.add_header(":authority", self.host)
-        s.add_header(":path", selector)
-
-        # Save the stream.
-        self.recent_stream = s
-
-        return s.stream_id
+        with self._lock:
+            # Make sure a connection that has been quiet for a while is still
+            # there before we put another request on it.
+            self._check_alive()
+
+            # If we've run out of stream IDs, or the server has asked us to go
+            # away, new streams have to go on a new connection.
+            if self._sock is not None and (
+                    self.next_stream_id > MAX_STREAM_ID or
+                    self._goaway_last_stream_id is not None):
+                self._rollover()
+
+            # Create a new stream.
+            s = self._new_stream()
+            s.weight = weight
+            s.depends_on = depends_on
+            s.exclusive = exclusive
+
+            # To this stream we need to immediately add a few headers that are
+            # HTTP/2 specific. These are: ":method", ":scheme", ":authority"
+            # and ":path". We can set all of these now.
+            s.add_header(":method", method)
+            s.add_header(":scheme", "https" if self.secure else "http")
+            s.add_header(":authority", self.host)
+            s.add_header(":path", selector)
+
+            # Save the stream.
+            self.recent_stream = s
+
+            return s.stream_id
 
     def putheader(self, header, argument, stream_id=None, replace=False):
         """
@@ -345,10 +741,11 @@ class HTTP20Connection(object):
             header to.
         :returns: Nothing.
         """
-        stream = self._get_stream(stream_id)
-        stream.add_header(header, argument, replace)
+        with self._lock:
+            stream = self._get_stream(stream_id)
+            stream.add_header(header, argument, replace)
 
-        return
+            return
 
     def endheaders(self, message_body=None, final=False, stream_id=None):
         """
@@ -368,19 +765,30 @@ class HTTP20Connection(object):
             sending the headers on.
         :returns: Nothing.
         """
-        self.connect()
+        with self._lock:
+            self.connect()
 
-        stream = self._get_stream(stream_id)
+            stream = self._get_stream(stream_id)
 
-        # Close this if we've been told no more data is coming and we don't
-        # have any to send.
-        stream.open(final and message_body is None)
+            # Hang on to complete request bodies so that the request can be
+            # replayed if the server refuses to process it.
+            stream._replayable = final and not hasattr(message_body, 'read')
+            stream._replay_body = message_body
 
-        # Send whatever data we have.
-        if message_body is not None:
-            stream.send_data(message_body, final)
+            # Close this if we've been told no more data is coming and we don't
+            # have any to send.
+            stream.open(final and message_body is None)
 
-        return
+            # Send whatever data we have.
+            if message_body is not None:
+                self._scheduler.add(
+                    stream, stream._chunks(message_body), final
+                )
+
+                if not self._interleave_bodies:
+                    self._send_bodies(stream)
+
+            return
 
     def send(self, data, final=False, stream_id=None):
         """
@@ -396,10 +804,58 @@ class HTTP20Connection(object):
             data on.
         :returns: Nothing.
         """
-        stream = self._get_stream(stream_id)
-        stream.send_data(data, final)
+        with self._lock:
+            stream = self._get_stream(stream_id)
+            stream._replayable = False
+            self._scheduler.add(stream, stream._chunks(data), final)
+            self._send_bodies(stream)
 
-        return
+            return
+
+    def set_priority(self, stream_id=None, weight=None, depends_on=None,
+                     exclusive=False):
+        """
+        Changes the priority of a request that has already been made, and
+        tells the server about the change.
+
+        :param stream_id: (optional) The stream ID of the request to change.
+        :param weight: (optional) The new weight of the request's stream,
+            between 1 and 256. Defaults to 16.
+        :param depends_on: (optional) The stream ID of a request this request
+            now depends on. Defaults to no dependency.
+        :param exclusive: (optional) Whether this request should become the
+            only dependency of ``depends_on``.
+        :returns: Nothing.
+        """
+        with self._lock:
+            stream = self._get_stream(stream_id)
+            stream.weight = weight
+            stream.depends_on = depends_on
+            stream.exclusive = exclusive
+
+            f = PriorityFrame(stream.stream_id)
+            f.depends_on = depends_on or 0
+            f.stream_weight = (weight or 16) - 1
+            f.exclusive = exclusive
+            self._send_cb(f)
+
+    def _send_bodies(self, stream=None):
+        """
+        Sends queued request bodies, interleaved by priority, until the body
+        of the given stream has been sent. If no stream is given, sends
+        everything.
+        """
+        while self._scheduler.pending(stream):
+            chunk = self._scheduler.next()
+
+            if chunk is None:
+                # Everything waiting is flow controlled. Read frames until a
+                # window opens up.
+                self._recv_cb()
+                continue
+
+            send_stream, data, final = chunk
+            send_stream._send_chunk(data, final)
 
     def receive_frame(self, frame):
         """
@@ -414,8 +870,13 @@ class HTTP20Connection(object):
                 p.flags.add('ACK')
                 p.opaque_data = frame.opaque_data
                 self._send_cb(p, True)
+            else:
+                self._record_ping_ack(frame.opaque_data)
         elif frame.type == SettingsFrame.type:
-            if 'ACK' not in frame.flags:
+            if 'ACK' in frame.flags and self._settings_sent is not None:
+                self._record_rtt(time.time() - self._settings_sent)
+                self._settings_sent = None
+            elif 'ACK' not in frame.flags:
                 self._update_settings(frame)
 
                 # When the setting containing the max frame size value is out
@@ -428,28 +889,40 @@ class HTTP20Connection(object):
                     self._send_cb(f)
         elif frame.type == GoAwayFrame.type:
             # If we get GoAway with error code zero, we are doing a graceful
-            # shutdown and all is well. Otherwise, throw an exception.
+            # shutdown and all is well. Streams the server has agreed to
+            # process may carry on, but anything it refused needs to move to a
+            # new connection. Otherwise, throw an exception.
+            if frame.error_code == 0:
+                self._goaway_last_stream_id = frame.last_stream_id
+
+                if any(self._is_unprocessed(stream_id)
+                       for stream_id in self.streams):
+                    self._rollover()
+                elif all(s._remote_closed for s in self.streams.values()):
+                    self.close()
+
+                return
+
             self.close()
 
             # If an error occured, try to read the error description from
             # code registry otherwise use the frame's additional data.
-            if frame.error_code != 0:
-                try:
-                    name, number, description = errors.get_data(
-                        frame.error_code
-                    )
-                except ValueError:
-                    error_string = (
-                        "Encountered error code %d, extra data %s" %
-                        (frame.error_code, frame.additional_data)
-                    )
-                else:
-                    error_string = (
-                        "Encountered error %s %s: %s" %
-                        (name, number, description)
-                    )
+            try:
+                name, number, description = errors.get_data(
+                    frame.error_code
+                )
+            except ValueError:
+                error_string = (
+                    "Encountered error code %d, extra data %s" %
+                    (frame.error_code, frame.additional_data)
+                )
+            else:
+                error_string = (
+                    "Encountered error %s %s: %s" %
+                    (name, number, description)
+                )
 
-                raise ConnectionError(error_string)
+            raise ConnectionError(error_string)
 
         elif frame.type == BlockedFrame.type:
             increment = self.window_manager._blocked()
@@ -489,6 +962,11 @@ class HTTP20Connection(object):
 
             self._settings[SettingsFrame.INITIAL_WINDOW_SIZE] = newsize
 
+        if SettingsFrame.MAX_CONCURRENT_STREAMS in frame.settings:
+            self._settings[SettingsFrame.MAX_CONCURRENT_STREAMS] = (
+                frame.settings[SettingsFrame.MAX_CONCURRENT_STREAMS]
+            )
+
         if SettingsFrame.SETTINGS_MAX_FRAME_SIZE in frame.settings:
             new_size = frame.settings[SettingsFrame.SETTINGS_MAX_FRAME_SIZE]
             if FRAME_MAX_LEN <= new_size <= FRAME_MAX_ALLOWED_LEN:
@@ -514,32 +992,209 @@ class HTTP20Connection(object):
         """
         window_size = self._settings[SettingsFrame.INITIAL_WINDOW_SIZE]
         s = Stream(
-            stream_id or self.next_stream_id, self._send_cb, self._recv_cb,
+            stream_id or self.next_stream_id, self._send_cb, None,
             self._close_stream, self.encoder, self.decoder,
-            self.__wm_class(DEFAULT_WINDOW_SIZE), local_closed
+            self.__wm_class(self._initial_window_size), local_closed
         )
+        s._recv_cb = functools.partial(self._recv_for_stream, s)
+        s._buffered_cb = self._record_buffered
+        s._lock = self._lock
+        s._timeout = to_timeout_tuple(self._timeout, default=5)[1]
         s._out_flow_control_window = window_size
+        s._in_window_manager.rtt = self._smoothed_rtt
+        s._max_buffer_size = self._max_stream_buffer_size
         self.streams[s.stream_id] = s
         self.next_stream_id += 2
 
         return s
 
+    def _is_unprocessed(self, stream_id):
+        """
+        Whether the remote peer has told us, by way of a GOAWAY frame, that it
+        will not process the given stream. This only applies to streams we
+        initiated, which always have odd stream IDs.
+        """
+        return (self._goaway_last_stream_id is not None and
+                stream_id % 2 == 1 and
+                stream_id > self._goaway_last_stream_id)
+
+    def _rollover(self):
+        """
+        Replaces the underlying TCP connection with a new one. This happens
+        when we run out of stream IDs, or when the server sends a graceful
+        GOAWAY.
+
+        Streams the server is processing drain: the old connection is kept
+        open, and closed once their responses have been read. Streams the
+        server refused to process are replayed on the new connection, as the
+        spec allows, or failing that are reset. Queued request bodies are sent
+        before the new connection is opened, but streams that are still open
+        for more calls to ``send()`` can't be moved, and are cancelled.
+        """
+        log.info("Rolling HTTP/2 connection over to a new connection")
+
+        # Finish sending requests the server has agreed to process.
+        for stream in list(self.streams.values()):
+            if self._is_unprocessed(stream.stream_id):
+                self._scheduler.remove(stream)
+
+        self._send_bodies()
+
+        drained = {}
+        retried = []
+        refused = {}
+
+        for stream_id, stream in sorted(self.streams.items()):
+            if stream.state == STATE_IDLE or self._is_unprocessed(stream_id):
+                if stream.state == STATE_IDLE or stream._replayable:
+                    retried.append(stream)
+                else:
+                    # Whoever is reading the stream finds out when they next
+                    # ask for frames.
+                    log.warning(
+                        "Stream %d was refused by the server and cannot be "
+                        "retried", stream_id
+                    )
+                    stream.state = STATE_CLOSED
+                    stream._reset_error_code = 7  # 7 = REFUSED_STREAM
+                    refused[stream_id] = stream
+            elif stream._local_closed:
+                drained[stream_id] = stream
+            else:
+                log.warning(
+                    "Cancelling stream %d: it cannot be moved to a new "
+                    "connection", stream_id
+                )
+                self._send_rst_frame(stream_id, 8)  # 8 = CANCEL
+
+        try:
+            self._send_cb(GoAwayFrame(0), True)
+        except Exception as e:  # pragma: no cover
+            log.warn("GoAway frame could not be sent: %s" % e)
+
+        self._retired = [r for r in self._retired if r._sock is not None]
+
+        if drained:
+            self._retired.append(self._retire(drained))
+        else:
+            self._sock.close()
+
+        # Carry over the state the user can still see. Stream IDs keep
+        # counting up unless they've run out: this keeps the IDs of drained
+        # streams unique.
+        next_stream_id = self.next_stream_id
+        if next_stream_id > MAX_STREAM_ID:
+            next_stream_id = 1
+
+        recent_stream = self.recent_stream
+        retried_streams = self._retried_streams
+
+        self.__init_state()
+
+        self.next_stream_id = next_stream_id
+        self.recent_stream = recent_stream
+        self._retried_streams = retried_streams
+
+        # Refused streams stay where their readers can find them until they
+        # are closed.
+        self.streams.update(refused)
+
+        for stream in retried:
+            self._retry_stream(stream)
+
+    def _retire(self, streams):
+        """
+        Hands the connection state, socket included, over to a new connection
+        object that carries on receiving the given streams. It shares our
+        lock, and the record of retried streams so that it's kept up to date
+        as they close. It closes itself once the last of the streams is
+        closed.
+        """
+        retired = copy.copy(self)
+        retired.streams = streams
+        retired._retired = []
+        retired._draining = True
+        retired._reading = False
+        retired._reader = None
+
+        for stream in streams.values():
+            stream._data_cb = retired._send_cb
+            stream._close_cb = retired._close_stream
+            stream._buffered_cb = retired._record_buffered
+            stream._recv_cb = functools.partial(
+                retired._recv_for_stream, stream
+            )
+
+        return retired
+
+    def _retry_stream(self, stream):
+        """
+        Moves a stream the server never processed onto this connection under a
+        new stream ID. If the request had already been sent, it's sent again.
+        """
+        old_stream_id = stream.stream_id
+        was_sent = stream.state != STATE_IDLE
+
+        stream._reset(
+            self.next_stream_id,
+            self.encoder,
+            self.decoder,
+            self.__wm_class(self._initial_window_size)
+        )
+        stream._in_window_manager.rtt = self._smoothed_rtt
+        stream._out_flow_control_window = (
+            self._settings[SettingsFrame.INITIAL_WINDOW_SIZE]
+        )
+        self.streams[stream.stream_id] = stream
+        self.next_stream_id += 2
+        self._retried_streams[old_stream_id] = stream
+
+        log.debug(
+            "Stream %d moved to stream %d", old_stream_id, stream.stream_id
+        )
+
+        if was_sent:
+            self.endheaders(
+                message_body=stream._replay_body,
+                final=True,
+                stream_id=stream.stream_id
+            )
+
     def _close_stream(self, stream_id, error_code=None):
         """
         Called by a stream when it would like to be 'closed'.
         """
-        # Graceful shutdown of streams involves not emitting an error code
-        # at all.
-        if error_code:
-            self._send_rst_frame(stream_id, error_code)
-        else:
-            # Just delete the stream.
-            try:
-                del self.streams[stream_id]
-            except KeyError as e:  # pragma: no cover
-                log.warn(
-                    "Stream with id %d does not exist: %s",
-                    stream_id, e)
+        with self._lock:
+            # Graceful shutdown of streams involves not emitting an error code
+            # at all.
+            if error_code:
+                self._send_rst_frame(stream_id, error_code)
+            else:
+                # Just delete the stream.
+                try:
+                    stream = self.streams.pop(stream_id)
+                except KeyError as e:  # pragma: no cover
+                    log.warn(
+                        "Stream with id %d does not exist: %s",
+                        stream_id, e)
+                else:
+                    self._unbuffer(stream)
+
+                self._forget_retried(stream_id)
+
+            # A connection that has been replaced is done with once its last
+            # stream is.
+            if self._draining and not self.streams:
+                log.debug("Closing drained connection")
+                self.close()
+
+    def _forget_retried(self, stream_id):
+        """
+        Stops looking up a stream by the IDs it had before it was retried.
+        """
+        for old_stream_id, stream in list(self._retried_streams.items()):
+            if stream.stream_id == stream_id:
+                del self._retried_streams[old_stream_id]
 
     def _send_cb(self, frame, tolerate_peer_gone=False):
         """
@@ -549,37 +1204,39 @@ class HTTP20Connection(object):
         and send it on the connection. It does so obeying the connection-level
         flow-control principles of HTTP/2.
         """
-        # Maintain our outgoing flow-control window.
-        if frame.type == DataFrame.type:
-            # If we don't have room in the flow control window, we need to look
-            # for a Window Update frame.
-            while self._out_flow_control_window < len(frame.data):
-                self._recv_cb()
-
-            self._out_flow_control_window -= len(frame.data)
-
-        data = frame.serialize()
+        with self._lock:
+            # Maintain our outgoing flow-control window.
+            if frame.type == DataFrame.type:
+                # If we don't have room in the flow control window, we need to
+                # look for a Window Update frame.
+                while self._out_flow_control_window < len(frame.data):
+                    self._recv_cb()
+
+                self._out_flow_control_window -= len(frame.data)
+
+            data = frame.serialize()
+
+            max_frame_size = self._settings[
+                SettingsFrame.SETTINGS_MAX_FRAME_SIZE
+            ]
+            if frame.body_len > max_frame_size:
+                raise ValueError(
+                    "Frame size %d exceeds maximum frame size setting %d" %
+                    (frame.body_len, max_frame_size)
+                )
 
-        max_frame_size = self._settings[SettingsFrame.SETTINGS_MAX_FRAME_SIZE]
-        if frame.body_len > max_frame_size:
-            raise ValueError(
-                     "Frame size %d exceeds maximum frame size setting %d" %
-                     (frame.body_len,
-                      self._settings[SettingsFrame.SETTINGS_MAX_FRAME_SIZE])
+            log.info(
+                "Sending frame %s on stream %d",
+                frame.__class__.__name__,
+                frame.stream_id
             )
 
-        log.info(
-            "Sending frame %s on stream %d",
-            frame.__class__.__name__,
-            frame.stream_id
-        )
-
-        try:
-            self._sock.send(data)
-        except socket.error as e:
-            if (not tolerate_peer_gone or
-                e.errno not in (errno.EPIPE, errno.ECONNRESET)):
-                raise
+            try:
+                self._sock.send(data)
+            except socket.error as e:
+                if (not tolerate_peer_gone or
+                    e.errno not in (errno.EPIPE, errno.ECONNRESET)):
+                    raise
 
     def _adjust_receive_window(self, frame_len):
         """
@@ -588,13 +1245,59 @@ class HTTP20Connection(object):
         """
         increment = self.window_manager._handle_frame(frame_len)
 
-        if increment:
+        # If too much data is waiting to be read, hold back the window so that
+        # the server stops sending.
+        if self._buffer_full(frame_len):
+            self._withheld_window += increment
+        elif increment:
             f = WindowUpdateFrame(0)
             f.window_increment = increment
             self._send_cb(f, True)
 
         return
 
+    def _buffer_full(self, extra=0):
+        """
+        Whether the response data buffered across all streams, plus ``extra``
+        bytes about to be buffered, has reached the connection's limit.
+        """
+        if self._max_buffer_size is None:
+            return False
+
+        return self._buffered_size + extra >= self._max_buffer_size
+
+    def _record_buffered(self, size):
+        """
+        Called by a stream when the amount of response data it has buffered
+        changes by ``size`` bytes.
+        """
+        self._buffered_size += size
+
+    def _unbuffer(self, stream):
+        """
+        Stops counting a removed stream's buffered data towards the
+        connection's total, including anything the user reads later.
+        """
+        self._buffered_size -= stream._buffered_size
+        stream._buffered_cb = None
+
+    def _release_window(self):
+        """
+        Sends any connection window increments that were held back, if there's
+        now room in the buffer or we're about to wait for data that the server
+        can't send without them.
+        """
+        if not self._withheld_window:
+            return
+
+        if self._buffer_full() and self._sock.can_read:
+            return
+
+        f = WindowUpdateFrame(0)
+        f.window_increment = self._withheld_window
+        self._withheld_window = 0
+        self._send_cb(f, True)
+
     def _consume_single_frame(self):
         """
         Consumes a single frame from the TCP stream.
@@ -608,13 +1311,14 @@ class HTTP20Connection(object):
 
         # Parse the header. We can use the returned memoryview directly here.
         frame, length = Frame.parse_frame_header(header)
+        self._last_received = time.time()
 
-        if (length > FRAME_MAX_LEN):
+        if (length > self._max_frame_size):
             log.warning(
                 "Frame size exceeded on stream %d (received: %d, max: %d)",
                 frame.stream_id,
                 length,
-                FRAME_MAX_LEN
+                self._max_frame_size
             )
             self._send_rst_frame(frame.stream_id, 6) # 6 = FRAME_SIZE_ERROR
 
@@ -633,24 +1337,24 @@ class HTTP20Connection(object):
         add support for socket timeouts here at some stage.
         """
         # TODO: Fix DoS risk.
+        # Each frame is read into a buffer of its own, which is never reused.
+        # This lets DATA frames, and the streams that buffer them, hold on to
+        # views of it rather than copying the data out. Large payloads are
+        # received straight into it, bypassing the socket's own buffer.
         if not length:
             return memoryview(b'')
 
-        buffer = bytearray(length)
-        buffer_view = memoryview(buffer)
+        buffer_view = memoryview(bytearray(length))
         index = 0
-        data_length = -1
-        # _sock.recv(length) might not read out all data if the given length
-        # is very large. So it should be to retrieve from socket repeatedly.
-        while length and data_length:
-            data = self._sock.recv(length)
-            data_length = len(data)
-            end = index + data_length
-            buffer_view[index:end] = data[:]
-            length -= data_length
-            index = end
-
-        return buffer_view[:end]
+        # _sock.recv_into might not fill the buffer if the given length is
+        # very large. So it should be to retrieve from socket repeatedly.
+        while index < length:
+            count = self._sock.recv_into(buffer_view[index:])
+            if not count:
+                break
+            index += count
+
+        return buffer_view[:index]
 
     def _consume_frame_payload(self, frame, data):
         """
@@ -717,18 +1421,112 @@ class HTTP20Connection(object):
 
         This is generally called by a stream, not by the connection itself, and
         it's likely that streams will read a frame that doesn't belong to them.
+
+        If another thread is already reading frames, this waits for it to
+        finish instead.
         """
-        self._consume_single_frame()
-        count = 9
+        with self._lock:
+            self._read_frames(to_timeout_tuple(self._timeout, default=5)[1])
 
-        while count and self._sock is not None and self._sock.can_read:
-            # If the connection has been closed, bail out.
-            try:
-                self._consume_single_frame()
-            except ConnectionResetError:
-                break
+    def _read_frames(self, timeout=None):
+        """
+        Does the work of ``_recv_cb``. Must be called with the lock held.
+        Raises ``socket.timeout`` if nothing arrives within ``timeout``
+        seconds.
+        """
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        current = threading.current_thread()
+
+        if self._reading and self._reader is not current:
+            frames_read = self._frames_read
+            while self._frames_read == frames_read:
+                if timeout is None:
+                    self._frames_read_condition.wait()
+                    continue
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise socket.timeout("Timed out waiting for the server")
+
+                self._frames_read_condition.wait(remaining)
+
+            return
+
+        nested = self._reading
+        self._reading = True
+        self._reader = current
+
+        try:
+            self._release_window()
+            self._wait_for_frames(timeout)
+            self._consume_single_frame()
+            count = 9
+
+            while count and self._sock is not None and self._sock.can_read:
+                # If the connection has been closed, bail out.
+                try:
+                    self._consume_single_frame()
+                except ConnectionResetError:
+                    break
+
+                count -= 1
+        finally:
+            if not nested:
+                self._reading = False
+                self._reader = None
+
+            self._frames_read += 1
+            self._frames_read_condition.notify_all()
 
-            count -= 1
+    def _wait_for_frames(self, timeout=None):
+        """
+        Waits for the server to send something. The lock is let go of in the
+        meantime, unless the calling thread already held it before it asked
+        for frames: then it's in the middle of something that other threads
+        mustn't interleave with. Without a timeout, we wait as long as the
+        socket would wait for the rest of a frame.
+        """
+        if self._sock.can_read:
+            return
+
+        sock = self._sock
+        if timeout is None:
+            timeout = sock.gettimeout()
+
+        self._lock.release()
+        try:
+            ready = sock.wait_for_data(timeout)
+        finally:
+            self._lock.acquire()
+
+        if not ready:
+            raise socket.timeout("Timed out waiting for the server")
+
+    def _recv_for_stream(self, stream):
+        """
+        The callback streams use to read frames. A stream checks for what it's
+        waiting for without holding the lock, so another thread may have read
+        it in the meantime: if any frames have been read since the stream last
+        called this, it returns straight away to let the stream look again.
+        """
+        with self._lock:
+            if stream._reset_error_code is not None:
+                raise StreamResetError(
+                    "Stream forcefully closed.", stream._reset_error_code
+                )
+
+            if stream._frames_seen == self._frames_read:
+                try:
+                    self._read_frames(stream._timeout)
+                except StreamResetError:
+                    # Another thread's stream may have been the one reset:
+                    # its reader finds out when it next comes here.
+                    if stream._reset_error_code is not None:
+                        raise
+
+            stream._frames_seen = self._frames_read
 
     def _send_rst_frame(self, stream_id, error_code):
         """
@@ -739,11 +1537,16 @@ class HTTP20Connection(object):
         self._send_cb(f)
 
         try:
-            del self.streams[stream_id]
+            stream = self.streams.pop(stream_id)
         except KeyError as e:  # pragma: no cover
             log.warn(
                 "Stream with id %d does not exist: %s",
                 stream_id, e)
+        else:
+            self._scheduler.remove(stream)
+            self._unbuffer(stream)
+
+        self._forget_retried(stream_id)
 
         # Keep track of the fact that we reset this stream in case there are
         # other frames in flight.
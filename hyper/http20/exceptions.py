@@ -46,4 +46,10 @@ class StreamResetError(HTTP20Error):
     """
     A stream was forcefully reset by the remote party.
     """
-    pass
+    def __init__(self, message, error_code=None):
+        super(StreamResetError, self).__init__(message)
+
+        #: The HTTP/2 error code the stream was reset with, if known: for
+        #: example, 7 (``REFUSED_STREAM``) if the server didn't process the
+        #: request, which means it can safely be retried.
+        self.error_code = error_code
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+hyper/http20/pool
+~~~~~~~~~~~~~~~~~
+
+Objects that pool HTTP/2 connections.
+
+A single HTTP/2 connection can carry many concurrent requests, so most of the
+time one connection per origin is all that's needed. However, a single TCP
+connection can only carry so much data in flight at once, and servers limit
+how many concurrent streams a connection may have. This module provides a pool
+that spreads requests over several connections to the same origin.
+"""
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+
+from ..common.util import to_host_port_tuple
+from ..packages.hyperframe.frame import SettingsFrame
+from .connection import HTTP20Connection
+from .stream import STATE_CLOSED
+
+log = logging.getLogger(__name__)
+
+
+class HTTP20ConnectionPool(object):
+    """
+    A pool of HTTP/2 connections, holding up to ``maxsize`` connections for
+    each origin.
+
+    When asked for a connection, the pool returns whichever connection to the
+    origin is carrying the fewest active streams and has room for another
+    under the server's ``MAX_CONCURRENT_STREAMS`` setting. A new connection is
+    only opened when all existing connections are full. If the pool for that
+    origin is also full, the least-loaded connection is returned anyway, and
+    the server may queue or refuse the new stream.
+
+    Connections are handed out, not checked out: many callers may share one
+    connection at a time. The pool itself is thread-safe. When the pool holds
+    :class:`HTTPConnection <hyper.HTTPConnection>` objects, one that has
+    settled on HTTP/1.1 counts as full while a thread is using it.
+
+    :param maxsize: (optional) The maximum number of connections to keep for
+        each origin. Defaults to 1.
+    :param idle_timeout: (optional) The number of seconds a connection may go
+        unused with no active streams before it is closed and evicted from
+        the pool. If not provided, idle connections are kept forever.
+    :param max_origins: (optional) The maximum number of origins to keep
+        connections to. When a new origin would go over the limit, the
+        connections to the origin used least recently are evicted. If not
+        provided, there is no limit.
+    :param connection_class: (optional) The class to use for new connections.
+        Defaults to :class:`HTTP20Connection <hyper.HTTP20Connection>`.
+    :param kwargs: (optional) Any further keyword arguments are passed to the
+        constructor of each new connection.
+    """
+    def __init__(self, maxsize=1, idle_timeout=None, connection_class=None,
+                 max_origins=None, **kwargs):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.max_origins = max_origins
+
+        self._connection_class = connection_class or HTTP20Connection
+        self._connection_kwargs = kwargs
+
+        # A mapping between (host, port, secure) tuples and the list of
+        # connections to that origin. The origin used most recently is at
+        # the end.
+        self._connections = OrderedDict()
+
+        # When each connection was last handed out.
+        self._last_used = {}
+
+        # Connections evicted from the pool while they still had active
+        # streams. They are closed once those streams are done.
+        self._draining = []
+
+        self._lock = threading.RLock()
+
+    def get_connection(self, host, port=None, secure=None):
+        """
+        Gets the most appropriate connection to the given origin, opening a
+        new one if needed.
+
+        :param host: The host to connect to. This may be an IP address or a
+            hostname, and optionally may include a port.
+        :param port: (optional) The port to connect to. If not provided and
+            one also isn't provided in the ``host`` parameter, defaults to 443.
+        :param secure: (optional) Whether the connection should use TLS.
+            Defaults to ``False`` for most origins, but to ``True`` for any
+            connection to port 443.
+        :returns: A connection object.
+        """
+        if port is None:
+            host, port = to_host_port_tuple(host, default_port=443)
+
+        if secure is None:
+            secure = (port == 443)
+
+        origin = (host, port, secure)
+
+        with self._lock:
+            self._close_drained()
+            self._evict(origin)
+            connections = self._connections.pop(origin, [])
+            self._connections[origin] = connections
+            self._evict_origins()
+
+            candidates = [
+                (_active_streams(c), i, c) for i, c in enumerate(connections)
+            ]
+            available = [
+                t for t in candidates
+                if t[0] < _max_concurrent_streams(t[2])
+            ]
+
+            if available:
+                conn = min(available)[2]
+            elif len(connections) < self.maxsize:
+                log.debug("Opening new connection to %s:%d", host, port)
+                conn = self._connection_class(
+                    host, port, secure=secure, **self._connection_kwargs
+                )
+                connections.append(conn)
+            else:
+                log.debug("All connections to %s:%d are full", host, port)
+                conn = min(candidates)[2]
+
+            self._last_used[conn] = time.time()
+
+        return conn
+
+    def close(self):
+        """
+        Closes all connections in the pool.
+
+        :returns: Nothing.
+        """
+        with self._lock:
+            for connections in self._connections.values():
+                for conn in connections:
+                    conn.close()
+
+            for conn in self._draining:
+                conn.close()
+
+            self._connections = OrderedDict()
+            self._last_used = {}
+            self._draining = []
+
+    def discard_connection(self, conn):
+        """
+        Removes a connection from the pool and closes it, so that it is never
+        handed out again: for example, because it has failed. Later requests
+        to the same origin get a new connection.
+
+        :param conn: The connection to discard.
+        :returns: Nothing.
+        """
+        with self._lock:
+            for connections in self._connections.values():
+                if conn in connections:
+                    connections.remove(conn)
+                    del self._last_used[conn]
+
+            if conn in self._draining:
+                self._draining.remove(conn)
+
+        conn.close()
+
+    def _evict(self, origin):
+        """
+        Removes connections to an origin that shouldn't be handed out any
+        more. Connections the server has sent GOAWAY on are removed from the
+        pool, but only closed once they have no active streams so that
+        outstanding responses can complete. Idle connections are closed.
+        """
+        now = time.time()
+        keep = []
+
+        for conn in self._connections.get(origin, []):
+            active = _in_use(conn)
+            goaway = getattr(conn, '_goaway_last_stream_id', None) is not None
+            idle = (
+                self.idle_timeout is not None and
+                not active and
+                now - self._last_used[conn] > self.idle_timeout
+            )
+
+            if goaway or idle:
+                log.debug("Evicting connection %r", conn)
+                del self._last_used[conn]
+                self._retire(conn)
+            else:
+                keep.append(conn)
+
+        self._connections[origin] = keep
+
+    def _evict_origins(self):
+        """
+        Removes the connections to the origins used least recently, until no
+        more than ``max_origins`` are left. As with GOAWAY, connections are
+        only closed once they have no active streams.
+        """
+        if self.max_origins is None:
+            return
+
+        while len(self._connections) > self.max_origins:
+            _, connections = self._connections.popitem(last=False)
+
+            for conn in connections:
+                log.debug("Evicting connection %r", conn)
+                del self._last_used[conn]
+                self._retire(conn)
+
+    def _retire(self, conn):
+        """
+        Closes a connection that has been evicted from the pool, or if it
+        still has active streams, leaves it to drain and closes it later.
+        """
+        if _in_use(conn):
+            self._draining.append(conn)
+        else:
+            conn.close()
+
+    def _close_drained(self):
+        """
+        Closes the evicted connections whose streams have all finished.
+        """
+        draining = []
+
+        for conn in self._draining:
+            if _in_use(conn):
+                draining.append(conn)
+            else:
+                log.debug("Closing drained connection %r", conn)
+                conn.close()
+
+        self._draining = draining
+
+    # The following two methods are the implementation of the context manager
+    # protocol.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+        return False  # Never swallow exceptions.
+
+
+def _active_streams(conn):
+    """
+    Returns the number of streams on a connection that count towards the
+    server's concurrency limit: the open streams we initiated, which have odd
+    stream IDs. Streams the server pushed don't count. Connections that
+    haven't negotiated HTTP/2 count as carrying one stream while a thread
+    owns them.
+    """
+    streams = getattr(conn, 'streams', None)
+    if streams is None:
+        return 1 if getattr(conn, '_owner', None) is not None else 0
+
+    return sum(
+        1 for stream_id, s in list(streams.items())
+        if stream_id % 2 and s.state != STATE_CLOSED
+    )
+
+
+def _in_use(conn):
+    """
+    Whether a connection has any active streams, counting those still
+    draining from connections it replaced. It mustn't be closed until it has
+    none.
+    """
+    return bool(
+        _active_streams(conn) or
+        any(_active_streams(r) for r in getattr(conn, '_retired', []))
+    )
+
+
+def _max_concurrent_streams(conn):
+    """
+    Returns the maximum number of concurrent streams the server will allow on
+    a connection. Until the server says otherwise there is no limit, except
+    that a connection that has settled on HTTP/1.1 carries one request at a
+    time.
+    """
+    if (getattr(conn, 'streams', None) is None and
+            getattr(conn, '_negotiated', False)):
+        return 1
+
+    settings = getattr(conn, '_settings', {})
+    return settings.get(SettingsFrame.MAX_CONCURRENT_STREAMS, float('inf'))
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+hyper/http20/priority
+~~~~~~~~~~~~~~~~~~~~~
+
+Objects that decide the order in which request bodies are sent.
+
+HTTP/2 lets clients say how important each stream is relative to the others,
+by giving it a weight and, optionally, another stream it depends on. Servers
+use this to decide which responses to send first. The same information is
+useful in the other direction: when several request bodies are waiting to be
+sent, the scheduler in this module interleaves their DATA frames so that each
+stream gets a share of the connection in proportion to its weight. This stops
+a large upload from holding up small requests made alongside it.
+"""
+import logging
+
+log = logging.getLogger(__name__)
+
+
+#: The weight a stream has if none is given, as defined by the spec.
+DEFAULT_WEIGHT = 16
+
+
+class PriorityScheduler(object):
+    """
+    Decides which stream's data to send next.
+
+    Each stream with data waiting to be sent is given turns in proportion to
+    its weight, using stride scheduling: every chunk a stream sends pushes its
+    'virtual time' forward by the size of the chunk divided by its weight, and
+    the stream with the earliest virtual time goes next. A stream that depends
+    on another stream with data waiting doesn't get a turn until that stream is
+    finished. Streams that don't have room in their flow control window for
+    their next chunk are passed over.
+    """
+    def __init__(self):
+        # The queued bodies, in the order they were added. Each is a list of
+        # the stream, an iterator over the remaining chunks, the next chunk,
+        # whether the stream ends with this body and the stream's virtual
+        # time.
+        self._queue = []
+
+        # The virtual time of the last chunk handed out. Streams joining the
+        # queue start here, so that they don't get to catch up on turns they
+        # missed.
+        self._virtual_time = 0
+
+    def add(self, stream, chunks, final):
+        """
+        Queues up the chunks of a body to be sent on a stream.
+
+        :param stream: The stream to send the body on.
+        :param chunks: An iterable of the chunks of data to send.
+        :param final: Whether the stream ends once this body is sent.
+        :returns: Nothing.
+        """
+        chunks = iter(chunks)
+        for chunk in chunks:
+            self._queue.append(
+                [stream, chunks, chunk, final, self._virtual_time]
+            )
+            break
+
+    def remove(self, stream):
+        """
+        Throws away any data queued up for a stream.
+
+        :param stream: The stream to stop sending data on.
+        :returns: Nothing.
+        """
+        self._queue = [e for e in self._queue if e[0] is not stream]
+
+    def pending(self, stream=None):
+        """
+        Whether there is data waiting to be sent.
+
+        :param stream: (optional) Only consider data for this stream.
+        :returns: ``True`` if there is data waiting, otherwise ``False``.
+        """
+        return any(
+            stream is None or e[0] is stream for e in self._queue
+        )
+
+    def next(self):
+        """
+        Picks the next chunk of data to send.
+
+        :returns: A tuple of the stream to send on, the chunk of data, and
+            whether it ends the stream's body. If data is waiting but none of
+            it can be sent until a flow control window opens up, returns
+            ``None``.
+        """
+        # Forget about streams that have been closed or reset under us.
+        self._queue = [e for e in self._queue if e[0]._local_open]
+
+        waiting = set(e[0].stream_id for e in self._queue)
+        parents = dict((e[0].stream_id, e[0].depends_on) for e in self._queue)
+        candidates = [
+            e for e in self._queue
+            if not _blocked_by_parent(e[0].stream_id, parents, waiting) and
+            len(e[2]) <= e[0]._out_flow_control_window
+        ]
+
+        if not candidates:
+            return None
+
+        entry = min(candidates, key=lambda e: e[4])
+        stream, chunks, chunk, final = entry[:4]
+
+        self._virtual_time = entry[4]
+        weight = stream.weight or DEFAULT_WEIGHT
+        entry[4] += float(max(len(chunk), 1)) / weight
+
+        # Move on to the next chunk, removing the body from the queue if this
+        # was the last of it.
+        for next_chunk in chunks:
+            entry[2] = next_chunk
+            break
+        else:
+            self._queue.remove(entry)
+
+        return stream, chunk, final
+
+
+def _blocked_by_parent(stream_id, parents, waiting):
+    """
+    Whether any stream that the given stream depends on, directly or
+    indirectly, has data waiting to be sent.
+    """
+    seen = set([stream_id])
+    parent = parents.get(stream_id)
+
+    while parent and parent not in seen:
+        if parent in waiting:
+            return True
+
+        seen.add(parent)
+        parent = parents.get(parent)
+
+    return False
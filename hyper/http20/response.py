@@ -7,10 +7,9 @@ Contains the HTTP/2 equivalent of the HTTPResponse object defined in
 httplib/http.client.
 """
 import logging
-import zlib
 
-from ..common.decoder import DeflateDecoder
-from ..common.headers import HTTPHeaderMap
+from ..common.decoder import get_decoder
+from ..common.headers import HTTPHeaderMap, raw_values
 
 log = logging.getLogger(__name__)
 
@@ -18,14 +17,24 @@ log = logging.getLogger(__name__)
 def strip_headers(headers):
     """
     Strips the headers attached to the instance of any header beginning
-    with a colon that ``hyper`` doesn't understand. This method logs at
-    warning level about the deleted headers, for discoverability.
+    with a colon, in a single pass over the headers.
+
+    :returns: A dictionary of the stripped headers, mapping each name to the
+        first value it was given.
     """
-    # Convert to list to ensure that we don't mutate the headers while
-    # we iterate over them.
-    for name in list(headers.keys()):
+    pseudo_headers = {}
+    regular_headers = []
+
+    for name, value in headers.iter_raw():
         if name.startswith(b':'):
-            del headers[name]
+            pseudo_headers.setdefault(name, value)
+        else:
+            regular_headers.append((name, value))
+
+    if pseudo_headers:
+        headers._set_raw(regular_headers)
+
+    return pseudo_headers
 
 
 class HTTP20Response(object):
@@ -41,8 +50,7 @@ class HTTP20Response(object):
         #: HTTP/2, and so is always the empty string.
         self.reason = ''
 
-        status = headers[b':status'][0]
-        strip_headers(headers)
+        status = strip_headers(headers)[b':status']
 
         #: The status code returned by the server.
         self.status = int(status)
@@ -57,22 +65,25 @@ class HTTP20Response(object):
         # The stream this response is being sent over.
         self._stream = stream
 
-        # We always read in one-data-frame increments from the stream, so we
-        # may need to buffer some for incomplete reads.
-        self._data_buffer = b''
-
-        # This object is used for decompressing gzipped request bodies. Right
-        # now we only support gzip because that's all the RFC mandates of us.
-        # Later we'll add support for more encodings.
-        # This 16 + MAX_WBITS nonsense is to force gzip. See this
-        # Stack Overflow answer for more:
-        # http://stackoverflow.com/a/2695466/1401686
-        if b'gzip' in self.headers.get(b'content-encoding', []):
-            self._decompressobj = zlib.decompressobj(16 + zlib.MAX_WBITS)
-        elif b'deflate' in self.headers.get(b'content-encoding', []):
-            self._decompressobj = DeflateDecoder()
-        else:
-            self._decompressobj = None
+        # Decompressed data that was produced beyond what was asked for.
+        self._decoded_buffer = b''
+
+        # Whether the response has been explicitly closed, and whether the
+        # stream has been closed.
+        self._closed = False
+        self._released = False
+
+        # This object is used for decompressing compressed response bodies.
+        # It is looked up from the codings registered in
+        # hyper.common.decoder.
+        self._decompressobj = get_decoder(
+            c for v in raw_values(self.headers, b'content-encoding')
+            for c in v.split(b',')
+        )
+
+        # Compressed data the decompressor hasn't got to yet, because it had
+        # already produced as much as we asked for.
+        self._unconsumed_tail = b''
 
     @property
     def trailers(self):
@@ -102,39 +113,78 @@ class HTTP20Response(object):
             ``True``, the actual amount of data returned may be different to
             the amount requested.
         """
-        if amt is not None and amt <= len(self._data_buffer):
-            data = self._data_buffer[:amt]
-            self._data_buffer = self._data_buffer[amt:]
-            response_complete = False
-        elif amt is not None:
-            read_amt = amt - len(self._data_buffer)
-            self._data_buffer += self._stream._read(read_amt)
-            data = self._data_buffer[:amt]
-            self._data_buffer = self._data_buffer[amt:]
-            response_complete = len(data) < amt
-        else:
-            data = b''.join([self._data_buffer, self._stream._read()])
-            response_complete = True
+        if decode_content and (self._decompressobj or self._decoded_buffer):
+            return self._read_decoded(amt)
 
-        # We may need to decode the body.
-        if decode_content and self._decompressobj and data:
-            data = self._decompressobj.decompress(data)
+        # The stream hands back exactly what we ask for, unless the body ends
+        # first.
+        if amt is None:
+            data = self._stream._read()
+            response_complete = True
+        else:
+            data = self._stream._read(amt)
+            response_complete = len(data) < amt
 
         # If we're at the end of the request, we have some cleaning up to do.
-        # Close the stream, and if necessary flush the buffer.
         if response_complete:
-            if decode_content and self._decompressobj:
-                data += self._decompressobj.flush()
-
-            if self._stream.response_headers:
-                self.headers.merge(self._stream.response_headers)
+            self._finish_body()
 
         # We're at the end. Close the connection.
         if not data:
-            self.close()
+            self._release()
 
         return data
 
+    def _read_decoded(self, amt):
+        """
+        Reads up to ``amt`` bytes of the decompressed body, or all of it if
+        ``amt`` is ``None``. The decompressor is never asked for more than is
+        wanted, so highly compressed bodies don't balloon in memory.
+        """
+        if amt is None:
+            chunks = []
+            while True:
+                chunk = self._read_decoded(65535)
+                if not chunk:
+                    return b''.join(chunks)
+
+                chunks.append(chunk)
+
+        data = self._decoded_buffer[:amt]
+        self._decoded_buffer = self._decoded_buffer[amt:]
+        chunks = [data]
+        remaining = amt - len(data)
+
+        while remaining > 0 and self._decompressobj is not None:
+            data = self._decompressobj.decompress(
+                self._unconsumed_tail, remaining
+            )
+            self._unconsumed_tail = self._decompressobj.unconsumed_tail
+
+            if not data:
+                raw = self.read(amt, decode_content=False)
+                if raw:
+                    self._unconsumed_tail = raw
+                    continue
+
+                # The body has been read in full.
+                data = self._decompressobj.flush()
+                self._decompressobj = None
+                self._decoded_buffer = data[remaining:]
+                data = data[:remaining]
+
+            chunks.append(data)
+            remaining -= len(data)
+
+        return b''.join(chunks)
+
+    def _finish_body(self):
+        """
+        Tidies up once the whole body has been read.
+        """
+        if self._stream.response_headers:
+            self.headers.merge(self._stream.response_headers)
+
     def read_chunked(self, decode_content=True):
         """
         Reads chunked transfer encoded bodies. This method returns a generator:
@@ -159,10 +209,148 @@ class HTTP20Response(object):
         if decode_content and self._decompressobj:
             yield self._decompressobj.flush()
 
-        self.close()
+        self._release()
 
         return
 
+    def iter_content(self, chunk_size=65536, decode_content=True,
+                     reuse_buffer=False):
+        """
+        Iterates over the response body in pieces of ``chunk_size`` bytes.
+        Unlike ``read_chunked()``, the pieces don't depend on how the server
+        split the body into data frames: data is gathered up until there is
+        a whole piece. Only the last piece may be shorter.
+
+        :param chunk_size: (optional) The size of each piece, in bytes.
+            Defaults to 64kB.
+        :param decode_content: (optional) If ``True``, will transparently
+            decode the response data.
+        :param reuse_buffer: (optional) If ``True``, every piece is a
+            ``memoryview`` of the same buffer, which is overwritten by the
+            next piece. This saves allocating memory for each piece, but each
+            piece must be used or copied before the next is asked for.
+        """
+        if not reuse_buffer:
+            while True:
+                data = self.read(chunk_size, decode_content=decode_content)
+                if not data:
+                    break
+
+                yield data
+
+            return
+
+        view = memoryview(bytearray(chunk_size))
+
+        while True:
+            filled = 0
+
+            while filled < chunk_size:
+                if decode_content:
+                    count = self.readinto(view[filled:])
+                else:
+                    data = self.read(chunk_size - filled, decode_content=False)
+                    count = len(data)
+                    view[filled:filled + count] = data
+
+                if not count:
+                    break
+
+                filled += count
+
+            if not filled:
+                break
+
+            yield view[:filled]
+
+    def __iter__(self):
+        return self.iter_content()
+
+    def readinto(self, b):
+        """
+        Reads up to ``len(b)`` bytes of the response body into the writable
+        buffer ``b``. If the body is not compressed, the data is copied
+        straight out of the stream's buffers. This blocks until at least one
+        byte is available.
+
+        :param b: A writable buffer, such as a ``bytearray``.
+        :returns: The number of bytes read, which is zero only at the end of
+            the body.
+        """
+        if self._decompressobj is None and not self._decoded_buffer:
+            read = self._stream._readinto(b)
+
+            if not read:
+                self._finish_body()
+                self._release()
+
+            return read
+
+        # Decompressed data doesn't line up with the data on the stream, so
+        # go through read().
+        view = memoryview(b)
+        data = self.read(len(view))
+        view[:len(data)] = data
+        return len(data)
+
+    def readline(self, limit=-1):
+        """
+        Reads a single line of the response body, up to and including the
+        newline. Lines are read a byte at a time, so for anything more than
+        occasional use wrap the response in an ``io.BufferedReader``.
+
+        :param limit: (optional) The most bytes to read. If not provided or
+            negative, reads until the end of the line.
+        :returns: The line, or the empty string at the end of the body.
+        """
+        line = bytearray()
+        byte = bytearray(1)
+
+        while limit < 0 or len(line) < limit:
+            if not self.readinto(byte):
+                break
+
+            line += byte
+            if byte == b'\n':
+                break
+
+        return bytes(line)
+
+    def readable(self):
+        """
+        Response bodies can always be read from. This, together with
+        ``readinto()`` and ``closed``, allows responses to be wrapped in an
+        ``io.BufferedReader``.
+
+        :returns: ``True``.
+        """
+        return True
+
+    def writable(self):
+        """
+        Response bodies cannot be written to.
+
+        :returns: ``False``.
+        """
+        return False
+
+    def seekable(self):
+        """
+        Response bodies cannot be seeked.
+
+        :returns: ``False``.
+        """
+        return False
+
+    def flush(self):
+        """
+        Does nothing, as there is nothing to flush. Present so that responses
+        can be wrapped in an ``io.BufferedReader``.
+
+        :returns: Nothing.
+        """
+        pass
+
     def fileno(self):
         """
         Return the ``fileno`` of the underlying socket. This function is
@@ -170,13 +358,31 @@ class HTTP20Response(object):
         """
         raise NotImplementedError("Not currently implemented.")
 
+    @property
+    def closed(self):
+        """
+        Whether the response has been closed.
+        """
+        return self._closed
+
     def close(self):
         """
         Close the response. In effect this closes the backing HTTP/2 stream.
+        Closing a response more than once has no effect.
 
         :returns: Nothing.
         """
-        self._stream.close()
+        self._closed = True
+        self._release()
+
+    def _release(self):
+        """
+        Closes the backing stream, either because the body has been read in
+        full or because the response is being closed.
+        """
+        if not self._released:
+            self._released = True
+            self._stream.close()
 
     # The following methods implement the context manager protocol.
     def __enter__(self):
@@ -193,16 +399,16 @@ class HTTP20Push(object):
     push mechanism.
     """
     def __init__(self, request_headers, stream):
+        pseudo_headers = strip_headers(request_headers)
+
         #: The scheme of the simulated request
-        self.scheme = request_headers[b':scheme'][0]
+        self.scheme = pseudo_headers[b':scheme']
         #: The method of the simulated request (must be safe and cacheable, e.g. GET)
-        self.method = request_headers[b':method'][0]
+        self.method = pseudo_headers[b':method']
         #: The authority of the simulated request (usually host:port)
-        self.authority = request_headers[b':authority'][0]
+        self.authority = pseudo_headers[b':authority']
         #: The path of the simulated request
-        self.path = request_headers[b':path'][0]
-
-        strip_headers(request_headers)
+        self.path = pseudo_headers[b':path']
 
         #: The headers the server attached to the simulated request.
         self.request_headers = request_headers
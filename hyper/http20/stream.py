@@ -13,7 +13,8 @@ stream is an independent, bi-directional sequence of HTTP headers and data.
 Each stream is identified by a monotonically increasing integer, assigned to
 the stream by the endpoint that initiated the stream.
 """
-from ..common.headers import HTTPHeaderMap
+from ..compat import join_bytes
+from ..common.headers import HTTPHeaderMap, LazyHTTPHeaderMap, raw_values
 from ..packages.hyperframe.frame import (
     FRAME_MAX_LEN, FRAMES, HeadersFrame, DataFrame, PushPromiseFrame,
     WindowUpdateFrame, ContinuationFrame, BlockedFrame, RstStreamFrame
@@ -22,6 +23,7 @@ from .exceptions import ProtocolError, StreamResetError
 from .util import h2_safe_headers
 import collections
 import logging
+import threading
 import zlib
 
 log = logging.getLogger(__name__)
@@ -84,8 +86,18 @@ class Stream(object):
         self.header_data = []
         self.promised_stream_id = None
 
-        # Unconsumed response data chunks. Empties after every call to _read().
-        self.data = []
+        # Unconsumed response data chunks. The first chunk may be a
+        # memoryview over the unread part of a chunk that was partly read.
+        self.data = collections.deque()
+
+        # The number of bytes of response data waiting to be read, and the
+        # most we're willing to hold before we stop giving the server more
+        # flow control window. Window increments held back while the buffer is
+        # full are totalled up here until they can be sent. The limit is set
+        # by the parent connection.
+        self._buffered_size = 0
+        self._max_buffer_size = None
+        self._withheld_window = 0
 
         # There are two flow control windows: one for data we're sending,
         # one for data being sent to us.
@@ -101,14 +113,42 @@ class Stream(object):
         # connection.
         self._recv_cb = recv_cb
 
+        # The lock guarding the stream's state. The parent connection replaces
+        # this with its own, as its frames may be read by any thread. It also
+        # keeps track of how many frames it had read the last time this stream
+        # asked it for more, the error code the server reset this stream with,
+        # if it did, and how long to wait for the server to send more.
+        self._lock = threading.RLock()
+        self._frames_seen = None
+        self._reset_error_code = None
+        self._timeout = None
+
         # This is the callback to be called when the stream is closed.
         self._close_cb = close_cb
 
+        # This is called with the change in the number of bytes buffered, so
+        # that the parent connection can keep a total across its streams.
+        self._buffered_cb = None
+
         # A reference to the header encoder and decoder objects belonging to
         # the parent connection.
         self._encoder = header_encoder
         self._decoder = header_decoder
 
+        # Whether the request can be sent again if the server refuses to
+        # process it, and the body to send if so. Set by the parent
+        # connection.
+        self._replayable = False
+        self._replay_body = None
+
+        # The priority of the stream: its weight, the stream it depends on and
+        # whether that dependency is exclusive. If neither the weight nor the
+        # dependency is set, no priority information is sent and the server
+        # uses the defaults.
+        self.weight = None
+        self.depends_on = None
+        self.exclusive = False
+
     def add_header(self, name, value, replace=False):
         """
         Adds a single HTTP header to the headers to be sent on the request.
@@ -125,6 +165,14 @@ class Stream(object):
         sent, the ``final`` flag _must_ be set to True. If no data is to be
         sent, set ``data`` to ``None``.
         """
+        for chunk in self._chunks(data):
+            self._send_chunk(chunk, final)
+
+    def _chunks(self, data):
+        """
+        Splits data to be sent on the stream into chunks of at most MAX_CHUNK
+        bytes. The data may be a bytestring or a file-like object.
+        """
         # Define a utility iterator for file objects.
         def file_iterator(fobj):
             while True:
@@ -140,8 +188,7 @@ class Stream(object):
             chunks = (data[i:i+MAX_CHUNK]
                       for i in range(0, len(data), MAX_CHUNK))
 
-        for chunk in chunks:
-            self._send_chunk(chunk, final)
+        return chunks
 
     @property
     def _local_closed(self):
@@ -169,32 +216,136 @@ class Stream(object):
 
     def _read(self, amt=None):
         """
-        Read data from the stream. Unlike a normal read behaviour, this
-        function returns _at least_ ``amt`` data, but may return more.
+        Read data from the stream. Returns ``amt`` bytes of data, or all of it
+        if ``amt`` is not provided. Less is only returned if the stream ends.
         """
-        def listlen(list):
-            return sum(map(len, list))
-
         # Keep reading until the stream is closed or we get enough data.
-        while not self._remote_closed and (amt is None or listlen(self.data) < amt):
-            self._recv_cb()
+        while not self._remote_closed and (amt is None or self._buffered_size < amt):
+            self._wait_for_data()
+
+        with self._lock:
+            if amt is None:
+                amt = self._buffered_size
+
+            pieces = []
+            remaining = amt
+            while remaining and self.data:
+                chunk = self._take_chunk(remaining)
+                pieces.append(chunk)
+                remaining -= len(chunk)
+
+            # This is the only place the data is copied.
+            result = join_bytes(pieces)
+            self._consumed(len(result))
 
-        result = b''.join(self.data)
-        self.data = []
         return result
 
+    def _readinto(self, buffer):
+        """
+        Reads data from the stream straight into a writable buffer. Waits
+        until there is some data, then fills as much of the buffer as it can
+        without waiting again.
+
+        :returns: The number of bytes read, which is zero only if the stream
+            has ended.
+        """
+        while not self._remote_closed and not self.data:
+            self._wait_for_data()
+
+        view = memoryview(buffer)
+        size = len(view)
+        index = 0
+
+        with self._lock:
+            while index < size and self.data:
+                chunk = self.data.popleft()
+                length = min(len(chunk), size - index)
+                chunk = memoryview(chunk)
+
+                view[index:index + length] = chunk[:length]
+                index += length
+
+                if length < len(chunk):
+                    self.data.appendleft(chunk[length:])
+
+            self._consumed(index)
+
+        return index
+
+    def _take_chunk(self, amt):
+        """
+        Removes and returns the first chunk of buffered data, or just its
+        first ``amt`` bytes if it's longer than that. The chunk may be a
+        memoryview.
+        """
+        chunk = self.data.popleft()
+
+        if len(chunk) > amt:
+            chunk = memoryview(chunk)
+            self.data.appendleft(chunk[amt:])
+            chunk = chunk[:amt]
+
+        return chunk
+
     def _read_one_frame(self):
         """
         Reads a single data frame from the stream and returns it.
         """
         # Keep reading until the stream is closed or we have a data frame.
         while not self._remote_closed and not self.data:
-            self._recv_cb()
+            self._wait_for_data()
+
+        with self._lock:
+            if not self.data:
+                return None
+
+            data = self._take_chunk(self._buffered_size)
+            self._consumed(len(data))
 
-        try:
-            return self.data.pop(0)
-        except IndexError:
-            return None
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+
+        return data
+
+    def _wait_for_data(self):
+        """
+        Reads a frame off the connection because the user wants more data
+        than we have. The server can't send more if we've been holding back
+        its window, so release it first.
+        """
+        with self._lock:
+            self._send_window_update(self._withheld_window)
+            self._withheld_window = 0
+
+        self._recv_cb()
+
+    def _consumed(self, size):
+        """
+        Records that the user has read some data out of the buffer. If that
+        makes room, window increments that were held back are sent.
+        """
+        self._buffered_size -= size
+        if self._buffered_cb is not None:
+            self._buffered_cb(-size)
+
+        if self._withheld_window and not self._buffer_full:
+            self._send_window_update(self._withheld_window)
+            self._withheld_window = 0
+
+    @property
+    def _buffer_full(self):
+        return (self._max_buffer_size is not None and
+                self._buffered_size >= self._max_buffer_size)
+
+    def _send_window_update(self, increment):
+        """
+        Gives the server more flow control window, unless it has nothing more
+        to send.
+        """
+        if increment and not self._remote_closed:
+            w = WindowUpdateFrame(self.stream_id)
+            w.window_increment = increment
+            self._data_cb(w, True)
 
     def receive_frame(self, frame):
         """
@@ -225,11 +376,16 @@ class Stream(object):
 
             # Append the data to the buffer.
             self.data.append(frame.data)
-
-            if increment and not self._remote_closed:
-                w = WindowUpdateFrame(self.stream_id)
-                w.window_increment = increment
-                self._data_cb(w, True)
+            self._buffered_size += len(frame.data)
+            if self._buffered_cb is not None:
+                self._buffered_cb(len(frame.data))
+
+            # If the user isn't keeping up, hold back the window so that the
+            # server stops sending until they do.
+            if self._buffer_full:
+                self._withheld_window += increment
+            else:
+                self._send_window_update(increment)
         elif frame.type == BlockedFrame.type:
             # If we've been blocked we may want to fixup the window.
             increment = self._in_window_manager._blocked()
@@ -239,7 +395,10 @@ class Stream(object):
                 self._data_cb(w, True)
         elif frame.type == RstStreamFrame.type:
             self.close(0)
-            raise StreamResetError("Stream forcefully closed.")
+            self._reset_error_code = frame.error_code
+            raise StreamResetError(
+                "Stream forcefully closed.", frame.error_code
+            )
         elif frame.type in FRAMES:
             # This frame isn't valid at this point.
             raise ValueError("Unexpected frame %s." % frame)
@@ -298,6 +457,13 @@ class Stream(object):
         if end:
             header_frame.flags.add('END_STREAM')
 
+        # Tell the server how important this stream is, if we've been told.
+        if self.weight is not None or self.depends_on is not None:
+            header_frame.flags.add('PRIORITY')
+            header_frame.depends_on = self.depends_on or 0
+            header_frame.stream_weight = (self.weight or 16) - 1
+            header_frame.exclusive = self.exclusive
+
         # Send the header frame.
         self._data_cb(header_frame)
 
@@ -318,8 +484,9 @@ class Stream(object):
             self._recv_cb()
 
         # Find the Content-Length header if present.
+        content_length = raw_values(self.response_headers, b'content-length')
         self._in_window_manager.document_size = (
-            int(self.response_headers.get(b'content-length', [0])[0])
+            int(content_length[0]) if content_length else 0
         )
 
         return self.response_headers
@@ -342,7 +509,7 @@ class Stream(object):
         # The idea of receiving such a thing is mind-boggling it's so unlikely,
         # but we should fix this up at some stage.
         while not self._remote_closed:
-            self._recv_cb()
+            self._wait_for_data()
 
         return self.response_trailers
 
@@ -360,9 +527,13 @@ class Stream(object):
             as they arrive, and terminate when the original stream closes.
         """
         while True:
-            for pair in self.promised_headers.items():
+            # Promises may arrive while we're yielding: take the ones we have.
+            with self._lock:
+                promised_headers = self.promised_headers
+                self.promised_headers = {}
+
+            for pair in promised_headers.items():
                 yield pair
-            self.promised_headers = {}
             if not capture_all or self._remote_closed:
                 break
             self._recv_cb()
@@ -380,6 +551,31 @@ class Stream(object):
         # gracefull shutdown.
         self._close_cb(self.stream_id, error_code or 0)
 
+    def _reset(self, stream_id, header_encoder, header_decoder,
+               window_manager):
+        """
+        Resets the stream so that its request can be sent again under a new
+        stream ID, possibly on a new connection. The request headers are kept:
+        everything the server has sent is thrown away.
+        """
+        self.stream_id = stream_id
+        self.state = STATE_IDLE
+        self.response_headers = None
+        self.response_trailers = None
+        self.promised_headers = {}
+        self.header_data = []
+        self.promised_stream_id = None
+        self.data = collections.deque()
+        self._buffered_size = 0
+        self._withheld_window = 0
+        self._in_window_manager = window_manager
+        self._encoder = header_encoder
+        self._decoder = header_decoder
+
+        # Any dependency refers to a stream ID on the old connection.
+        self.depends_on = None
+        self.exclusive = False
+
     def _handle_header_block(self, headers):
         """
         Handles the logic for receiving a completed headers block.
@@ -403,9 +599,9 @@ class Stream(object):
         # The header block may be for trailers or headers. If we've already
         # received headers these _must_ be for trailers.
         if self.response_headers is None:
-            self.response_headers = HTTPHeaderMap(headers)
+            self.response_headers = LazyHTTPHeaderMap(headers)
         elif self.response_trailers is None:
-            self.response_trailers = HTTPHeaderMap(headers)
+            self.response_trailers = LazyHTTPHeaderMap(headers)
         else:
             # Received too many headers blocks.
             raise ProtocolError("Too many header blocks.")
@@ -13,6 +13,13 @@ This module defines an interface for pluggable flow-control managers. These
 managers will define a flow-control policy. This policy will determine when to
 send WINDOWUPDATE frames.
 """
+import time
+
+
+# The largest flow control window the spec allows.
+MAX_WINDOW_SIZE = 2**31 - 1
+
+
 class BaseFlowControlManager(object):
     """
     The abstract base class for flow control managers.
@@ -53,6 +60,11 @@ class BaseFlowControlManager(object):
         #: size.
         self.document_size = document_size
 
+        #: The smoothed round-trip time to the remote peer in seconds, as
+        #: measured by PING frames, or ``None`` if it hasn't been measured.
+        #: This is kept up to date by the connection.
+        self.rtt = None
+
     def increase_window_size(self, frame_size):
         """
         Determine whether or not to emit a WINDOWUPDATE frame.
@@ -148,3 +160,58 @@ class FlowControlManager(BaseFlowControlManager):
 
     def blocked(self):
         return self.initial_window_size - self.window_size
+
+
+class BDPFlowControlManager(BaseFlowControlManager):
+    """
+    A flow control manager that grows the window to fit the connection.
+
+    A receive window smaller than the bandwidth-delay product of the network
+    path limits throughput: the sender runs out of window before our window
+    updates reach it. This manager watches how quickly the window is used up.
+    If it needs refilling more than once a round trip, the window is too small,
+    and it is doubled. The window never grows beyond ``max_window_size``.
+
+    The round-trip time is measured by the connection, from the
+    acknowledgement of its initial SETTINGS frame and from any PINGs (see
+    :meth:`ping() <hyper.HTTP20Connection.ping>`). Until it is known, the
+    window doesn't grow.
+    """
+    #: The largest the window is allowed to grow to, in bytes. Defaults to
+    #: 16MB.
+    max_window_size = 16 * 1024 * 1024
+
+    def __init__(self, initial_window_size, document_size=None):
+        super(BDPFlowControlManager, self).__init__(
+            initial_window_size, document_size
+        )
+
+        #: The size the window is refilled to, in bytes. This starts at the
+        #: initial window size and grows as needed.
+        self.target_window_size = initial_window_size
+
+        # When we last refilled the window.
+        self._last_update = None
+
+    def increase_window_size(self, frame_size):
+        # Refill the window once half of it has been used, which leaves the
+        # sender room to keep going while the update is in flight.
+        future_window_size = self.window_size - frame_size
+        if future_window_size >= self.target_window_size / 2:
+            return 0
+
+        now = time.time()
+        if (self._last_update is not None and
+                self.rtt is not None and
+                now - self._last_update < 2 * self.rtt):
+            self.target_window_size = min(
+                self.target_window_size * 2,
+                self.max_window_size,
+                MAX_WINDOW_SIZE
+            )
+
+        self._last_update = now
+        return self.target_window_size - future_window_size
+
+    def blocked(self):
+        return self.target_window_size - self.window_size
@@ -17,24 +17,37 @@ class Flags(collections.MutableSet):
 
     Will behave like a regular set(), except that a ValueError will be thrown when .add()ing
     unexpected flags.
+
+    The flags are stored as an integer, in the form they take in a frame
+    header. ``defined_flags`` may be a list of :class:`Flag` objects, or a
+    dictionary mapping flag names to bits: frame classes build the dictionary
+    once, so that creating a frame doesn't need to.
     """
     def __init__(self, defined_flags):
-        self._valid_flags = set(flag.name for flag in defined_flags)
-        self._flags = set()
+        if not isinstance(defined_flags, dict):
+            defined_flags = dict(defined_flags)
+
+        self._bits = defined_flags
+
+        #: The flags that are set, as an integer.
+        self.value = 0
 
     def __contains__(self, x):
-        return self._flags.__contains__(x)
+        return bool(self.value & self._bits.get(x, 0))
 
     def __iter__(self):
-        return self._flags.__iter__()
+        value = self.value
+        return (name for name, bit in self._bits.items() if value & bit)
 
     def __len__(self):
-        return self._flags.__len__()
+        value = self.value
+        return sum(1 for bit in self._bits.values() if value & bit)
 
     def discard(self, value):
-        return self._flags.discard(value)
+        self.value &= ~self._bits.get(value, 0)
 
     def add(self, value):
-        if value not in self._valid_flags:
+        try:
+            self.value |= self._bits[value]
+        except KeyError:
             raise ValueError("Unexpected flag: {}".format(value))
-        return self._flags.add(value)
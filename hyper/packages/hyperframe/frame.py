@@ -19,7 +19,28 @@ FRAME_MAX_LEN = (2 ** 14)
 FRAME_MAX_ALLOWED_LEN = (2 ** 24) - 1
 
 
-class Frame(object):
+class _FrameType(type):
+    """
+    The metaclass for frames. Works out, once for each class, which flags the
+    frame may carry and what they look like on the wire, so that this doesn't
+    have to be done for every frame sent or received.
+    """
+    def __init__(cls, name, bases, attrs):
+        super(_FrameType, cls).__init__(name, bases, attrs)
+
+        defined_flags = getattr(cls, 'defined_flags', [])
+        cls._flag_bits = dict(defined_flags)
+        cls._flag_mask = 0
+        for _, bit in defined_flags:
+            cls._flag_mask |= bit
+
+
+# Python 2 and 3 spell metaclasses differently, so build the base class by
+# hand.
+_FrameBase = _FrameType('_FrameBase', (object,), {})
+
+
+class Frame(_FrameBase):
     """
     The base class for all HTTP/2 frames.
     """
@@ -35,7 +56,7 @@ class Frame(object):
 
     def __init__(self, stream_id, flags=()):
         self.stream_id = stream_id
-        self.flags = Flags(self.defined_flags)
+        self.flags = Flags(self._flag_bits)
         self.body_len = 0
 
         for flag in flags:
@@ -76,10 +97,7 @@ class Frame(object):
         return (frame, length)
 
     def parse_flags(self, flag_byte):
-        for flag, flag_bit in self.defined_flags:
-            if flag_byte & flag_bit:
-                self.flags.add(flag)
-
+        self.flags.value |= flag_byte & self._flag_mask
         return self.flags
 
     def serialize(self):
@@ -87,12 +105,14 @@ class Frame(object):
         self.body_len = len(body)
 
         # Build the common frame header.
-        # First, get the flags.
-        flags = 0
-
-        for flag, flag_bit in self.defined_flags:
-            if flag in self.flags:
-                flags |= flag_bit
+        # First, get the flags. These are normally already in wire form, but
+        # may have been replaced with an ordinary set of flag names.
+        try:
+            flags = self.flags.value
+        except AttributeError:
+            flags = 0
+            for flag in self.flags:
+                flags |= self._flag_bits.get(flag, 0)
 
         header = struct.pack(
             "!HBBBL",
@@ -198,8 +218,11 @@ class DataFrame(Padding, Frame):
         return b''.join([padding_data, self.data, padding])
 
     def parse_body(self, data):
+        # The data is kept as a view of the buffer it was received into,
+        # rather than copied out. Callers that reuse that buffer must copy the
+        # data out first.
         padding_data_length = self.parse_padding_data(data)
-        self.data = data[padding_data_length:len(data)-self.total_padding].tobytes()
+        self.data = data[padding_data_length:len(data)-self.total_padding]
         self.body_len = len(data)
 
     @property
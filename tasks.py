@@ -1,9 +1,12 @@
 import json
 import os
+import struct
+import timeit
 
 from binascii import hexlify
 from invoke import task
-from hyper.http20.hpack import Encoder
+from hyper.packages.hpack.hpack import Encoder
+from hyper.packages.hyperframe.frame import Frame
 
 @task
 def hpack():
@@ -57,3 +60,22 @@ def hpack():
         with open(outname, 'wb') as f:
             f.write(json.dumps(output, sort_keys=True,
                     indent=2, separators=(',', ': ')))
+
+
+@task
+def frame_benchmark(iterations=100000):
+    """
+    This task measures how quickly frame headers can be parsed, which happens
+    for every frame hyper receives. It parses the headers of DATA frames with
+    the END_STREAM and PADDED flags set, and prints the rate achieved.
+    """
+    iterations = int(iterations)
+    header = struct.pack("!HBBBL", 0, 16, 0x0, 0x09, 1)
+
+    elapsed = timeit.timeit(
+        lambda: Frame.parse_frame_header(header), number=iterations
+    )
+
+    print("Parsed %d frame headers in %.3fs: %.0f frames/s" % (
+        iterations, elapsed, iterations / elapsed
+    ))
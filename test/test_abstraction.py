@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import threading
+
 import hyper.common.connection
 
 from hyper.common.connection import HTTPConnection
@@ -22,7 +24,8 @@ class TestHTTPConnection(object):
     def test_h2_kwargs(self):
         c = HTTPConnection(
             'test', 443, secure=False, window_manager=True, enable_push=True,
-            ssl_context=True, proxy_host=False, proxy_port=False, other_kwarg=True
+            ssl_context=True, proxy_host=False, proxy_port=False,
+            initial_window_size=1048576, max_frame_size=65536, other_kwarg=True
         )
 
         assert c._h2_kwargs == {
@@ -32,6 +35,10 @@ class TestHTTPConnection(object):
             'ssl_context': True,
             'proxy_host': False,
             'proxy_port': False,
+            'initial_window_size': 1048576,
+            'max_frame_size': 65536,
+            'header_table_size': None,
+            'max_concurrent_streams': None,
             'other_kwarg': True,
         }
 
@@ -70,6 +77,47 @@ class TestHTTPConnection(object):
         assert isinstance(c._conn, DummyH2Connection)
         assert c._conn._sock == 'totally a non-secure socket'
 
+    def test_stream_ids_arent_passed_to_http11(self, monkeypatch):
+        monkeypatch.setattr(
+            hyper.common.connection, 'HTTP11Connection', DummyH1Connection
+        )
+        monkeypatch.setattr(
+            hyper.common.connection, 'HTTP20Connection', DummyH2Connection
+        )
+        c = HTTPConnection('test', 80)
+
+        stream_id = c.request('GET', '/', timeout=5)
+        resp = c.get_response(stream_id)
+
+        assert resp == 'h2c'
+
+    def test_one_thread_can_make_requests_back_to_back(self, monkeypatch):
+        monkeypatch.setattr(
+            hyper.common.connection, 'HTTP11Connection', DummyH1Connection
+        )
+        monkeypatch.setattr(
+            hyper.common.connection, 'HTTP20Connection', DummyH2Connection
+        )
+        c = HTTPConnection('test', 80)
+        c._conn._send_http_upgrade = True
+        sent = []
+
+        def make_requests():
+            c.request('GET', '/')
+            c.request('GET', '/')
+            sent.append(True)
+
+        t = threading.Thread(target=make_requests)
+        t.daemon = True
+        t.start()
+        t.join(5)
+
+        # The requests are sent while the upgrade is still undecided, but
+        # only this thread may use the connection.
+        assert sent
+        assert c._owner is t
+        assert c._owned == 2
+
 
 class DummyH1Connection(object):
     def __init__(self,  host, port=None, secure=None, **kwargs):
@@ -1,5 +1,5 @@
 from __future__ import unicode_literals
-from hyper.common.headers import HTTPHeaderMap
+from hyper.common.headers import HTTPHeaderMap, LazyHTTPHeaderMap
 
 import pytest
 
@@ -124,6 +124,33 @@ class TestHTTPHeaderMap(object):
         assert h['set-cookie'] == [b'v1, v2']
         assert h.get(b'set-cookie') == [b'v1, v2']
 
+    def test_doesnt_split_inside_quoted_strings(self):
+        h = HTTPHeaderMap()
+        h['If-None-Match'] = 'W/"a,b", "c\\",d"'
+        h['Cache-Control'] = 'no-cache="set-cookie, x", max-age=0'
+
+        assert h['if-none-match'] == [b'W/"a,b"', b'"c\\",d"']
+        assert h['cache-control'] == [
+            b'no-cache="set-cookie, x"', b'max-age=0'
+        ]
+        assert len(h) == 4
+
+    def test_canonical_form_is_computed_once(self, monkeypatch):
+        h = HTTPHeaderMap([('k1', 'v1, v2'), ('k2', 'v3')])
+
+        def fail(*args):
+            raise AssertionError("canonical_form called again")
+
+        monkeypatch.setattr('hyper.common.headers.canonical_form', fail)
+
+        assert h['k1'] == [b'v1', b'v2']
+        assert list(h.items()) == [
+            (b'k1', b'v1'), (b'k1', b'v2'), (b'k2', b'v3')
+        ]
+
+        del h['k1']
+        assert list(h.items()) == [(b'k2', b'v3')]
+
     def test_equality(self):
         h1 = HTTPHeaderMap()
         h1['k1'] = 'v1, v2'
@@ -277,3 +304,47 @@ class TestHTTPHeaderMap(object):
             (b'name4', b'other_value'),
         ]
 
+
+    def test_index_is_kept_up_to_date(self):
+        h = HTTPHeaderMap([
+            (b'Name', b'value, other'),
+            (b'name2', b'value2'),
+        ])
+        h.merge(HTTPHeaderMap([(b'NAME', b'third')]))
+        h[b'name2'] = b'value3'
+
+        assert h[b'name'] == [b'value', b'other', b'third']
+        assert len(h) == 5
+
+        del h[b'nAmE']
+
+        assert b'name' not in h
+        assert len(h) == 2
+        assert list(h.iter_raw()) == [
+            (b'name2', b'value2'),
+            (b'name2', b'value3'),
+        ]
+
+    def test_deleting_duplicated_raw_tuples(self):
+        h1 = HTTPHeaderMap([(b'name', b'value'), (b'other', b'value')])
+        h2 = HTTPHeaderMap()
+        h2.merge(h1)
+        h2.merge(h1)
+
+        del h2[b'name']
+
+        assert list(h2.iter_raw()) == [
+            (b'other', b'value'),
+            (b'other', b'value'),
+        ]
+        assert len(h2) == 2
+
+    def test_lazy_header_map_is_built_on_first_use(self):
+        h = LazyHTTPHeaderMap([('Name', 'a, b'), (b'other', b'c')])
+
+        assert list(h.iter_raw()) == [(b'Name', b'a, b'), (b'other', b'c')]
+        assert '_items' not in h.__dict__
+
+        assert h[b'name'] == [b'a', b'b']
+        assert len(h) == 3
+        assert h == HTTPHeaderMap([('Name', 'a, b'), (b'other', b'c')])
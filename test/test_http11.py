@@ -5,7 +5,9 @@ test_http11.py
 
 Unit tests for hyper's HTTP/1.1 implementation.
 """
+import io
 import os
+import threading
 import zlib
 
 from collections import namedtuple
@@ -17,8 +19,13 @@ import pytest
 import hyper
 from hyper.http11.connection import HTTP11Connection
 from hyper.http11.response import HTTP11Response
+from hyper.http11.pool import HTTP11ConnectionPool
+from hyper.common.bufsocket import BufferedSocket
+from hyper.common.encoder import BLOCK_SIZE, compress_body
 from hyper.common.headers import HTTPHeaderMap
-from hyper.common.exceptions import ChunkedDecodeError, ConnectionResetError
+from hyper.common.exceptions import (
+    ChunkedDecodeError, ConnectionResetError, PoolExhaustedError
+)
 from hyper.compat import bytes, zlib_compressobj
 
 
@@ -124,6 +131,16 @@ class TestHTTP11Connection(object):
 
         assert received == expected
 
+    def test_request_timeouts_apply_to_the_socket(self):
+        c = HTTP11Connection('httpbin.org', timeout=(1, 2))
+        c._sock = sock = DummySocket()
+
+        c.request('GET', '/get')
+        assert sock.timeout == 2
+
+        c.request('GET', '/get', timeout=3)
+        assert sock.timeout == 3
+
     def test_iterable_header(self):
         c = HTTP11Connection('httpbin.org')
         c._sock = sock = DummySocket()
@@ -292,6 +309,85 @@ class TestHTTP11Connection(object):
 
         assert received == expected
 
+    def test_request_compression(self):
+        c = HTTP11Connection('httpbin.org', compress_requests='gzip')
+        c._sock = sock = DummySocket()
+
+        body = b'{"data": "telemetry"}' * 100
+        c.request('POST', '/post', body=body)
+
+        received = b''.join(sock.queue)
+        head, sent_body = received.split(b'\r\n\r\n', 1)
+
+        assert b'content-encoding: gzip' in head
+        assert (
+            b'content-length: ' + str(len(sent_body)).encode('ascii') in head
+        )
+        assert zlib.decompress(sent_body, 16 + zlib.MAX_WBITS) == body
+
+    def test_request_compression_streams_file_bodies(self):
+        c = HTTP11Connection(
+            'httpbin.org', compress_requests='deflate', compress_threshold=0
+        )
+        c._sock = sock = DummySocket()
+
+        f = DummyFile(b'oneline\nanotherline')
+        c.request('POST', '/post', body=f)
+
+        received = b''.join(sock.queue)
+        head, sent_body = received.split(b'\r\n\r\n', 1)
+
+        assert b'content-encoding: deflate' in head
+        assert b'transfer-encoding: chunked' in head
+        assert sent_body.endswith(b'0\r\n\r\n')
+
+        # Undo the chunking.
+        data = b''
+        while True:
+            length, sent_body = sent_body.split(b'\r\n', 1)
+            length = int(length, 16)
+            if not length:
+                break
+            data += sent_body[:length]
+            sent_body = sent_body[length + 2:]
+
+        assert zlib.decompress(data) == b'oneline\nanotherline'
+
+    def test_compressed_bodies_can_be_read_in_small_pieces(self):
+        # Random data doesn't compress, so there are several blocks of it.
+        original = os.urandom(3 * BLOCK_SIZE)
+        body = compress_body(BytesIO(original), 'deflate')
+
+        pieces = []
+        while True:
+            data = body.read(1000)
+            if not data:
+                break
+            assert len(data) <= 1000
+            pieces.append(data)
+
+        # Only what hasn't been read yet is held on to.
+        assert not body._pending
+        assert zlib.decompress(b''.join(pieces)) == original
+
+    def test_request_compression_skips_small_and_encoded_bodies(self):
+        c = HTTP11Connection('httpbin.org', compress_requests='gzip')
+        c._sock = sock = DummySocket()
+
+        c.request('POST', '/post', body=b'hi')
+        c.request(
+            'POST', '/post', body=b'x' * 2048,
+            headers={'content-encoding': 'identity'}
+        )
+
+        received = b''.join(sock.queue)
+        assert b'content-encoding: gzip' not in received
+        assert received.endswith(b'x' * 2048)
+
+    def test_request_compression_rejects_unknown_codings(self):
+        with pytest.raises(ValueError):
+            HTTP11Connection('httpbin.org', compress_requests='lzma')
+
     def test_chunked_overrides_body(self):
         c = HTTP11Connection('httpbin.org')
         c._sock = sock = DummySocket()
@@ -446,6 +542,139 @@ class TestHTTP11Connection(object):
 
         assert received == expected
 
+    def test_pipelined_responses_are_returned_in_order(self):
+        c = HTTP11Connection('httpbin.org', pipeline=True)
+        c._sock = sock = DummySocket()
+
+        c.request('GET', '/get')
+        c.request('GET', '/ip')
+
+        sock._buffer = BytesIO(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Length: 5\r\n"
+            b"\r\n"
+            b"first"
+            b"HTTP/1.1 200 OK\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"\r\n"
+            b"6\r\nsecond\r\n"
+            b"0\r\n\r\n"
+        )
+
+        r1 = c.get_response()
+        r2 = c.get_response()
+
+        assert r2.read() == b'second'
+        assert r1.read() == b'first'
+
+    def test_pipelining_skips_bodies_of_closed_responses(self):
+        c = HTTP11Connection('httpbin.org', pipeline=True)
+        c._sock = sock = DummySocket()
+
+        c.request('GET', '/get')
+        c.request('GET', '/ip')
+
+        sock._buffer = BytesIO(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Length: 5\r\n"
+            b"\r\n"
+            b"first"
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Length: 6\r\n"
+            b"\r\n"
+            b"second"
+        )
+
+        r1 = c.get_response()
+        r1.close()
+        r2 = c.get_response()
+
+        assert r2.read() == b'second'
+
+    def test_pipelined_requests_behind_a_closing_response_fail(self):
+        c = HTTP11Connection('httpbin.org', pipeline=True)
+        c._sock = sock = DummySocket()
+
+        c.request('GET', '/get')
+        c.request('GET', '/ip')
+
+        sock._buffer = BytesIO(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Length: 5\r\n"
+            b"Connection: close\r\n"
+            b"\r\n"
+            b"first"
+        )
+
+        assert c.get_response().read() == b'first'
+
+        with pytest.raises(ConnectionResetError):
+            c.get_response()
+
+    def test_pipelining_waits_before_non_idempotent_requests(self):
+        c = HTTP11Connection('httpbin.org', pipeline=True)
+        c._sock = sock = DummySocket()
+
+        c.request('GET', '/get')
+        sock._buffer = BytesIO(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Length: 5\r\n"
+            b"\r\n"
+            b"first"
+        )
+        sock.queue = []
+
+        c.request('POST', '/post', body=b'hi')
+
+        # The GET response was read before the POST went out.
+        assert sock._buffer.read() == b''
+        assert sock.queue
+
+        sock._buffer = BytesIO(
+            b"HTTP/1.1 201 Created\r\n"
+            b"Content-Length: 0\r\n"
+            b"\r\n"
+        )
+
+        r1 = c.get_response()
+        r2 = c.get_response()
+
+        assert r1.read() == b'first'
+        assert r2.status == 201
+
+    def test_pipelining_does_not_send_upgrade_headers(self):
+        c = HTTP11Connection('httpbin.org', pipeline=True)
+        c._sock = sock = DummySocket()
+
+        c.request('GET', '/get')
+        received = b''.join(sock.queue)
+
+        assert b'upgrade' not in received.lower()
+        assert b'http2-settings' not in received.lower()
+
+    def test_head_responses_have_no_body(self):
+        c = HTTP11Connection('httpbin.org', pipeline=True)
+        c._sock = sock = DummySocket()
+
+        c.request('HEAD', '/get')
+        c.request('GET', '/get')
+
+        sock._buffer = BytesIO(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Length: 5\r\n"
+            b"\r\n"
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Length: 5\r\n"
+            b"\r\n"
+            b"hello"
+        )
+
+        r1 = c.get_response()
+        r2 = c.get_response()
+
+        assert r1.read() == b''
+        assert r2.read() == b'hello'
+
 class TestHTTP11Response(object):
     def test_short_circuit_read(self):
         r = HTTP11Response(200, 'OK', {b'content-length': [b'0']}, None, None)
@@ -475,6 +704,56 @@ class TestHTTP11Response(object):
 
         assert r._sock == None
 
+    def test_readinto(self):
+        d = DummySocket()
+        d._buffer = BytesIO(b'hello world')
+        r = HTTP11Response(200, 'OK', {b'content-length': [b'11']}, d, None)
+
+        b = bytearray(6)
+        assert r.readinto(b) == 6
+        assert b == bytearray(b'hello ')
+        assert r.readinto(b) == 5
+        assert b[:5] == bytearray(b'world')
+        assert r.readinto(b) == 0
+        assert r._sock is None
+
+    def test_readinto_chunked(self):
+        d = DummySocket()
+        d._buffer = BytesIO(b'4\r\nwell\r\n5\r\nthere\r\n0\r\n\r\n')
+        r = HTTP11Response(
+            200, 'OK', {b'transfer-encoding': [b'chunked']}, d, None
+        )
+
+        received = b''
+        b = bytearray(3)
+        while True:
+            read = r.readinto(b)
+            if not read:
+                break
+            received += bytes(b[:read])
+
+        assert received == b'wellthere'
+
+    def test_readline(self):
+        d = DummySocket()
+        d._buffer = BytesIO(b'line one\nline two\n')
+        r = HTTP11Response(200, 'OK', {b'content-length': [b'18']}, d, None)
+
+        assert r.readline() == b'line one\n'
+        assert r.readline(4) == b'line'
+        assert r.readline() == b' two\n'
+        assert r.readline() == b''
+
+    def test_response_wrapped_in_buffered_reader(self):
+        d = DummySocket()
+        d._buffer = BytesIO(b'line one\nline two\n')
+        r = HTTP11Response(200, 'OK', {b'content-length': [b'18']}, d, None)
+
+        with io.BufferedReader(r) as f:
+            assert list(f) == [b'line one\n', b'line two\n']
+
+        assert r.closed
+
     def test_response_transparently_decrypts_gzip(self):
         d = DummySocket()
         headers = {b'content-encoding': [b'gzip'], b'connection': [b'close']}
@@ -487,6 +766,29 @@ class TestHTTP11Response(object):
 
         assert r.read() == b'this is test data'
 
+    def test_bounded_reads_of_compressed_body(self):
+        c = zlib_compressobj(wbits=31)
+        body = c.compress(b'a' * 100000)
+        body += c.flush()
+        body_len = ('%s' % len(body)).encode('ascii')
+
+        headers = {
+            b'content-encoding': [b'gzip'], b'content-length': [body_len]
+        }
+        d = DummySocket()
+        d._buffer = BytesIO(body)
+        r = HTTP11Response(200, 'OK', headers, d, None)
+
+        received = []
+        while True:
+            data = r.read(1000)
+            if not data:
+                break
+            assert len(data) <= 1000
+            received.append(data)
+
+        assert b''.join(received) == b'a' * 100000
+
     def test_response_transparently_decrypts_real_deflate(self):
         d = DummySocket()
         headers = {b'content-encoding': [b'deflate'], b'connection': [b'close']}
@@ -576,6 +878,42 @@ class TestHTTP11Response(object):
 
         assert received_body == b'this is test data'
 
+    def test_iter_content_gathers_chunks_into_pieces(self):
+        d = DummySocket()
+        r = HTTP11Response(
+            200, 'OK', {b'transfer-encoding': [b'chunked']}, d, None
+        )
+        d._buffer = BytesIO(
+            b'4\r\nwell\r\n'
+            b'4\r\nwell\r\n'
+            b'4\r\nwhat\r\n'
+            b'4\r\nhave\r\n'
+            b'2\r\nwe\r\n'
+            b'a\r\nhereabouts\r\n'
+            b'0\r\n\r\n'
+        )
+
+        assert list(r.iter_content(10)) == [
+            b'wellwellwh', b'athavewehe', b'reabouts'
+        ]
+
+    def test_iterating_over_response_reusing_buffer(self):
+        d = DummySocket()
+        r = HTTP11Response(200, 'OK', {b'content-length': [b'25']}, d, None)
+        d._buffer = BytesIO(b'a' * 20 + b'b' * 5)
+
+        pieces = list(r.iter_content(10, reuse_buffer=True))
+        assert len(pieces) == 3
+        assert pieces[2].tobytes() == b'bbbbb'
+
+        # Every piece shares the one buffer, so the first piece has been
+        # overwritten by the last.
+        assert pieces[0].tobytes() == b'bbbbbaaaaa'
+
+        d._buffer = BytesIO(b'hello')
+        r = HTTP11Response(200, 'OK', {b'content-length': [b'5']}, d, None)
+        assert list(r) == [b'hello']
+
     def test_chunked_normal_read(self):
         d = DummySocket()
         r = HTTP11Response(
@@ -616,6 +954,58 @@ class TestHTTP11Response(object):
         assert r.read(20) == b'reabouts'
         assert r.read() == b''
 
+    def test_chunk_extensions_and_trailers(self):
+        d = DummySocket()
+        r = HTTP11Response(
+            200, 'OK', {b'transfer-encoding': [b'chunked']}, d, None
+        )
+
+        data = (
+            b'4;name=value\r\nwell\r\n'
+            b'6 ; other\r\nplayed\r\n'
+            b'0\r\n'
+            b'Expires: never\r\n'
+            b'Checksum: abc\r\n'
+            b'\r\n'
+        )
+        d._buffer = BytesIO(data)
+
+        assert list(r.read_chunked()) == [b'well', b'played']
+        assert list(r.trailers.items()) == [
+            (b'expires', b'never'), (b'checksum', b'abc')
+        ]
+
+    def test_invalid_chunk_length(self):
+        d = DummySocket()
+        r = HTTP11Response(
+            200, 'OK', {b'transfer-encoding': [b'chunked']}, d, None
+        )
+        d._buffer = BytesIO(b'zz\r\nwell\r\n0\r\n\r\n')
+
+        with pytest.raises(ChunkedDecodeError):
+            r.read()
+
+    def test_chunks_arriving_in_pieces(self):
+        class TrickleSocket(DummySocket):
+            def recv(self, l):
+                return super(TrickleSocket, self).recv(min(l, 3))
+
+        d = TrickleSocket()
+        r = HTTP11Response(
+            200, 'OK', {b'transfer-encoding': [b'chunked']}, d, None
+        )
+        d._buffer = BytesIO(
+            b'a\r\nhereabouts\r\n'
+            b'4\r\nwell\r\n'
+            b'0\r\n\r\n'
+        )
+
+        assert r.read(3) == b'her'
+        assert r.read(9) == b'eaboutswe'
+        assert r.read() == b'll'
+        assert r.read() == b''
+        assert r._buffered_size == 0
+
     def test_bounded_read_expect_close_no_content_length(self):
         d = DummySocket()
         r = HTTP11Response(200, 'OK', {b'connection': [b'close']}, d, None)
@@ -628,6 +1018,67 @@ class TestHTTP11Response(object):
 
         assert r._sock is None
 
+    def test_bounded_read_expect_close_socket_reset(self):
+        class ResettingSocket(DummySocket):
+            def recv(self, l):
+                data = super(ResettingSocket, self).recv(l)
+                if not data:
+                    raise ConnectionResetError()
+                return data
+
+        d = ResettingSocket()
+        r = HTTP11Response(200, 'OK', {b'connection': [b'close']}, d, None)
+        d._buffer = BytesIO(b'hello there sir')
+
+        assert r.read(10) == b'hello ther'
+        assert r.read(10) == b'e sir'
+        assert r.read(10) == b''
+        assert r._sock is None
+
+    def test_compressed_read_expect_close_is_streamed(self):
+        headers = {b'connection': [b'close'], b'content-encoding': [b'gzip']}
+
+        c = zlib_compressobj(wbits=31)
+        body = c.compress(os.urandom(100000))
+        body += c.flush()
+
+        d = DummySocket()
+        r = HTTP11Response(200, 'OK', headers, d, None)
+        d._buffer = BytesIO(body)
+
+        assert len(r.read(10)) == 10
+
+        # Only as much of the body as was needed has been read.
+        assert d._buffer.tell() < 1000
+
+    def test_large_read_bypasses_socket_buffer(self):
+        class RawSocket(object):
+            def __init__(self, data):
+                self.data = BytesIO(data)
+                self.reads = []
+
+            def recv_into(self, buffer):
+                self.reads.append(len(buffer))
+                data = self.data.read(min(len(buffer), 100000))
+                buffer[:len(data)] = data
+                return len(data)
+
+        body = os.urandom(300000)
+        s = RawSocket(body)
+        d = BufferedSocket(s, buffer_size=1000)
+        r = HTTP11Response(
+            200, 'OK', {b'content-length': [b'300000']}, d, None
+        )
+
+        assert d.recv(10).tobytes() == body[:10]
+        r._length -= 10
+
+        assert r.read() == body[10:]
+
+        # After the 990 bytes left in the socket's buffer, the rest of the
+        # body was received straight into the response body.
+        assert max(s.reads) == 299000
+
     def test_bounded_read_expect_close_with_content_length(self):
         headers = {b'connection': [b'close'], b'content-length': [b'15']}
         d = DummySocket()
@@ -770,15 +1221,127 @@ class TestHTTP11Response(object):
         assert connection.close.call_count == 1
 
 
+class TestHTTP11ConnectionPool(object):
+    def test_pool_creates_connections(self):
+        p = HTTP11ConnectionPool()
+        c = p.get_connection('httpbin.org')
+
+        assert isinstance(c, HTTP11Connection)
+        assert c.host == 'httpbin.org'
+        assert c.port == 80
+        assert not c.secure
+
+    def test_pool_reuses_returned_connections(self):
+        p = HTTP11ConnectionPool()
+        c1 = p.get_connection('httpbin.org')
+        c1._sock = DummySocket()
+        p.put_connection(c1)
+        c2 = p.get_connection('httpbin.org:80')
+
+        assert c1 is c2
+
+    def test_pool_doesnt_share_checked_out_connections(self):
+        p = HTTP11ConnectionPool()
+        c1 = p.get_connection('httpbin.org')
+        c2 = p.get_connection('httpbin.org')
+
+        assert c1 is not c2
+
+    def test_pool_separates_origins(self):
+        p = HTTP11ConnectionPool()
+        c1 = p.get_connection('httpbin.org')
+        p.put_connection(c1)
+        c2 = p.get_connection('httpbin.org', 443)
+
+        assert c1 is not c2
+        assert c2.secure
+
+    def test_pool_discards_stale_connections(self):
+        p = HTTP11ConnectionPool()
+        c1 = p.get_connection('httpbin.org')
+        c1._sock = sock = DummySocket()
+        p.put_connection(c1)
+
+        # The server closing the connection makes the socket readable.
+        sock.can_read = True
+        c2 = p.get_connection('httpbin.org')
+
+        assert c1 is not c2
+        assert c1._sock is None
+
+    def test_pool_evicts_idle_connections(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr('hyper.http11.pool.time.time', lambda: now[0])
+
+        p = HTTP11ConnectionPool(idle_timeout=10)
+        c1 = p.get_connection('httpbin.org')
+        c1._sock = DummySocket()
+        p.put_connection(c1)
+        now[0] += 11
+        c2 = p.get_connection('httpbin.org')
+
+        assert c1 is not c2
+        assert c1._sock is None
+
+    def test_non_blocking_checkout_from_full_pool_fails(self):
+        p = HTTP11ConnectionPool(maxsize=1)
+        p.get_connection('httpbin.org')
+
+        with pytest.raises(PoolExhaustedError):
+            p.get_connection('httpbin.org', block=False)
+
+    def test_blocking_checkout_from_full_pool_times_out(self):
+        p = HTTP11ConnectionPool(maxsize=1)
+        p.get_connection('httpbin.org')
+
+        with pytest.raises(PoolExhaustedError):
+            p.get_connection('httpbin.org', timeout=0.01)
+
+    def test_blocking_checkout_waits_for_returned_connection(self):
+        p = HTTP11ConnectionPool(maxsize=1)
+        c1 = p.get_connection('httpbin.org')
+        timer = threading.Timer(0.01, p.put_connection, args=(c1,))
+        timer.start()
+
+        c2 = p.get_connection('httpbin.org', timeout=5)
+        timer.join()
+
+        assert c1 is c2
+
+    def test_closing_pool_closes_idle_connections(self):
+        p = HTTP11ConnectionPool(maxsize=1)
+        c1 = p.get_connection('httpbin.org')
+        c1._sock = DummySocket()
+        p.put_connection(c1)
+        p.close()
+
+        assert c1._sock is None
+        assert p.get_connection('httpbin.org', block=False) is not c1
+
+    def test_discarding_connections_frees_their_place(self):
+        p = HTTP11ConnectionPool(maxsize=1)
+        c1 = p.get_connection('httpbin.org')
+        c1._sock = DummySocket()
+
+        p.discard_connection(c1)
+
+        assert c1._sock is None
+        assert p.get_connection('httpbin.org', block=False) is not c1
+
+
 class DummySocket(object):
     def __init__(self):
         self.queue = []
         self._buffer = BytesIO()
         self.can_read = False
+        self.timeout = None
 
     @property
     def buffer(self):
-        return memoryview(self._buffer.getvalue())
+        return memoryview(self._buffer.getvalue()[self._buffer.tell():])
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
 
     def advance_buffer(self, amt):
         self._buffer.read(amt)
@@ -2,29 +2,38 @@
 from hyper.packages.hyperframe.frame import (
     Frame, DataFrame, RstStreamFrame, SettingsFrame,
     PushPromiseFrame, PingFrame, WindowUpdateFrame, HeadersFrame,
-    ContinuationFrame, BlockedFrame, GoAwayFrame, FRAME_MAX_LEN, FRAME_MAX_ALLOWED_LEN
+    ContinuationFrame, BlockedFrame, GoAwayFrame, PriorityFrame, FRAME_MAX_LEN,
+    FRAME_MAX_ALLOWED_LEN
 )
 from hyper.packages.hpack.hpack_compat import Encoder, Decoder
-from hyper.http20.connection import HTTP20Connection
+from hyper.http20.connection import HTTP20Connection, MAX_STREAM_ID
 from hyper.http20.stream import (
     Stream, STATE_HALF_CLOSED_LOCAL, STATE_OPEN, MAX_CHUNK, STATE_CLOSED
 )
 from hyper.http20.response import HTTP20Response, HTTP20Push
 from hyper.http20.exceptions import (
     HPACKDecodingError, HPACKEncodingError, ProtocolError, ConnectionError,
+    StreamResetError,
 )
 from hyper.http20.window import FlowControlManager
+from hyper.http20.pool import HTTP20ConnectionPool
 from hyper.http20.util import (
     combine_repeated_headers, split_repeated_headers, h2_safe_headers
 )
-from hyper.common.headers import HTTPHeaderMap
+from hyper.common.decoder import BufferedDecoder, register_decoder
+from hyper.common.exceptions import ConnectionResetError
+from hyper.common.headers import HTTPHeaderMap, LazyHTTPHeaderMap
 from hyper.compat import zlib_compressobj, is_py2
 from hyper.contrib import HTTP20Adapter
+import hyper.common.decoder as decoder
 import hyper.http20.errors as errors
 import errno
+import io
 import os
 import pytest
 import socket
+import ssl
+import time
 import zlib
 from io import BytesIO
 import hyper
@@ -186,7 +195,7 @@ class TestHyperConnection(object):
         c._recv_cb()
 
         s = c.recent_stream
-        assert s.data == [b'testdata']
+        assert list(s.data) == [b'testdata']
 
     def test_we_can_read_fitfully_from_the_socket(self):
         sock = DummyFitfullySocket()
@@ -203,7 +212,37 @@ class TestHyperConnection(object):
         c._recv_cb()
 
         s = c.recent_stream
-        assert s.data == [b'testdata+payload']
+        assert list(s.data) == [b'testdata+payload']
+
+    def test_frame_payloads_are_received_into_their_buffer(self):
+        sock = DummySocket()
+        sock.buffer = BytesIO(
+            b'\x00\x00\x08\x00\x01\x00\x00\x00\x01'
+            b'testdata'
+        )
+        reads = []
+
+        def recv(l):
+            reads.append(l)
+            return memoryview(sock.buffer.read(l))
+
+        def recv_into(buffer):
+            reads.append(buffer)
+            return sock.buffer.readinto(buffer)
+        sock.recv = recv
+        sock.recv_into = recv_into
+
+        c = HTTP20Connection('www.google.com')
+        c._sock = sock
+        c.putrequest('GET', '/')
+        c.endheaders()
+        c._recv_cb()
+
+        # Only the frame header is read with recv.
+        assert reads[0] == 9
+        assert len(reads) == 2 and len(reads[1]) == 8
+        s = c.recent_stream
+        assert list(s.data) == [b'testdata']
 
     def test_putrequest_sends_data(self):
         sock = DummySocket()
@@ -221,6 +260,24 @@ class TestHyperConnection(object):
         assert len(sock.queue) == 2
         assert c._out_flow_control_window == 65535 - len(b'hello')
 
+    def test_request_compression(self):
+        sock = DummySocket()
+
+        c = HTTP20Connection('www.google.com', compress_requests='gzip')
+        c._sock = sock
+        body = b'{"data": "telemetry"}' * 100
+        c.request('POST', '/', body=body)
+        s = c.recent_stream
+
+        assert s.headers[b'content-encoding'] == [b'gzip']
+
+        frames = [
+            decode_frame(memoryview(data)) for data in sock.queue[1:]
+        ]
+        sent = b''.join(f.data for f in frames)
+        assert zlib.decompress(sent, 16 + zlib.MAX_WBITS) == body
+        assert 'END_STREAM' in frames[-1].flags
+
     def test_different_request_headers(self):
         sock = DummySocket()
 
@@ -438,6 +495,77 @@ class TestHyperConnection(object):
         assert c.get_response(r3).headers == HTTPHeaderMap([('content-type', 'baz/qux')])
         assert c.get_response(r1).headers == HTTPHeaderMap([('content-type', 'foo/bar')])
 
+    def test_streams_look_again_if_frames_were_read_meanwhile(self):
+        # Another thread may read the frames a stream is waiting for between
+        # the stream checking for them and asking for more.
+        e = Encoder()
+        h = HeadersFrame(1)
+        h.data = e.encode({':status': 200})
+        h.flags |= set(['END_HEADERS', 'END_STREAM'])
+        sock = DummySocket()
+        sock.buffer = BytesIO(h.serialize())
+
+        c = HTTP20Connection('www.google.com')
+        c._sock = sock
+        s = c.streams[c.request('GET', '/')]
+        s._frames_seen = c._frames_read
+
+        c._recv_cb()
+        assert s.response_headers is not None
+
+        # The socket is empty, so trying to read from it would fail.
+        s._recv_cb()
+        assert s._frames_seen == c._frames_read
+
+    def test_resets_are_raised_for_the_stream_that_was_reset(self):
+        f = RstStreamFrame(3)
+        f.error_code = 8
+        sock = DummySocket()
+        sock.buffer = BytesIO(f.serialize())
+
+        c = HTTP20Connection('www.google.com')
+        c._sock = sock
+        s1 = c.streams[c.request('GET', '/a')]
+        s3 = c.streams[c.request('GET', '/b')]
+        s1._frames_seen = c._frames_read
+
+        # Reading the reset on behalf of another stream doesn't fail.
+        s1._recv_cb()
+
+        with pytest.raises(StreamResetError) as e:
+            s3._recv_cb()
+
+        assert e.value.error_code == 8
+
+    def test_reading_a_response_times_out(self):
+        c = HTTP20Connection('www.google.com', timeout=(1, 0.01))
+        c._sock = DummySocket()
+        s = c.streams[c.request('GET', '/')]
+
+        assert s._timeout == 0.01
+
+        # Another thread is reading frames, but none arrive.
+        s._frames_seen = c._frames_read
+        c._reading = True
+        with pytest.raises(socket.timeout):
+            s._recv_cb()
+
+    def test_timeouts_can_be_set_per_request(self):
+        c = HTTP20Connection('www.google.com', timeout=1)
+        c._sock = DummySocket()
+        s1 = c.streams[c.request('GET', '/a')]
+        s3 = c.streams[c.request('GET', '/b', timeout=(1, 30))]
+
+        assert s1._timeout == 1
+        assert s3._timeout == 30
+
+    def test_reads_time_out_after_five_seconds_by_default(self):
+        c = HTTP20Connection('www.google.com')
+        c._sock = DummySocket()
+        s = c.streams[c.request('GET', '/')]
+
+        assert s._timeout == 5
+
     def test_headers_with_continuation(self):
         e = Encoder()
         header_data = e.encode(
@@ -536,6 +664,343 @@ class TestHyperConnection(object):
         assert frames[0].flags == set(['ACK'])
         assert frames[0].opaque_data == b'12345678'
 
+    def test_ping_measures_round_trip_time(self):
+        ack = PingFrame(0)
+        ack.flags = set(['ACK'])
+        ack.opaque_data = b'\x00' * 8
+        sock = DummySocket()
+        sock.buffer = BytesIO(ack.serialize())
+
+        c = HTTP20Connection('www.google.com')
+        c._sock = sock
+
+        rtt = c.ping()
+
+        assert rtt >= 0
+        assert c.rtt == rtt
+
+        f = decode_frame(memoryview(sock.queue[0]))
+        assert isinstance(f, PingFrame)
+        assert 'ACK' not in f.flags
+        assert f.opaque_data == b'\x00' * 8
+
+    def test_waiting_for_frames_uses_the_socket_timeout(self):
+        waits = []
+
+        def wait_for_data(timeout=None):
+            waits.append(timeout)
+            return False
+
+        sock = DummySocket()
+        sock.wait_for_data = wait_for_data
+        sock.gettimeout = lambda: 5
+
+        c = HTTP20Connection('www.google.com', timeout=(5, None))
+        c._sock = sock
+
+        with pytest.raises(socket.timeout):
+            c._recv_cb()
+
+        assert waits == [5]
+
+    def test_rtt_estimate_is_smoothed(self):
+        ack = PingFrame(0)
+        ack.flags = set(['ACK'])
+        ack.opaque_data = b'\x00' * 8
+        sock = DummySocket()
+        sock.buffer = BytesIO(ack.serialize())
+
+        c = HTTP20Connection('www.google.com')
+        c._sock = sock
+        c._smoothed_rtt = 1.0
+
+        rtt = c.ping()
+
+        assert c.rtt == 1.0 + (rtt - 1.0) / 8
+
+    def test_keepalive_replaces_dead_connections(self):
+        def dead_recv(l):
+            raise ConnectionResetError()
+
+        sock = DummySocket()
+        sock.recv = dead_recv
+        new_sock = DummySocket()
+
+        c = HTTP20Connection('www.google.com', keepalive=10)
+        c._sock = sock
+        c._last_received = time.time() - 60
+        c.connect = lambda: setattr(c, '_sock', c._sock or new_sock)
+
+        c.request('GET', '/')
+
+        assert c._sock is new_sock
+        assert len(new_sock.queue) == 1
+
+    def test_keepalive_replaces_connections_that_dont_answer(self):
+        waits = []
+
+        def wait_for_data(timeout=None):
+            waits.append(timeout)
+            return False
+
+        sock = DummySocket()
+        sock.wait_for_data = wait_for_data
+        new_sock = DummySocket()
+
+        c = HTTP20Connection('www.google.com', keepalive=10)
+        c._sock = sock
+        c._last_received = time.time() - 60
+        c.connect = lambda: setattr(c, '_sock', c._sock or new_sock)
+
+        c.request('GET', '/')
+
+        assert c._sock is new_sock
+        assert len(waits) == 1
+        assert 9 < waits[0] <= 10
+        assert not c._pings_in_flight
+
+    def test_keepalive_does_not_ping_active_connections(self):
+        c = HTTP20Connection('www.google.com', keepalive=10)
+        c._sock = sock = DummySocket()
+        c._last_received = time.time()
+
+        c.request('GET', '/')
+
+        assert len(sock.queue) == 1
+        assert not c._pings_in_flight
+
+    def test_request_priority_is_sent_with_headers(self):
+        c = HTTP20Connection('www.google.com')
+        c._sock = sock = DummySocket()
+
+        c.request('GET', '/', weight=32, depends_on=1, exclusive=True)
+
+        f = decode_frame(memoryview(sock.queue[0]))
+        assert 'PRIORITY' in f.flags
+        assert f.stream_weight == 31
+        assert f.depends_on == 1
+        assert f.exclusive
+
+    def test_requests_without_priority_send_none(self):
+        c = HTTP20Connection('www.google.com')
+        c._sock = sock = DummySocket()
+
+        c.request('GET', '/')
+
+        f = decode_frame(memoryview(sock.queue[0]))
+        assert 'PRIORITY' not in f.flags
+
+    def test_set_priority_sends_priority_frame(self):
+        c = HTTP20Connection('www.google.com')
+        c._sock = sock = DummySocket()
+        stream_id = c.request('GET', '/')
+
+        c.set_priority(stream_id, weight=256, depends_on=3)
+
+        f = decode_frame(memoryview(sock.queue[-1]))
+        assert isinstance(f, PriorityFrame)
+        assert f.stream_id == stream_id
+        assert f.stream_weight == 255
+        assert f.depends_on == 3
+        assert not f.exclusive
+
+    def test_interleaved_bodies_are_shared_by_weight(self):
+        c = HTTP20Connection('www.google.com', interleave_bodies=True)
+        c._sock = sock = DummySocket()
+
+        upload = c.request('POST', '/upload', body=b'a' * 10240, weight=16)
+        rpc = c.request('POST', '/rpc', body=b'b' * 2048, weight=256)
+
+        # Only the headers are sent up front.
+        assert len(sock.queue) == 2
+
+        c._send_bodies(c.streams[rpc])
+
+        frames = [decode_frame(memoryview(d)) for d in sock.queue[2:]]
+        assert [f.stream_id for f in frames] == [upload, rpc, rpc]
+        assert c._scheduler.pending(c.streams[upload])
+
+    def test_dependent_streams_wait_for_their_parents(self):
+        c = HTTP20Connection('www.google.com', interleave_bodies=True)
+        c._sock = sock = DummySocket()
+
+        parent = c.request('POST', '/', body=b'a' * 2048)
+        child = c.request(
+            'POST', '/', body=b'b' * 2048, weight=256, depends_on=parent
+        )
+
+        c._send_bodies()
+
+        frames = [decode_frame(memoryview(d)) for d in sock.queue[2:]]
+        assert [f.stream_id for f in frames] == [parent, parent, child, child]
+
+    def test_flow_controlled_streams_are_passed_over(self):
+        c = HTTP20Connection('www.google.com', interleave_bodies=True)
+        c._sock = sock = DummySocket()
+
+        blocked = c.request('POST', '/', body=b'a' * 1024)
+        c.streams[blocked]._out_flow_control_window = 0
+        other = c.request('POST', '/', body=b'b' * 100)
+
+        c._send_bodies(c.streams[other])
+
+        frames = [decode_frame(memoryview(d)) for d in sock.queue[2:]]
+        assert [f.stream_id for f in frames] == [other]
+
+    def test_larger_initial_window_is_advertised(self):
+        c = HTTP20Connection('www.google.com', initial_window_size=1048576)
+        c._sock = sock = DummySocket()
+        c._recv_cb = lambda: None
+
+        c._send_preamble()
+
+        frames = [decode_frame(memoryview(d)) for d in sock.queue[1:]]
+        assert isinstance(frames[0], SettingsFrame)
+        assert frames[0].settings[SettingsFrame.INITIAL_WINDOW_SIZE] == 1048576
+        assert isinstance(frames[1], WindowUpdateFrame)
+        assert frames[1].stream_id == 0
+        assert frames[1].window_increment == 1048576 - 65535
+
+        stream_id = c.request('GET', '/')
+        assert c.window_manager.initial_window_size == 1048576
+        assert (
+            c.streams[stream_id]._in_window_manager.initial_window_size ==
+            1048576
+        )
+
+    def test_default_initial_window_is_not_advertised(self):
+        c = HTTP20Connection('www.google.com')
+        c._sock = sock = DummySocket()
+        c._recv_cb = lambda: None
+
+        c._send_preamble()
+
+        assert len(sock.queue) == 2
+        f = decode_frame(memoryview(sock.queue[1]))
+        assert SettingsFrame.INITIAL_WINDOW_SIZE not in f.settings
+
+    def test_local_settings_are_advertised(self):
+        c = HTTP20Connection(
+            'www.google.com',
+            max_frame_size=65536,
+            header_table_size=65536,
+            max_concurrent_streams=10,
+        )
+        c._sock = sock = DummySocket()
+        c._recv_cb = lambda: None
+
+        c._send_preamble()
+
+        f = decode_frame(memoryview(sock.queue[1]))
+        assert f.settings == {
+            SettingsFrame.ENABLE_PUSH: 0,
+            SettingsFrame.SETTINGS_MAX_FRAME_SIZE: 65536,
+            SettingsFrame.HEADER_TABLE_SIZE: 65536,
+            SettingsFrame.MAX_CONCURRENT_STREAMS: 10,
+        }
+        assert c.decoder.header_table_size == 65536
+
+    def test_larger_max_frame_size_allows_larger_frames(self):
+        f = DataFrame(1)
+        f.data = b'a' * 20000
+        f.flags.add('END_STREAM')
+        sock = DummySocket()
+        sock.buffer = BytesIO(f.serialize())
+
+        c = HTTP20Connection('www.google.com', max_frame_size=65536)
+        c._sock = sock
+        stream = c._new_stream()
+        stream.state = STATE_HALF_CLOSED_LOCAL
+
+        c._recv_cb()
+
+        assert list(stream.data) == [b'a' * 20000]
+        assert not [
+            q for q in sock.queue
+            if isinstance(decode_frame(memoryview(q)), RstStreamFrame)
+        ]
+
+    def test_full_connection_buffers_withhold_window_updates(self):
+        f = DataFrame(1)
+        f.data = b'a' * 20
+        sock = DummySocket()
+        sock.buffer = BytesIO(f.serialize())
+
+        c = HTTP20Connection(
+            'www.google.com', initial_window_size=100, max_buffer_size=10
+        )
+        c._sock = sock
+        stream = c._new_stream()
+        stream.state = STATE_HALF_CLOSED_LOCAL
+
+        c._recv_cb()
+
+        frames = [decode_frame(memoryview(d)) for d in sock.queue]
+        assert [f.stream_id for f in frames] == [1]
+        assert c._withheld_window == 20
+
+        # Once the data is read, the window is released before the next read.
+        assert stream._read_one_frame() == b'a' * 20
+        f = DataFrame(1)
+        f.flags.add('END_STREAM')
+        sock.buffer = BytesIO(f.serialize())
+        sock.queue = []
+
+        c._recv_cb()
+
+        frames = [decode_frame(memoryview(d)) for d in sock.queue]
+        assert frames[0].stream_id == 0
+        assert frames[0].window_increment == 20
+        assert c._withheld_window == 0
+
+    def test_connection_keeps_a_total_of_buffered_data(self):
+        frames = []
+        for stream_id in (1, 3):
+            f = DataFrame(stream_id)
+            f.data = b'a' * 20
+            frames.append(f.serialize())
+        sock = DummySocket()
+        sock.buffer = BytesIO(b''.join(frames))
+
+        c = HTTP20Connection('www.google.com', max_buffer_size=100)
+        c._sock = sock
+        first = c._new_stream()
+        second = c._new_stream()
+        first.state = second.state = STATE_HALF_CLOSED_LOCAL
+
+        c._recv_cb()
+        c._recv_cb()
+        assert c._buffered_size == 40
+
+        # Reading data out of a stream takes it off the total, as does
+        # closing a stream with data still in it.
+        assert first._read_one_frame() == b'a' * 20
+        assert c._buffered_size == 20
+
+        second.close()
+        assert c._buffered_size == 0
+
+    def test_invalid_max_frame_size_is_rejected(self):
+        with pytest.raises(ValueError):
+            HTTP20Connection('www.google.com', max_frame_size=1024)
+
+    def test_invalid_initial_window_size_is_rejected(self):
+        with pytest.raises(ValueError):
+            HTTP20Connection('www.google.com', initial_window_size=2**31)
+
+    def test_settings_ack_gives_first_rtt_estimate(self):
+        c = HTTP20Connection('www.google.com')
+        c._sock = DummySocket()
+        c._recv_cb = lambda: None
+        c._send_preamble()
+
+        f = SettingsFrame(0)
+        f.flags.add('ACK')
+        c.receive_frame(f)
+
+        assert c.rtt is not None
+        assert c.window_manager.rtt == c.rtt
+
     def test_blocked_causes_window_updates(self):
         frames = []
 
@@ -588,6 +1053,186 @@ class TestHyperConnection(object):
         assert mutable['counter'] == 10
 
 
+    def test_running_out_of_stream_ids_rolls_over(self):
+        e = Encoder()
+        h = HeadersFrame(MAX_STREAM_ID)
+        h.data = e.encode([(':status', 200)])
+        h.flags = set(['END_HEADERS'])
+        d = DataFrame(MAX_STREAM_ID)
+        d.data = b'last one'
+        d.flags = set(['END_STREAM'])
+        sock = DummySocket()
+        sock.buffer = BytesIO(h.serialize() + d.serialize())
+        closed = []
+        sock.close = lambda: closed.append(sock)
+        new_sock = DummySocket()
+
+        c = HTTP20Connection('www.google.com')
+        c._sock = sock
+        c.connect = lambda: setattr(c, '_sock', c._sock or new_sock)
+        c.next_stream_id = MAX_STREAM_ID
+
+        assert c.request('GET', '/') == MAX_STREAM_ID
+        assert c.request('GET', '/') == 1
+
+        # The old connection is left open, unread, for the old stream.
+        assert c._sock is new_sock
+        assert len(new_sock.queue) == 1
+        assert sock.buffer.tell() == 0
+        assert not closed
+
+        resp = c.get_response(MAX_STREAM_ID)
+        assert resp.read() == b'last one'
+
+        # It's closed once the old stream is.
+        resp.close()
+        assert closed == [sock]
+
+    def test_drained_streams_release_their_withheld_window(self):
+        e = Encoder()
+        h = HeadersFrame(MAX_STREAM_ID)
+        h.data = e.encode([(':status', 200)])
+        h.flags = set(['END_HEADERS'])
+        d1 = DataFrame(MAX_STREAM_ID)
+        d1.data = b'a' * 20
+        d2 = DataFrame(MAX_STREAM_ID)
+        d2.data = b'b'
+        d2.flags = set(['END_STREAM'])
+        sock = DummySocket()
+        sock.buffer = BytesIO(h.serialize() + d1.serialize() + d2.serialize())
+
+        c = HTTP20Connection(
+            'www.google.com', initial_window_size=30, max_stream_buffer_size=10
+        )
+        c._sock = sock
+        c.connect = lambda: setattr(c, '_sock', c._sock or DummySocket())
+        c.next_stream_id = MAX_STREAM_ID
+
+        c.request('GET', '/')
+        resp = c.get_response(MAX_STREAM_ID)
+
+        # The first DATA frame fills the buffer, so its window is held back.
+        c._recv_cb()
+        c.request('GET', '/')
+        sock.queue = []
+
+        # The server needs the window to finish sending the old response.
+        assert resp.read() == b'a' * 20 + b'b'
+        frames = [decode_frame(memoryview(d)) for d in sock.queue]
+        assert [
+            (f.type, f.window_increment) for f in frames
+            if f.stream_id == MAX_STREAM_ID
+        ] == [(WindowUpdateFrame.type, 20)]
+
+    def test_goaway_keeps_processed_streams_going(self):
+        c = HTTP20Connection('www.google.com')
+        c._sock = sock = DummySocket()
+        c.request('GET', '/')
+
+        c.receive_frame(GoAwayFrame(0, last_stream_id=1))
+
+        assert c._sock is sock
+        assert 1 in c.streams
+
+    def test_goaway_replays_unprocessed_streams(self):
+        e = Encoder()
+        h = HeadersFrame(1)
+        h.data = e.encode([(':status', 200)])
+        h.flags = set(['END_HEADERS', 'END_STREAM'])
+        sock = DummySocket()
+        sock.buffer = BytesIO(h.serialize())
+
+        e = Encoder()
+        h = HeadersFrame(5)
+        h.data = e.encode([(':status', 201)])
+        h.flags = set(['END_HEADERS', 'END_STREAM'])
+        new_sock = DummySocket()
+        new_sock.buffer = BytesIO(h.serialize())
+
+        c = HTTP20Connection('www.google.com')
+        c._sock = sock
+        c.connect = lambda: setattr(c, '_sock', c._sock or new_sock)
+        c.request('GET', '/')
+        c.request('POST', '/', body=b'hello')
+
+        c.receive_frame(GoAwayFrame(0, last_stream_id=1))
+
+        # The second request has been sent again on the new connection.
+        assert c._sock is new_sock
+        frames = list(map(decode_frame, map(memoryview, new_sock.queue)))
+        assert [f.stream_id for f in frames] == [5, 5]
+        assert frames[1].data == b'hello'
+
+        assert c.get_response(1).status == 200
+
+        resp = c.get_response(3)
+        assert resp.status == 201
+
+        # The stream is only known by its old ID until it's closed.
+        resp.close()
+        assert not c._retried_streams
+
+    def test_goaway_read_off_the_socket_replays_unprocessed_streams(self):
+        # The GOAWAY arrives while frames are being read, so the streams are
+        # drained by the thread that is already reading.
+        e = Encoder()
+        h = HeadersFrame(1)
+        h.data = e.encode([(':status', 200)])
+        h.flags = set(['END_HEADERS'])
+        d = DataFrame(1)
+        d.data = b'ok'
+        d.flags = set(['END_STREAM'])
+        g = GoAwayFrame(0, last_stream_id=1)
+        sock = DummySocket()
+        sock.buffer = BytesIO(g.serialize() + h.serialize() + d.serialize())
+        new_sock = DummySocket()
+
+        c = HTTP20Connection('www.google.com')
+        c._sock = sock
+        c.connect = lambda: setattr(c, '_sock', c._sock or new_sock)
+        c.request('GET', '/')
+        c.request('GET', '/')
+
+        c._recv_cb()
+
+        assert c._sock is new_sock
+        assert not c._reading
+        resp = c.get_response(1)
+        assert resp.status == 200
+        assert resp.read() == b'ok'
+
+    def test_goaway_refusals_arent_raised_to_other_callers(self):
+        c = HTTP20Connection('www.google.com')
+        c._sock = DummySocket()
+        c.connect = lambda: None
+        c.request('POST', '/', body=BytesIO(b'hello'))
+
+        # Only the refused stream's reader hears about it.
+        c.receive_frame(GoAwayFrame(0, last_stream_id=0))
+
+        with pytest.raises(StreamResetError) as e:
+            c.get_response(1)
+
+        assert e.value.error_code == 7
+
+    def test_goaway_refusals_are_raised_to_the_refused_stream(self):
+        c = HTTP20Connection('www.google.com')
+        c._sock = DummySocket()
+        c.connect = lambda: None
+        s = c.streams[c.request('POST', '/', body=BytesIO(b'hello'))]
+
+        c.receive_frame(GoAwayFrame(0, last_stream_id=0))
+
+        with pytest.raises(StreamResetError) as e:
+            s.getheaders()
+
+        assert e.value.error_code == 7
+
+        # Once closed, the stream is forgotten.
+        s.close()
+        assert 1 not in c.streams
+
+
 class TestServerPush(object):
     def setup_method(self, method):
         self.frames = []
@@ -976,6 +1621,69 @@ class TestHyperStream(object):
         assert isinstance(out_frames[0], WindowUpdateFrame)
         assert out_frames[0].window_increment == len(b'hi there!')
 
+    def test_full_stream_buffers_withhold_window_updates(self):
+        out_frames = []
+
+        def send_cb(frame, tolerate_peer_gone=False):
+            out_frames.append(frame)
+
+        s = Stream(1, send_cb, None, None, None, None, FlowControlManager(800))
+        s._max_buffer_size = 10
+        s.state = STATE_HALF_CLOSED_LOCAL
+
+        f = DataFrame(1)
+        f.data = b'hi there!'
+        s.receive_frame(f)
+
+        f = DataFrame(1)
+        f.data = b'hi there again!'
+        s.receive_frame(f)
+
+        # The second frame filled the buffer, so its window is held back.
+        assert len(out_frames) == 1
+        assert out_frames[0].window_increment == len(b'hi there!')
+
+        # Reading some, but not all, of the data doesn't release it.
+        assert s._read_one_frame() == b'hi there!'
+        assert len(out_frames) == 1
+
+        # Emptying the buffer does.
+        assert s._read_one_frame() == b'hi there again!'
+        assert len(out_frames) == 2
+        assert isinstance(out_frames[1], WindowUpdateFrame)
+        assert out_frames[1].window_increment == len(b'hi there again!')
+
+    def test_waiting_for_data_releases_withheld_window(self):
+        out_frames = []
+        in_frames = []
+
+        def send_cb(frame, tolerate_peer_gone=False):
+            out_frames.append(frame)
+
+        def recv_cb(s):
+            def inner():
+                s.receive_frame(in_frames.pop(0))
+            return inner
+
+        s = Stream(1, send_cb, None, None, None, None, FlowControlManager(800))
+        s._recv_cb = recv_cb(s)
+        s._max_buffer_size = 10
+        s.state = STATE_HALF_CLOSED_LOCAL
+
+        f = DataFrame(1)
+        f.data = b'hi there again!'
+        s.receive_frame(f)
+        assert not out_frames
+
+        f = DataFrame(1)
+        f.data = b'bye!'
+        f.flags.add('END_STREAM')
+        in_frames.append(f)
+
+        assert s._read() == b'hi there again!bye!'
+        assert len(out_frames) == 1
+        assert out_frames[0].window_increment == len(b'hi there again!')
+
     def test_partial_reads_from_streams(self):
         out_frames = []
         in_frames = []
@@ -1002,17 +1710,76 @@ class TestHyperStream(object):
         f.flags.add('END_STREAM')
         in_frames.append(f)
 
-        # We'll get the entire first frame.
+        # We'll get exactly what we asked for, from the first frame.
         data = s._read(4)
-        assert data == b'hi there!'
+        assert data == b'hi t'
         assert len(out_frames) == 1
 
-        # Now we'll get the entire of the second frame.
-        data = s._read(4)
-        assert data == b'hi there again!'
+        # Reads can span frames.
+        data = s._read(10)
+        assert data == b'here!hi th'
         assert len(out_frames) == 1
         assert s.state == STATE_CLOSED
 
+        # The rest of the second frame is still there.
+        data = s._read(40)
+        assert data == b'ere again!'
+
+    def test_received_data_is_not_copied_until_read(self):
+        f = DataFrame(1)
+        f.data = b'hi there!'
+        f.flags.add('END_STREAM')
+        data = memoryview(f.serialize())
+
+        f, length = Frame.parse_frame_header(data[:9])
+        f.parse_body(data[9:9 + length])
+        assert isinstance(f.data, memoryview)
+
+        s = Stream(1, None, None, None, None, None, FlowControlManager(65535))
+        s.state = STATE_HALF_CLOSED_LOCAL
+        s.receive_frame(f)
+
+        first = s._read(2)
+        assert first == b'hi'
+        assert isinstance(first, bytes)
+        assert s._read() == b' there!'
+
+    def test_readinto_from_streams(self):
+        in_frames = []
+
+        def recv_cb(s):
+            def inner():
+                s.receive_frame(in_frames.pop(0))
+            return inner
+
+        s = Stream(1, None, None, None, None, None, FlowControlManager(65535))
+        s._recv_cb = recv_cb(s)
+        s.state = STATE_HALF_CLOSED_LOCAL
+
+        f = DataFrame(1)
+        f.data = b'hi there!'
+        in_frames.append(f)
+
+        f = DataFrame(1)
+        f.data = b'hi there again!'
+        f.flags.add('END_STREAM')
+        in_frames.append(f)
+
+        b = bytearray(4)
+        assert s._readinto(b) == 4
+        assert b == bytearray(b'hi t')
+
+        # A read doesn't wait for more data if it has some.
+        b = bytearray(10)
+        assert s._readinto(b) == 5
+        assert b[:5] == bytearray(b'here!')
+
+        b = bytearray(20)
+        assert s._readinto(b) == 15
+        assert b[:15] == bytearray(b'hi there again!')
+
+        assert s._readinto(b) == 0
+
     def test_can_receive_continuation_frame_after_end_stream(self):
         s = Stream(1, None, None, None, None, None, FlowControlManager(65535))
         f = HeadersFrame(1)
@@ -1130,7 +1897,7 @@ class TestHyperStream(object):
 
         # Ask for the trailers. This should also read the data frames.
         assert s.gettrailers() == HTTPHeaderMap(trailers)
-        assert s.data == [b'testdata']
+        assert list(s.data) == [b'testdata']
 
     def test_can_read_single_frames_from_streams(self):
         out_frames = []
@@ -1179,6 +1946,69 @@ class TestResponse(object):
         assert resp.status == 200
         assert not resp.headers
 
+    def test_response_headers_are_built_lazily(self):
+        headers = LazyHTTPHeaderMap([
+            (b':status', b'200'),
+            (b'content-encoding', b'gzip'),
+            (b'server', b'hyper'),
+        ])
+        resp = HTTP20Response(headers, DummyStream(b''))
+
+        assert resp.status == 200
+        assert resp._decompressobj is not None
+        assert '_items' not in headers.__dict__
+
+        assert list(resp.headers.items()) == [
+            (b'content-encoding', b'gzip'),
+            (b'server', b'hyper'),
+        ]
+
+    def test_iter_content_gathers_data_into_pieces(self):
+        class TrickleStream(DummyStream):
+            def _readinto(self, b):
+                return super(TrickleStream, self)._readinto(b[:3])
+
+        body = b'abcdefghijklmnopqrstuvwxyz'
+
+        headers = HTTPHeaderMap([(':status', '200')])
+        resp = HTTP20Response(headers, DummyStream(body))
+        assert list(resp.iter_content(10)) == [
+            b'abcdefghij', b'klmnopqrst', b'uvwxyz'
+        ]
+
+        headers = HTTPHeaderMap([(':status', '200')])
+        resp = HTTP20Response(headers, TrickleStream(body))
+        pieces = []
+        for piece in resp.iter_content(10, reuse_buffer=True):
+            assert isinstance(piece, memoryview)
+            pieces.append(piece.tobytes())
+
+        assert pieces == [b'abcdefghij', b'klmnopqrst', b'uvwxyz']
+
+    def test_iterating_over_compressed_response(self):
+        c = zlib_compressobj(wbits=31)
+        body = os.urandom(100000)
+        data = c.compress(body) + c.flush()
+
+        def response():
+            headers = HTTPHeaderMap(
+                [(':status', '200'), ('content-encoding', 'gzip')]
+            )
+            return HTTP20Response(headers, DummyStream(data))
+
+        pieces = list(response())
+        assert [len(p) for p in pieces] == [65536, 100000 - 65536]
+        assert b''.join(pieces) == body
+
+        pieces = response().iter_content(1000, decode_content=False)
+        assert b''.join(pieces) == data
+
+        resp = response()
+        pieces = resp.iter_content(
+            1000, decode_content=False, reuse_buffer=True
+        )
+        assert b''.join(p.tobytes() for p in pieces) == data
+
     def test_response_transparently_decrypts_gzip(self):
         headers = HTTPHeaderMap([(':status', '200'), ('content-encoding', 'gzip')])
         c = zlib_compressobj(wbits=24)
@@ -1234,12 +2064,138 @@ class TestResponse(object):
 
         assert resp.read() == b''
 
-    def test_read_buffered(self):
+    def test_readinto(self):
         headers = HTTPHeaderMap([(':status', '200')])
         stream = DummyStream(b'1234567890')
+        resp = HTTP20Response(headers, stream)
+
+        b = bytearray(4)
+        assert resp.readinto(b) == 4
+        assert b == bytearray(b'1234')
+
+    def test_bounded_reads_of_compressed_body(self):
+        headers = HTTPHeaderMap(
+            [(':status', '200'), ('content-encoding', 'gzip')]
+        )
+        c = zlib_compressobj(wbits=31)
+        body = c.compress(b'a' * 100000)
+        body += c.flush()
+        stream = DummyStream(body)
+        resp = HTTP20Response(headers, stream)
+
+        data = resp.read(1000)
+        assert data == b'a' * 1000
+        assert resp._unconsumed_tail
+
+        assert resp.read() == b'a' * 99000
+
+    def test_registered_decoders_are_used(self):
+        class UpperDecoder(BufferedDecoder):
+            def _decompress(self, data):
+                return data.upper()
+
+        register_decoder('x-upper', UpperDecoder)
+        try:
+            headers = HTTPHeaderMap(
+                [(':status', '200'), ('content-encoding', 'x-upper')]
+            )
+            stream = DummyStream(b'hello world')
+            resp = HTTP20Response(headers, stream)
+
+            assert resp.read(5) == b'HELLO'
+            assert resp.read() == b' WORLD'
+        finally:
+            del decoder._decoders[b'x-upper']
+
+    def test_buffered_decoders_leave_input_they_dont_need(self):
+        class ExpandingDecoder(BufferedDecoder):
+            def _decompress(self, data):
+                return data * 100
+
+        d = ExpandingDecoder()
+
+        assert d.decompress(b'a' * 10000, 10) == b'a' * 10
+        assert len(d.unconsumed_tail) == 10000 - d.input_size
+        assert d._pending_size == d.input_size * 100 - 10
+
+        assert d.decompress(d.unconsumed_tail, 30000) == b'a' * 30000
+        assert len(d.unconsumed_tail) == 10000 - 2 * d.input_size
+
+    def test_brotli_decoder_limits_its_output(self, monkeypatch):
+        class FakeDecompressor(object):
+            def __init__(self):
+                self.output = b''
+
+            def can_accept_more_data(self):
+                return not self.output
+
+            def process(self, data, output_buffer_limit=0):
+                self.output += data * 100
+                limit = output_buffer_limit or len(self.output)
+                data = self.output[:limit]
+                self.output = self.output[limit:]
+                return data
+
+        class FakeBrotli(object):
+            Decompressor = FakeDecompressor
+
+        monkeypatch.setattr(decoder, 'brotli', FakeBrotli)
+        d = decoder.BrotliDecoder()
+
+        assert d.decompress(b'a', 10) == b'a' * 10
+        assert d.unconsumed_tail == b''
+
+        # More input has to wait until the earlier output is handed over.
+        assert d.decompress(b'b', 10) == b'a' * 10
+        assert d.unconsumed_tail == b'b'
+
+        assert d.flush() == b'a' * 80
+
+    def test_readinto_compressed(self):
+        headers = HTTPHeaderMap(
+            [(':status', '200'), ('content-encoding', 'deflate')]
+        )
+        c = zlib_compressobj(wbits=-zlib.MAX_WBITS)
+        body = c.compress(b'this is test data')
+        body += c.flush()
+        stream = DummyStream(body)
+        resp = HTTP20Response(headers, stream)
+
+        received = b''
+        b = bytearray(5)
+        while True:
+            read = resp.readinto(b)
+            if not read:
+                break
+            received += bytes(b[:read])
+
+        assert received == b'this is test data'
+
+    def test_readline(self):
+        headers = HTTPHeaderMap([(':status', '200')])
+        stream = DummyStream(b'line one\nline two')
+        resp = HTTP20Response(headers, stream)
+
+        assert resp.readable()
+        assert resp.readline() == b'line one\n'
+        assert resp.readline() == b'line two'
+        assert resp.readline() == b''
+
+    def test_response_wrapped_in_buffered_reader(self):
+        headers = HTTPHeaderMap([(':status', '200')])
+        stream = DummyStream(b'line one\nline two\n')
+        resp = HTTP20Response(headers, stream)
+
+        with io.BufferedReader(resp) as f:
+            assert list(f) == [b'line one\n', b'line two\n']
+
+        assert resp.closed
+
+    def test_read_buffered(self):
+        headers = HTTPHeaderMap([(':status', '200')])
+        stream = DummyStream(b'1234567890' * 2)
         chunks = [b'12', b'34', b'56', b'78', b'90'] * 2
         resp = HTTP20Response(headers, stream)
-        resp._data_buffer = b'1234567890'
 
         for chunk in chunks:
             assert resp.read(2) == chunk
@@ -1305,6 +2261,145 @@ class TestResponse(object):
         assert received == b'this is test data'
 
 
+class TestHTTP20ConnectionPool(object):
+    def test_pool_reuses_connections(self):
+        p = HTTP20ConnectionPool(maxsize=2)
+        conn1 = p.get_connection('http2bin.org', 443)
+        conn1.putrequest('GET', '/')
+        conn2 = p.get_connection('http2bin.org:443')
+
+        assert conn1 is conn2
+        assert isinstance(conn1, HTTP20Connection)
+
+    def test_pool_separates_origins(self):
+        p = HTTP20ConnectionPool()
+        conn1 = p.get_connection('http2bin.org', 443)
+        conn2 = p.get_connection('http2bin.org', 80)
+
+        assert conn1 is not conn2
+        assert conn1.secure
+        assert not conn2.secure
+
+    def test_pool_respects_max_concurrent_streams(self):
+        p = HTTP20ConnectionPool(maxsize=2)
+        conn1 = p.get_connection('http2bin.org')
+        conn1._settings[SettingsFrame.MAX_CONCURRENT_STREAMS] = 1
+        conn1.putrequest('GET', '/')
+        conn2 = p.get_connection('http2bin.org')
+        conn2._settings[SettingsFrame.MAX_CONCURRENT_STREAMS] = 2
+        conn2.putrequest('GET', '/')
+        conn2.putrequest('GET', '/')
+
+        assert conn1 is not conn2
+
+        # Both are busy now, so the less loaded one is handed out.
+        assert p.get_connection('http2bin.org') is conn1
+
+    def test_pool_picks_least_loaded_connection(self):
+        p = HTTP20ConnectionPool(maxsize=2)
+        conn1 = p.get_connection('http2bin.org')
+        conn1._settings[SettingsFrame.MAX_CONCURRENT_STREAMS] = 1
+        conn1.putrequest('GET', '/')
+        conn2 = p.get_connection('http2bin.org')
+        conn2.putrequest('GET', '/')
+
+        # Finishing the stream on the first connection makes it the best.
+        conn1.streams[1].state = STATE_CLOSED
+        assert p.get_connection('http2bin.org') is conn1
+
+    def test_pool_evicts_connections_after_goaway(self):
+        p = HTTP20ConnectionPool()
+        conn1 = p.get_connection('http2bin.org')
+        conn1._goaway_last_stream_id = 0
+        conn2 = p.get_connection('http2bin.org')
+
+        assert conn1 is not conn2
+
+    def test_pool_closes_evicted_connections_once_drained(self):
+        p = HTTP20ConnectionPool()
+        conn1 = p.get_connection('http2bin.org')
+        conn1._sock = DummySocket()
+        conn1.putrequest('GET', '/')
+        conn1._goaway_last_stream_id = 1
+
+        # The stream is still going, so the connection is left open.
+        assert p.get_connection('http2bin.org') is not conn1
+        assert conn1._sock is not None
+
+        conn1.streams[1].state = STATE_CLOSED
+        p.get_connection('http2bin.org')
+        assert conn1._sock is None
+
+    def test_pool_doesnt_count_pushed_streams(self):
+        p = HTTP20ConnectionPool(maxsize=2)
+        conn1 = p.get_connection('http2bin.org')
+        conn1._settings[SettingsFrame.MAX_CONCURRENT_STREAMS] = 1
+        conn1._new_stream(2, local_closed=True)
+
+        assert p.get_connection('http2bin.org') is conn1
+
+    def test_pool_evicts_idle_connections(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(hyper.http20.pool.time, 'time', lambda: now[0])
+
+        p = HTTP20ConnectionPool(idle_timeout=10)
+        conn1 = p.get_connection('http2bin.org')
+        now[0] += 5
+        assert p.get_connection('http2bin.org') is conn1
+
+        now[0] += 11
+        assert p.get_connection('http2bin.org') is not conn1
+
+    def test_pool_keeps_idle_connections_with_draining_streams(self,
+                                                               monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr(hyper.http20.pool.time, 'time', lambda: now[0])
+
+        p = HTTP20ConnectionPool(idle_timeout=10)
+        conn1 = p.get_connection('http2bin.org')
+        conn1._sock = DummySocket()
+        conn1.connect = lambda: None
+        conn1.request('GET', '/')
+        conn1._goaway_last_stream_id = 1
+
+        # Replacing the connection leaves the stream to drain from the old
+        # one.
+        conn1._rollover()
+        assert not conn1.streams
+
+        now[0] += 11
+        assert p.get_connection('http2bin.org') is conn1
+
+    def test_pool_closes_connections(self):
+        p = HTTP20ConnectionPool()
+        sock = DummySocket()
+        conn = p.get_connection('http2bin.org')
+        conn._sock = sock
+        p.close()
+
+        assert conn._sock is None
+
+    def test_pool_limits_the_number_of_origins(self):
+        p = HTTP20ConnectionPool(max_origins=2)
+        conn1 = p.get_connection('http2bin.org', 443)
+        conn2 = p.get_connection('http2bin.org', 80)
+        assert p.get_connection('http2bin.org', 443) is conn1
+
+        # The origin used least recently makes way for the new one.
+        p.get_connection('google.com', 443)
+        assert p.get_connection('http2bin.org', 443) is conn1
+        assert p.get_connection('http2bin.org', 80) is not conn2
+
+    def test_pool_discards_connections(self):
+        p = HTTP20ConnectionPool()
+        conn = p.get_connection('http2bin.org')
+        conn._sock = DummySocket()
+        p.discard_connection(conn)
+
+        assert conn._sock is None
+        assert p.get_connection('http2bin.org') is not conn
+
+
 class TestHTTP20Adapter(object):
     def test_adapter_reuses_connections(self):
         a = HTTP20Adapter()
@@ -1313,6 +2408,132 @@ class TestHTTP20Adapter(object):
 
         assert conn1 is conn2
 
+    def test_adapter_streams_with_iter_content(self):
+        requests = pytest.importorskip('requests')
+
+        request = requests.Request('GET', 'http://http2bin.org/').prepare()
+        headers = HTTPHeaderMap([(':status', '200')])
+        resp = HTTP20Response(headers, DummyStream(b'a' * 25))
+
+        calls = []
+        iter_content = resp.iter_content
+
+        def record_iter_content(*args):
+            calls.append(args)
+            return iter_content(*args)
+
+        resp.iter_content = record_iter_content
+        r = HTTP20Adapter().build_response(request, resp)
+
+        assert list(r.iter_content(10)) == [b'a' * 10, b'a' * 10, b'a' * 5]
+        assert calls == [(10, True)]
+
+    def test_adapter_gets_responses_by_stream_id(self):
+        requests = pytest.importorskip('requests')
+
+        class FakeConnection(object):
+            def request(self, *args, **kwargs):
+                return 7
+
+            def get_response(self, stream_id=None):
+                self.stream_id = stream_id
+                headers = HTTPHeaderMap([(':status', '200')])
+                return HTTP20Response(headers, DummyStream(b'hi'))
+
+        conn = FakeConnection()
+        a = HTTP20Adapter()
+        a.get_connection = lambda *args, **kwargs: conn
+
+        request = requests.Request('GET', 'http://http2bin.org/').prepare()
+        r = a.send(request)
+
+        assert conn.stream_id == 7
+        assert r.content == b'hi'
+
+    def test_adapter_takes_pool_and_retry_arguments(self):
+        a = HTTP20Adapter(pool_connections=2, pool_maxsize=3, max_retries=4)
+
+        assert a.connections.max_origins == 2
+        assert a.connections.maxsize == 3
+        assert a.max_retries.total == 4
+
+    def test_adapter_passes_timeouts_to_connections(self):
+        requests = pytest.importorskip('requests')
+        conn = FailingConnection([socket.timeout()])
+        conn._sock = DummySocket()
+        a = HTTP20Adapter()
+        a.get_connection = lambda *args, **kwargs: conn
+
+        request = requests.Request('GET', 'http://http2bin.org/').prepare()
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            a.send(request, timeout=(1, 2))
+
+        assert conn.timeouts == [(1, 2)]
+
+    def test_adapter_retries_refused_streams(self):
+        requests = pytest.importorskip('requests')
+        conn = FailingConnection([StreamResetError('Refused', 7)])
+        a = HTTP20Adapter(max_retries=1)
+        a.get_connection = lambda *args, **kwargs: conn
+
+        request = requests.Request('POST', 'http://http2bin.org/', data=b'hi')
+        r = a.send(request.prepare())
+
+        assert r.content == b'hi'
+        assert len(conn.timeouts) == 2
+        assert not conn.closed
+
+    def test_adapter_retries_idempotent_requests_on_reset(self):
+        requests = pytest.importorskip('requests')
+        conns = [
+            FailingConnection([ConnectionResetError()]),
+            FailingConnection([]),
+        ]
+        a = HTTP20Adapter(max_retries=1)
+        a.get_connection = lambda *args, **kwargs: conns[0]
+        a.connections.discard_connection = lambda conn: conns.pop(0).close()
+
+        request = requests.Request('GET', 'http://http2bin.org/').prepare()
+        r = a.send(request)
+
+        assert r.content == b'hi'
+        assert len(conns) == 1
+
+    def test_adapter_doesnt_retry_other_requests_on_reset(self):
+        requests = pytest.importorskip('requests')
+        conn = FailingConnection([ConnectionResetError()])
+        a = HTTP20Adapter(max_retries=1)
+        a.get_connection = lambda *args, **kwargs: conn
+
+        request = requests.Request('POST', 'http://http2bin.org/', data=b'hi')
+        with pytest.raises(requests.exceptions.ConnectionError):
+            a.send(request.prepare())
+
+        assert len(conn.timeouts) == 1
+
+    def test_adapter_gives_up_after_max_retries(self):
+        requests = pytest.importorskip('requests')
+        conn = FailingConnection([StreamResetError('Refused', 7)] * 3)
+        a = HTTP20Adapter(max_retries=2)
+        a.get_connection = lambda *args, **kwargs: conn
+
+        request = requests.Request('GET', 'http://http2bin.org/').prepare()
+        with pytest.raises(requests.exceptions.ConnectionError):
+            a.send(request)
+
+        assert len(conn.timeouts) == 3
+
+    def test_adapter_uses_separate_pools_for_tls_settings(self):
+        a = HTTP20Adapter()
+        conn1 = a.get_connection('http2bin.org', 443, 'https')
+        conn2 = a.get_connection('http2bin.org', 443, 'https', verify=False)
+
+        assert conn1 is not conn2
+        assert conn2._conn.ssl_context.verify_mode == ssl.CERT_NONE
+        assert a.get_connection(
+            'http2bin.org', 443, 'https', verify=False
+        ) is conn2
+
 
 class TestUtilities(object):
     def test_combining_repeated_headers(self):
@@ -1569,6 +2790,32 @@ class FixedDecoder(object):
         return self.result
 
 
+class FailingConnection(object):
+    """
+    A connection for the Requests adapter that fails each request with the
+    next of the given errors, then succeeds.
+    """
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.timeouts = []
+        self.closed = False
+
+    def request(self, method, url, body=None, headers={}, timeout=None):
+        self.timeouts.append(timeout)
+
+        if self.errors:
+            raise self.errors.pop(0)
+
+        return 1
+
+    def get_response(self, stream_id=None):
+        headers = HTTPHeaderMap([(':status', '200')])
+        return HTTP20Response(headers, DummyStream(b'hi'))
+
+    def close(self):
+        self.closed = True
+
+
 class DummySocket(object):
     def __init__(self):
         self.queue = []
@@ -1581,6 +2828,17 @@ class DummySocket(object):
     def recv(self, l):
         return memoryview(self.buffer.read(l))
 
+    def recv_into(self, buffer):
+        data = self.recv(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def wait_for_data(self, timeout=None):
+        return True
+
+    def gettimeout(self):
+        return None
+
     def close(self):
         pass
 
@@ -1619,6 +2877,11 @@ class DummyStream(object):
 
         return d
 
+    def _readinto(self, b):
+        d = self._read(len(b))
+        b[:len(d)] = d
+        return len(d)
+
     def _read_one_frame(self):
         try:
             return self.data_frames.pop(0)
@@ -7,6 +7,7 @@ This file defines integration-type tests for hyper. These are still not fully
 hitting the network, so that's alright.
 """
 import requests
+import socket
 import threading
 import hyper
 import hyper.http11.connection
@@ -554,6 +555,69 @@ class TestHyperIntegration(SocketLevelTest):
         self.tear_down()
 
 
+    def test_concurrent_requests_from_many_threads(self):
+        self.set_up(secure=False)
+
+        def socket_handler(listener):
+            sock = listener.accept()[0]
+
+            receive_preamble(sock)
+
+            # Only answer once every request has arrived, and answer them in
+            # reverse order.
+            stream_ids = []
+            data = b''
+            while len(stream_ids) < 5:
+                data += sock.recv(65535)
+
+                while len(data) >= 9:
+                    f, length = Frame.parse_frame_header(data[:9])
+                    if len(data) < 9 + length:
+                        break
+
+                    if isinstance(f, HeadersFrame):
+                        stream_ids.append(f.stream_id)
+
+                    data = data[9 + length:]
+
+            e = self.get_encoder()
+            for stream_id in reversed(stream_ids):
+                h = HeadersFrame(stream_id)
+                h.data = e.encode({':status': 200})
+                h.flags.add('END_HEADERS')
+                sock.send(h.serialize())
+
+                d = DataFrame(stream_id)
+                d.data = str(stream_id).encode('ascii')
+                d.flags.add('END_STREAM')
+                sock.send(d.serialize())
+
+            sock.close()
+
+        self._start_server(socket_handler)
+        c = self.get_connection()
+        c.connect()
+        results = []
+
+        def make_request():
+            stream_id = c.request('GET', '/')
+            r = c.get_response(stream_id)
+            results.append((stream_id, r.read()))
+
+        threads = [threading.Thread(target=make_request) for _ in range(5)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+
+        for t in threads:
+            t.join(5)
+
+        assert sorted(results) == [
+            (i, str(i).encode('ascii')) for i in (1, 3, 5, 7, 9)
+        ]
+
+        self.tear_down()
+
     def test_resetting_stream_with_frames_in_flight(self):
         """
         Hyper emits only one RST_STREAM frame, despite the other frames in
@@ -706,6 +770,79 @@ class TestRequestsAdapter(SocketLevelTest):
 
         self.tear_down()
 
+    def test_adapter_shares_http11_origins_between_threads(self):
+        self.set_up(secure=False)
+
+        done = threading.Event()
+
+        def serve(sock):
+            # Answer each request with its path, one at a time.
+            data = b''
+            while True:
+                while b'\r\n\r\n' not in data:
+                    chunk = sock.recv(65535)
+                    if not chunk:
+                        sock.close()
+                        return
+                    data += chunk
+
+                head, data = data.split(b'\r\n\r\n', 1)
+                path = head.split(b' ')[1]
+                sock.sendall(
+                    b'HTTP/1.1 200 OK\r\n' +
+                    ('Content-Length: %d\r\n\r\n' % len(path)).encode() +
+                    path
+                )
+
+        def socket_handler(listener):
+            listener.settimeout(0.1)
+            while not done.is_set():
+                try:
+                    sock = listener.accept()[0]
+                except socket.timeout:
+                    continue
+
+                t = threading.Thread(target=serve, args=(sock,))
+                t.daemon = True
+                t.start()
+
+        self._start_server(socket_handler)
+
+        # Fewer connections than threads, so some have to wait their turn.
+        s = requests.Session()
+        adapter = HTTP20Adapter(pool_maxsize=2)
+        s.mount('http://%s' % self.host, adapter)
+        results = []
+        errors = []
+
+        def make_requests(n):
+            for i in range(5):
+                path = '/%d/%d' % (n, i)
+                try:
+                    r = s.get('http://%s:%s%s' % (self.host, self.port, path))
+                    results.append((path.encode(), r.content))
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [
+            threading.Thread(target=make_requests, args=(n,)) for n in range(8)
+        ]
+        for t in threads:
+            t.daemon = True
+            t.start()
+
+        for t in threads:
+            t.join(10)
+
+        done.set()
+        adapter.close()
+
+        assert not errors
+        assert len(results) == 40
+        assert all(path == body for path, body in results)
+
+        self.tear_down()
+
     def test_adapter_sending_values(self, monkeypatch):
         self.set_up()
 
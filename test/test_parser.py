@@ -84,3 +84,82 @@ class TestHTTP11Parser(object):
 
         with pytest.raises(ParseError):
             c.parse_response(m)
+
+    def test_incremental_parsing(self):
+        data = bytearray(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Server: h2o\r\n"
+            b"content-length: 2\r\n"
+            b"\r\n"
+            b"hi"
+        )
+        c = Parser()
+
+        # Feed the parser the response a few bytes at a time, as though it
+        # were arriving slowly.
+        for end in range(1, len(data) - 4):
+            assert c.parse_response(memoryview(data)[:end]) is None
+            assert data.rfind(b'\n', 0, end) + 1 == c._position
+
+        r = c.parse_response(memoryview(data))
+
+        assert r.status == 200
+        assert [(n.tobytes(), v.tobytes()) for n, v in r.headers] == [
+            (b'Server', b'h2o'), (b'content-length', b'2')
+        ]
+        assert r.consumed == len(data) - 2
+
+        # The parser is ready for the next response.
+        assert c._position == 0
+        assert c._headers == []
+
+    def test_headers_refer_to_buffer(self):
+        data = bytearray(b"HTTP/1.1 200 OK\r\nServer:  h2o \r\n\r\n")
+        r = Parser().parse_response(memoryview(data))
+
+        data[26:29] = b'abc'
+        assert r.headers[0][1].tobytes() == b'abc'
+
+    def test_missing_reason_phrase(self):
+        data = b"HTTP/1.1 204\r\n\r\n"
+        r = Parser().parse_response(memoryview(data))
+
+        assert r.status == 204
+        assert r.msg.tobytes() == b''
+        assert r.headers == []
+
+    def test_shorter_buffer_restarts_parsing(self):
+        c = Parser()
+        assert c.parse_response(memoryview(b"HTTP/1.1 200 OK\r\nA: b")) is None
+
+        r = c.parse_response(memoryview(b"HTTP/1.1 404\r\n\r\n"))
+        assert r.status == 404
+
+    def test_invalid_header_line(self):
+        data = b"HTTP/1.1 200 OK\r\nNo colon here\r\n\r\n"
+        c = Parser()
+
+        with pytest.raises(ParseError):
+            c.parse_response(memoryview(data))
+
+        assert c._position == 0
+
+    def test_too_many_headers(self):
+        data = b"HTTP/1.1 200 OK\r\n" + b"A: b\r\n" * 3 + b"\r\n"
+
+        r = Parser(max_headers=3).parse_response(memoryview(data))
+        assert len(r.headers) == 3
+
+        with pytest.raises(ParseError):
+            Parser(max_headers=2).parse_response(memoryview(data))
+
+    def test_header_block_too_large(self):
+        data = b"HTTP/1.1 200 OK\r\nA: " + b"b" * 100
+        c = Parser(max_header_size=100)
+
+        with pytest.raises(ParseError):
+            c.parse_response(memoryview(data))
+
+        complete = b"HTTP/1.1 200 OK\r\nA: " + b"b" * 100 + b"\r\n\r\n"
+        with pytest.raises(ParseError):
+            c.parse_response(memoryview(complete))
@@ -242,6 +242,42 @@ class TestBufferedSocket(object):
         with pytest.raises(ConnectionResetError):
             b.fill()
 
+    def test_recv_into_drains_buffer_first(self, monkeypatch):
+        monkeypatch.setattr(
+            hyper.common.bufsocket.select, 'select', dummy_select
+        )
+        s = DummySocket()
+        b = BufferedSocket(s)
+        s.inbound_packets = [b'abcdef', b'x' * 2000]
+
+        assert b.recv(2).tobytes() == b'ab'
+
+        buffer = bytearray(5000)
+        assert b.recv_into(buffer) == 4
+        assert buffer[:4] == b'cdef'
+
+        # With nothing buffered, large reads go straight into the buffer
+        # provided.
+        assert b.recv_into(buffer) == 2000
+        assert buffer[:2000] == b'x' * 2000
+        assert b._bytes_in_buffer == 0
+
+    def test_small_recv_into_goes_through_buffer(self, monkeypatch):
+        monkeypatch.setattr(
+            hyper.common.bufsocket.select, 'select', dummy_select
+        )
+        s = DummySocket()
+        b = BufferedSocket(s)
+        s.inbound_packets = [b'abcdef']
+
+        buffer = bytearray(4)
+        assert b.recv_into(buffer) == 4
+        assert buffer == b'abcd'
+        assert b.buffer.tobytes() == b'ef'
+
+        assert b.recv_into(buffer) == 2
+        assert b.recv_into(buffer) == 0
+
     def test_advancing_sockets(self):
         s = DummySocket()
         b = BufferedSocket(s)
@@ -255,6 +291,23 @@ class TestBufferedSocket(object):
 
         assert b.buffer.tobytes() == b'de'
 
+    def test_waiting_for_data_sees_pending_tls_data(self, monkeypatch):
+        def no_data_select(a, b, c, d):
+            return [], [], []
+
+        monkeypatch.setattr(
+            hyper.common.bufsocket.select, 'select', no_data_select
+        )
+        s = DummySocket()
+        b = BufferedSocket(s)
+
+        assert not b.wait_for_data(1)
+        assert not b.can_read
+
+        s.pending = lambda: 5
+        assert b.wait_for_data(1)
+        assert b.can_read
+
 
 class DummySocket(object):
     def __init__(self):
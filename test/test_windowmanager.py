@@ -2,7 +2,9 @@
 """
 Tests the hyper window manager.
 """
-from hyper.http20.window import BaseFlowControlManager, FlowControlManager
+from hyper.http20.window import (
+    BaseFlowControlManager, FlowControlManager, BDPFlowControlManager
+)
 import pytest
 
 class TestBaseFCM(object):
@@ -85,3 +87,61 @@ class TestFCM(object):
 
         assert b._blocked() == 500
         assert b.window_size == 1500
+
+
+class TestBDPFCM(object):
+    """
+    Tests the flow control manager that grows the window to fit the
+    bandwidth-delay product.
+    """
+    def test_bdp_fcm_refills_when_window_is_half_used(self):
+        b = BDPFlowControlManager(65535)
+
+        assert b._handle_frame(32000) == 0
+        assert b._handle_frame(1000) == 33000
+        assert b.window_size == 65535
+
+    def test_bdp_fcm_doesnt_grow_without_rtt(self):
+        b = BDPFlowControlManager(65535)
+
+        for _ in range(5):
+            b._handle_frame(40000)
+
+        assert b.target_window_size == 65535
+        assert b.window_size == 65535
+
+    def test_bdp_fcm_grows_when_refilled_within_a_round_trip(self):
+        b = BDPFlowControlManager(65535)
+        b.rtt = 60
+
+        assert b._handle_frame(40000) == 40000
+        assert b._handle_frame(40000) == 2 * 65535 - 25535
+        assert b.target_window_size == 2 * 65535
+        assert b.window_size == 2 * 65535
+
+    def test_bdp_fcm_doesnt_grow_when_refills_are_slow(self):
+        b = BDPFlowControlManager(65535)
+        b.rtt = 0.001
+
+        b._handle_frame(40000)
+        b._last_update -= 1
+        b._handle_frame(40000)
+
+        assert b.target_window_size == 65535
+
+    def test_bdp_fcm_growth_is_capped(self):
+        b = BDPFlowControlManager(65535)
+        b.rtt = 60
+        b.max_window_size = 100000
+
+        for _ in range(5):
+            b._handle_frame(b.window_size)
+
+        assert b.target_window_size == 100000
+
+    def test_bdp_fcm_emits_difference_when_blocked(self):
+        b = BDPFlowControlManager(1500)
+        b.window_size = 1000
+
+        assert b._blocked() == 500
+        assert b.window_size == 1500